@@ -2,10 +2,11 @@
 Airline Booking Monolithic Application
 A traditional web application combining all booking services
 """
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, Response, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
 import sys
 import os
+import threading
 
 # Add current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -14,8 +15,13 @@ from services.catalog import CatalogService
 from services.booking import BookingService
 from services.payment import PaymentService
 from services.loyalty import LoyaltyService
+from services.outbox import outbox_worker
 from services.auth import AuthService, login_required, admin_required, owner_or_admin_required, booking_owner_or_admin_required
+from services.passwords import HasherBusyError
+from services import metrics
+from data.base import SAMPLE_FLIGHTS
 from data.storage import storage
+from config import Config
 
 # Configure Flask with static file serving
 app = Flask(__name__, 
@@ -26,6 +32,26 @@ app = Flask(__name__,
 CORS(app)
 
 
+# Request tracing
+@app.before_request
+def start_request_trace():
+    """Collect step timings and DynamoDB usage for this request"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.start_trace(route, request.headers.get('X-Request-Id'))
+
+
+@app.after_request
+def finish_request_trace(response):
+    """Record the request in the metrics and expose its timings to the client"""
+    trace = metrics.finish_trace()
+    if trace is not None:
+        metrics.REQUEST_DURATION.observe(trace.elapsed(), request.method, trace.route,
+                                         str(response.status_code))
+        response.headers['X-Request-Id'] = trace.trace_id
+        response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+
 # Error handler
 @app.errorhandler(Exception)
 def handle_error(error):
@@ -36,6 +62,32 @@ def handle_error(error):
     }), 400 if isinstance(error, ValueError) else 500
 
 
+@app.errorhandler(HasherBusyError)
+def handle_hasher_busy(error):
+    """Shed login and registration bursts instead of queueing them behind bookings"""
+    return jsonify({
+        'error': str(error),
+        'type': type(error).__name__
+    }), 503, {'Retry-After': '1'}
+
+
+def page_args():
+    """
+    Read limit and cursor query parameters for paginated listings
+    
+    Raises:
+        ValueError: If limit is not a positive integer
+    """
+    try:
+        limit = int(request.args.get('limit', Config.DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be a positive integer")
+    if limit <= 0:
+        raise ValueError("limit must be a positive integer")
+    
+    return min(limit, Config.MAX_PAGE_SIZE), request.args.get('cursor') or None
+
+
 # Catalog endpoints
 @app.route('/flights/search', methods=['GET'])
 def search_flights():
@@ -54,6 +106,48 @@ def search_flights():
     return jsonify({'flights': flights})
 
 
+@app.route('/flights/search/connections', methods=['GET'])
+def search_connections():
+    """
+    Search direct flights and one-stop connections, optionally with return legs
+    Query params: departureCode, arrivalCode, departureDate, returnDate (optional),
+    minLayover and maxLayover in minutes (optional)
+    """
+    departure_code = request.args.get('departureCode')
+    arrival_code = request.args.get('arrivalCode')
+    departure_date = request.args.get('departureDate')
+    
+    if not all([departure_code, arrival_code, departure_date]):
+        return jsonify({'error': 'Missing required parameters'}), 400
+    
+    try:
+        min_layover, max_layover = (int(request.args[name]) if request.args.get(name) else None
+                                    for name in ('minLayover', 'maxLayover'))
+    except ValueError:
+        raise ValueError("minLayover and maxLayover must be whole minutes")
+    
+    result = CatalogService.search_connections(
+        departure_code, arrival_code, departure_date,
+        request.args.get('returnDate'), min_layover, max_layover
+    )
+    return jsonify(result)
+
+
+@app.route('/flights/batch', methods=['POST'])
+def get_flights_batch():
+    """
+    Get several flights by ID in one request
+    Request body: { "ids": ["FL001", "FL002", ...] } (at most 100)
+    """
+    data = request.get_json()
+    
+    if not data or 'ids' not in data:
+        return jsonify({'error': 'ids is required'}), 400
+    
+    result = CatalogService.get_flights(data['ids'])
+    return jsonify(result)
+
+
 @app.route('/flights/<flight_id>', methods=['GET'])
 def get_flight(flight_id):
     """Get flight details by ID"""
@@ -70,8 +164,17 @@ def reserve_flight_seat(flight_id):
 
 @app.route('/flights/<flight_id>/release', methods=['POST'])
 def release_flight_seat(flight_id):
-    """Release a seat on a flight"""
-    result = CatalogService.release_flight_seat(flight_id)
+    """
+    Release a seat on a flight
+    Optional request body: { "count": 3 } to release several seats at once
+    """
+    data = request.get_json(silent=True) or {}
+    count = data.get('count', 1)
+    
+    if count == 1:
+        result = CatalogService.release_flight_seat(flight_id)
+    else:
+        result = CatalogService.release_flight_seats(flight_id, count)
     return jsonify(result)
 
 
@@ -99,53 +202,32 @@ def create_booking():
     # Variables to track rollback state
     booking_id = None
     payment_result = None
-    flight_reserved = False
     
     try:
-        # Step 1: Reserve Flight Seat
-        # This is an atomic DynamoDB operation (decrement seat capacity)
+        # Step 1: Reserve Flight Seat and Booking
+        # One DynamoDB transaction decrements seat capacity and creates the
+        # booking with UNCONFIRMED status, so nothing needs undoing on failure
         try:
-            CatalogService.reserve_flight_seat(data['outboundFlightId'])
-            flight_reserved = True
+            with metrics.span('reserve_seat'):
+                booking_id = BookingService.reserve_flight_and_booking(data)
         except ValueError as e:
-            # No seat available or flight doesn't exist
-            # No rollback needed - nothing was changed
             return jsonify({
                 'error': f'Flight reservation failed: {str(e)}',
                 'step': 'Reserve Flight'
             }), 400
         
-        # Step 2: Reserve Booking
-        # Create a booking record with UNCONFIRMED status
-        try:
-            booking_id = BookingService.reserve_booking(data)
-        except ValueError as e:
-            # Rollback: Release the flight seat
-            try:
-                CatalogService.release_flight_seat(data['outboundFlightId'])
-            except Exception as rollback_error:
-                print(f"Error during flight seat release rollback: {rollback_error}")
-            
-            return jsonify({
-                'error': f'Booking reservation failed: {str(e)}',
-                'step': 'Reserve Booking'
-            }), 400
-        
-        # Step 3: Collect Payment
+        # Step 2: Collect Payment
         # Charge the customer's payment method
         try:
-            payment_result = PaymentService.collect_payment(data['chargeId'])
+            with metrics.span('collect_payment'):
+                payment_result = PaymentService.collect_payment(data['chargeId'], booking_id)
         except ValueError as e:
-            # Rollback: Cancel booking and release flight seat
-            try:
-                BookingService.cancel_booking(booking_id)
-            except Exception as rollback_error:
-                print(f"Error during booking cancellation rollback: {rollback_error}")
-            
+            # Rollback: Cancel booking and release flight seat (one transaction)
             try:
-                CatalogService.release_flight_seat(data['outboundFlightId'])
+                with metrics.span('rollback_booking'):
+                    BookingService.cancel_and_release(booking_id, data['outboundFlightId'])
             except Exception as rollback_error:
-                print(f"Error during flight seat release rollback: {rollback_error}")
+                metrics.log(f"Error during booking cancellation rollback: {rollback_error}")
             
             return jsonify({
                 'error': f'Payment failed: {str(e)}',
@@ -153,32 +235,34 @@ def create_booking():
                 'bookingId': booking_id
             }), 400
         
-        # Step 4: Confirm Booking
-        # Update booking status from UNCONFIRMED to CONFIRMED
+        # Step 3: Confirm Booking
+        # Update booking status from UNCONFIRMED to CONFIRMED and enqueue
+        # loyalty accrual and notification in the outbox (one transaction)
         try:
-            booking_reference = BookingService.confirm_booking(booking_id)
+            with metrics.span('confirm_booking'):
+                booking_reference = BookingService.confirm_booking_and_enqueue(
+                    booking_id,
+                    data['customerId'],
+                    payment_result['price']
+                )
         except Exception as e:
             # CRITICAL: Payment succeeded but confirmation failed
-            # Rollback: Refund payment, cancel booking, release flight seat
-            print(f"CRITICAL: Booking confirmation failed after payment: {str(e)}")
+            # Rollback: Refund payment, cancel booking and release flight seat
+            metrics.log(f"CRITICAL: Booking confirmation failed after payment: {str(e)}")
             
             # Refund the payment
             try:
-                PaymentService.refund_payment(data['chargeId'])
-            except Exception as rollback_error:
-                print(f"CRITICAL: Payment refund failed during rollback: {rollback_error}")
-            
-            # Cancel the booking
-            try:
-                BookingService.cancel_booking(booking_id)
+                with metrics.span('rollback_payment'):
+                    PaymentService.refund_payment(data['chargeId'], booking_id)
             except Exception as rollback_error:
-                print(f"Error during booking cancellation rollback: {rollback_error}")
+                metrics.log(f"CRITICAL: Payment refund failed during rollback: {rollback_error}")
             
-            # Release the flight seat
+            # Cancel the booking and release the flight seat
             try:
-                CatalogService.release_flight_seat(data['outboundFlightId'])
+                with metrics.span('rollback_booking'):
+                    BookingService.cancel_and_release(booking_id, data['outboundFlightId'])
             except Exception as rollback_error:
-                print(f"Error during flight seat release rollback: {rollback_error}")
+                metrics.log(f"Error during booking cancellation rollback: {rollback_error}")
             
             return jsonify({
                 'error': f'Booking confirmation failed: {str(e)}',
@@ -187,27 +271,8 @@ def create_booking():
                 'message': 'Payment has been refunded'
             }), 500
         
-        # Step 5: Add Loyalty Points (optional - should not fail the booking)
-        try:
-            LoyaltyService.process_booking_loyalty(
-                data['customerId'], 
-                payment_result['price']
-            )
-        except Exception as e:
-            # Log but don't fail the booking if loyalty points fail
-            print(f"Warning: Failed to add loyalty points: {str(e)}")
-        
-        # Step 6: Send Notification (optional - should not fail the booking)
-        try:
-            notification = BookingService.notify_booking(
-                data['customerId'],
-                payment_result['price'],
-                booking_reference
-            )
-        except Exception as e:
-            # Log but don't fail the booking if notification fails
-            print(f"Warning: Failed to send notification: {str(e)}")
-            notification = {'status': 'failed', 'error': str(e)}
+        # Loyalty points and notification are delivered by the outbox worker
+        notification = {'status': 'queued'}
         
         # Success! Return the complete booking information
         return jsonify({
@@ -221,28 +286,23 @@ def create_booking():
     except Exception as e:
         # Catch-all for any unexpected errors
         # Attempt to rollback everything if we have the necessary information
-        print(f"UNEXPECTED ERROR in booking workflow: {str(e)}")
+        metrics.log(f"UNEXPECTED ERROR in booking workflow: {str(e)}")
         
         if payment_result:
             # Payment was collected, need to refund
             try:
-                PaymentService.refund_payment(data['chargeId'])
+                with metrics.span('rollback_payment'):
+                    PaymentService.refund_payment(data['chargeId'], booking_id)
             except Exception as rollback_error:
-                print(f"Error during payment refund: {rollback_error}")
+                metrics.log(f"Error during payment refund: {rollback_error}")
         
         if booking_id:
-            # Booking was created, need to cancel
-            try:
-                BookingService.cancel_booking(booking_id)
-            except Exception as rollback_error:
-                print(f"Error during booking cancellation: {rollback_error}")
-        
-        if flight_reserved:
-            # Flight seat was reserved, need to release
+            # Booking was created and seat reserved, need to undo both
             try:
-                CatalogService.release_flight_seat(data['outboundFlightId'])
+                with metrics.span('rollback_booking'):
+                    BookingService.cancel_and_release(booking_id, data['outboundFlightId'])
             except Exception as rollback_error:
-                print(f"Error during flight seat release: {rollback_error}")
+                metrics.log(f"Error during booking cancellation: {rollback_error}")
         
         return jsonify({
             'error': f'Unexpected error during booking: {str(e)}',
@@ -276,19 +336,26 @@ def cancel_booking(booking_id):
     """Cancel a booking (requires authentication, owner or admin only)"""
     # Get booking details
     booking = BookingService.get_booking(booking_id)
+    already_cancelled = {'bookingId': booking_id, 'status': 'CANCELLED', 'alreadyCancelled': True}
+    if booking['status'] == 'CANCELLED':
+        # The first cancellation released the seat and refunded the payment
+        return jsonify(already_cancelled)
     
-    # Cancel the booking
-    BookingService.cancel_booking(booking_id)
-    
-    # Release the flight seat
+    # Cancel the booking and release its seat in one transaction
     try:
-        CatalogService.release_flight_seat(booking['bookingOutboundFlightId'])
-    except Exception as e:
+        BookingService.cancel_and_release(booking_id, booking['bookingOutboundFlightId'])
+    except ValueError as e:
+        if BookingService.get_booking(booking_id)['status'] == 'CANCELLED':
+            # A concurrent request cancelled it first
+            return jsonify(already_cancelled)
+        # The seat cannot be released (flight gone or already at capacity),
+        # which must not block the cancellation itself
         print(f"Warning: Failed to release flight seat: {str(e)}")
+        BookingService.cancel_booking(booking_id)
     
     # Refund payment
     try:
-        refund_result = PaymentService.refund_payment(booking['paymentToken'])
+        refund_result = PaymentService.refund_payment(booking['paymentToken'], booking_id)
     except Exception as e:
         print(f"Warning: Failed to refund payment: {str(e)}")
         refund_result = {'refundId': 'N/A', 'status': 'failed'}
@@ -311,10 +378,16 @@ def cancel_booking(booking_id):
 @app.route('/customers/<customer_id>/bookings', methods=['GET'])
 @owner_or_admin_required
 def get_customer_bookings(customer_id):
-    """Get all bookings for a customer (requires authentication, owner or admin only)"""
+    """
+    Get a page of bookings for a customer (requires authentication, owner or admin only)
+    Query params: status, limit, cursor (nextCursor from the previous page),
+    expand=flight to embed each booking's flight as outboundFlight
+    """
     status = request.args.get('status')
-    bookings = BookingService.get_customer_bookings(customer_id, status)
-    return jsonify({'bookings': bookings})
+    limit, cursor = page_args()
+    expand_flight = request.args.get('expand') == 'flight'
+    result = BookingService.get_customer_bookings_page(customer_id, status, limit, cursor, expand_flight)
+    return jsonify(result)
 
 
 # Payment endpoints
@@ -322,14 +395,14 @@ def get_customer_bookings(customer_id):
 def collect_payment():
     """
     Collect payment
-    Request body: { "chargeId": "..." }
+    Request body: { "chargeId": "...", "bookingId": "..." (optional) }
     """
     data = request.get_json()
     
     if not data or 'chargeId' not in data:
         return jsonify({'error': 'chargeId is required'}), 400
     
-    result = PaymentService.collect_payment(data['chargeId'])
+    result = PaymentService.collect_payment(data['chargeId'], data.get('bookingId'))
     return jsonify(result)
 
 
@@ -337,14 +410,14 @@ def collect_payment():
 def refund_payment():
     """
     Refund payment
-    Request body: { "chargeId": "..." }
+    Request body: { "chargeId": "...", "bookingId": "..." (optional) }
     """
     data = request.get_json()
     
     if not data or 'chargeId' not in data:
         return jsonify({'error': 'chargeId is required'}), 400
     
-    result = PaymentService.refund_payment(data['chargeId'])
+    result = PaymentService.refund_payment(data['chargeId'], data.get('bookingId'))
     return jsonify(result)
 
 
@@ -449,9 +522,23 @@ def get_current_user():
 @app.route('/auth/users', methods=['GET'])
 @admin_required
 def list_users():
-    """List all users (Admin only)"""
-    users = AuthService.get_all_users()
-    return jsonify({'users': users})
+    """
+    List users a page at a time (Admin only)
+    Query params: limit, cursor (nextCursor from the previous page)
+    """
+    limit, cursor = page_args()
+    result = AuthService.get_users(limit, cursor)
+    return jsonify(result)
+
+
+# Metrics endpoint
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Request latency, booking step and DynamoDB usage histograms of this
+    worker, in the Prometheus text format
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
 # API Information endpoint
@@ -471,11 +558,13 @@ def api_index():
                 'register': 'POST /auth/register',
                 'login': 'POST /auth/login',
                 'me': 'GET /auth/me [Auth Required]',
-                'list_users': 'GET /auth/users [Admin Required]'
+                'list_users': 'GET /auth/users?limit=&cursor= [Admin Required]'
             },
             'flights': {
                 'search': 'GET /flights/search?departureCode=&arrivalCode=&departureDate=',
+                'connections': 'GET /flights/search/connections?departureCode=&arrivalCode=&departureDate=&returnDate=&minLayover=&maxLayover=',
                 'get': 'GET /flights/<flight_id>',
+                'batch': 'POST /flights/batch',
                 'reserve': 'POST /flights/<flight_id>/reserve',
                 'release': 'POST /flights/<flight_id>/release'
             },
@@ -484,7 +573,7 @@ def api_index():
                 'get': 'GET /bookings/<booking_id> [Owner/Admin Required]',
                 'confirm': 'POST /bookings/<booking_id>/confirm [Owner/Admin Required]',
                 'cancel': 'POST /bookings/<booking_id>/cancel [Owner/Admin Required]',
-                'customer_bookings': 'GET /customers/<customer_id>/bookings [Owner/Admin Required]'
+                'customer_bookings': 'GET /customers/<customer_id>/bookings?status=&limit=&cursor=&expand=flight [Owner/Admin Required]'
             },
             'payments': {
                 'collect': 'POST /payments/collect',
@@ -494,7 +583,8 @@ def api_index():
             'loyalty': {
                 'get': 'GET /loyalty/<customer_id> [Owner/Admin Required]',
                 'add_points': 'POST /loyalty/<customer_id>/points [Admin Required]'
-            }
+            },
+            'metrics': 'GET /metrics (Prometheus text format)'
         },
         'default_users': {
             'regular_user': {'email': 'user@example.com', 'password': 'password123'},
@@ -542,7 +632,53 @@ def catch_all(path):
         })
 
 
+def seed_data():
+    """Load sample flights and default users that do not exist yet"""
+    flights_created = storage.seed_sample_data()
+    for flight in SAMPLE_FLIGHTS:
+        CatalogService.invalidate_flight(flight)
+    AuthService.init_default_users()
+    return flights_created
+
+
+# The in-memory engine starts empty in every process; seeding it does no
+# network I/O, so do it here. DynamoDB is seeded once with `run.py seed`.
+if Config.STORAGE_BACKEND.lower() == 'memory':
+    seed_data()
+
+
+_workers_lock = threading.Lock()
+_workers_started = False
+
+
+def start_background_workers():
+    """
+    Start the in-process outbox worker unless it runs as a separate process
+    
+    Safe to call repeatedly; the worker starts at most once per process.
+    """
+    global _workers_started
+    
+    with _workers_lock:
+        if _workers_started:
+            return
+        _workers_started = True
+    
+    if os.environ.get('OUTBOX_IN_PROCESS', 'True').lower() == 'true':
+        outbox_worker.start()
+
+
+# WSGI servers (e.g. gunicorn) only import `app`, so start the worker on the
+# first request each process serves, after any fork
+@app.before_request
+def ensure_background_workers():
+    """Start the outbox worker if this process has not started it yet"""
+    if not _workers_started:
+        start_background_workers()
+
+
 if __name__ == '__main__':
+    start_background_workers()
     print("Starting Airline Booking Application...")
     print("Server running on http://localhost:5000")
     print("Access API documentation at http://localhost:5000/")
@@ -0,0 +1,75 @@
+"""
+Worker cold-start benchmark
+Measures how long a fresh worker process takes to import the application
+and to serve its first storage-backed request
+
+Usage:
+    python benchmark_cold_start.py [--runs 10] [--backend memory|dynamodb]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Runs inside a fresh interpreter, like a newly forked gunicorn worker
+WORKER_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/flights/FL001')
+first_request = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'first_request': first_request - imported
+}))
+"""
+
+
+def run_worker(backend: str) -> dict:
+    """Boot one worker process and return its timings in seconds"""
+    env = dict(os.environ, STORAGE_BACKEND=backend, OUTBOX_IN_PROCESS='False')
+    result = subprocess.run(
+        [sys.executable, '-c', WORKER_SCRIPT],
+        cwd=APP_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    # The timings are the last line; anything before is startup logging
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(label: str, samples: list):
+    """Print mean / median / max of a list of durations"""
+    millis = [sample * 1000 for sample in samples]
+    print(f"  {label:<15} mean {statistics.mean(millis):8.1f} ms   "
+          f"median {statistics.median(millis):8.1f} ms   max {max(millis):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker cold-start time')
+    parser.add_argument('--runs', type=int, default=10, help='Number of worker boots (default: 10)')
+    parser.add_argument('--backend', default=os.environ.get('STORAGE_BACKEND', 'memory'),
+                        help='Storage backend to boot against (default: memory)')
+    args = parser.parse_args()
+    
+    print("="*60)
+    print(f"Worker cold start: {args.runs} run(s), backend={args.backend}")
+    print("="*60)
+    
+    timings = [run_worker(args.backend) for _ in range(args.runs)]
+    
+    summarize('import app', [t['import'] for t in timings])
+    summarize('first request', [t['first_request'] for t in timings])
+    summarize('total', [t['import'] + t['first_request'] for t in timings])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Password hashing benchmark
+Measures login verification throughput (logins/sec) for the configured KDF
+at increasing hashing pool sizes, and per core
+
+Usage:
+    python benchmark_password_hashing.py [--logins 64] [--scheme scrypt|pbkdf2_sha256]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.passwords import PasswordHasher
+
+PASSWORD = 'password123'
+
+
+def measure(scheme: str, workers: int, logins: int) -> float:
+    """Verify `logins` passwords concurrently and return logins per second"""
+    hasher = PasswordHasher(scheme=scheme, num_workers=workers, max_pending=logins)
+    stored_hash = hasher.hash(PASSWORD)
+    
+    # Many request threads, as in a threaded web server, sharing one pool
+    with ThreadPoolExecutor(max_workers=logins) as requests:
+        start = time.perf_counter()
+        results = list(requests.map(lambda _: hasher.verify(PASSWORD, stored_hash), range(logins)))
+        elapsed = time.perf_counter() - start
+    
+    hasher.shutdown()
+    assert all(results), "Password verification failed"
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure password verification throughput')
+    parser.add_argument('--logins', type=int, default=64, help='Logins per measurement (default: 64)')
+    parser.add_argument('--scheme', default=os.environ.get('AUTH_PASSWORD_SCHEME', 'scrypt'),
+                        help='Hashing scheme: scrypt or pbkdf2_sha256 (default: scrypt)')
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1,
+                        help='Largest pool size to try (default: number of cores)')
+    args = parser.parse_args()
+    
+    print("="*60)
+    print(f"Password verification: scheme={args.scheme}, {args.logins} logins per run, "
+          f"{os.cpu_count()} core(s)")
+    print("="*60)
+    print(f"  {'workers':>7}  {'logins/sec':>12}  {'per core':>12}")
+    
+    workers = 1
+    while workers <= args.max_workers:
+        rate = measure(args.scheme, workers, args.logins)
+        # A worker occupies at most one core while hashing
+        cores_used = min(workers, os.cpu_count() or 1)
+        print(f"  {workers:>7}  {rate:>12.1f}  {rate / cores_used:>12.1f}")
+        workers *= 2
+    
+    print("\nEach worker keeps one core busy; size AUTH_HASH_WORKERS so that")
+    print("workers x logins/sec per core covers peak login traffic.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Payment pipeline benchmark
+Drives capture + refund through PaymentService against the fake payment
+gateway and reports latency percentiles, errors and duplicate side effects
+
+Usage:
+    python benchmark_payments.py [--requests 500] [--concurrency 32] [--failure-rate 0.05]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Add current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_payment_gateway import FakeGateway, create_server
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """Nearest-rank percentile of a sorted list"""
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure payment call latency against a fake gateway')
+    parser.add_argument('--requests', type=int, default=500, help='Bookings to pay and refund (default: 500)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Concurrent callers (default: 32)')
+    parser.add_argument('--port', type=int, default=12111, help='Port for the fake gateway (default: 12111)')
+    parser.add_argument('--latency-ms', type=float, default=80, help='Median gateway latency (default: 80)')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='Gateway latency spread (default: 0.5)')
+    parser.add_argument('--failure-rate', type=float, default=0.05,
+                        help='Fraction of gateway requests failing with 500 (default: 0.05)')
+    parser.add_argument('--timeout-rate', type=float, default=0.0,
+                        help='Fraction of gateway requests hanging past the read timeout (default: 0)')
+    args = parser.parse_args()
+    
+    # Route the payment service to the fake gateway before it is configured
+    os.environ['STRIPE_SECRET_KEY'] = 'sk_test_fake'
+    os.environ['STRIPE_API_BASE'] = f"http://127.0.0.1:{args.port}"
+    # Payment records go to the in-memory engine unless told otherwise
+    os.environ.setdefault('STORAGE_BACKEND', 'memory')
+    from services.payment import PaymentService
+    from services.payment_gateway import stripe_gateway
+    
+    gateway = FakeGateway(args.latency_ms, args.latency_sigma, args.failure_rate,
+                          args.timeout_rate, stripe_gateway.READ_TIMEOUT_SECONDS * 2)
+    server = create_server(args.port, gateway)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    def pay_and_refund(_):
+        booking_id = str(uuid.uuid4())
+        charge_id = f"pi_{uuid.uuid4().hex}"
+        start = time.perf_counter()
+        try:
+            PaymentService.collect_payment(charge_id, booking_id)
+            collected = time.perf_counter()
+            # Refund twice, as a saga rollback followed by a cancellation would
+            PaymentService.refund_payment(charge_id, booking_id)
+            PaymentService.refund_payment(charge_id, booking_id)
+            return collected - start, None
+        except Exception as e:
+            return time.perf_counter() - start, str(e)
+    
+    print("="*60)
+    print(f"Payments: {args.requests} bookings, concurrency {args.concurrency}, "
+          f"gateway latency {args.latency_ms} ms, failures {args.failure_rate:.0%}, "
+          f"timeouts {args.timeout_rate:.0%}")
+    print("="*60)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(pay_and_refund, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    
+    latencies = sorted(latency * 1000 for latency, error in results if error is None)
+    errors = [error for _, error in results if error is not None]
+    
+    print(f"  throughput      {len(results) / elapsed:8.1f} bookings/sec")
+    if latencies:
+        print(f"  capture p50     {percentile(latencies, 0.50):8.1f} ms")
+        print(f"  capture p95     {percentile(latencies, 0.95):8.1f} ms")
+        print(f"  capture p99     {percentile(latencies, 0.99):8.1f} ms")
+        print(f"  capture max     {latencies[-1]:8.1f} ms")
+    print(f"  errors          {len(errors):8d}")
+    for error in sorted(set(errors))[:5]:
+        print(f"    {error}")
+    
+    stats = gateway.stats
+    print(f"\nGateway: {stats['requests']} requests, {stats['injected_failures']} injected failures, "
+          f"{stats['injected_timeouts']} injected timeouts, {stats['idempotent_replays']} idempotent replays")
+    print(f"  captures {stats['captures']}, refunds {stats['refunds']} "
+          f"(expected at most {args.requests} of each)")
+    
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -20,17 +20,62 @@ class Config:
     # Application Stage
     STAGE = os.environ.get('STAGE', 'dev')
     
+    # Storage engine: 'dynamodb' (default) or 'memory' (process-local, for
+    # load testing and local runs; data is lost on restart)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'dynamodb')
+    
     # DynamoDB Table Names
     FLIGHT_TABLE_NAME = os.environ.get('FLIGHT_TABLE_NAME', f'Airline-Flight-{STAGE}')
     BOOKING_TABLE_NAME = os.environ.get('BOOKING_TABLE_NAME', f'Airline-Booking-{STAGE}')
     LOYALTY_TABLE_NAME = os.environ.get('LOYALTY_TABLE_NAME', f'Airline-Loyalty-{STAGE}')
     USERS_TABLE_NAME = os.environ.get('USERS_TABLE_NAME', f'Airline-Users-{STAGE}')
+    OUTBOX_TABLE_NAME = os.environ.get('OUTBOX_TABLE_NAME', f'Airline-Outbox-{STAGE}')
+    PAYMENTS_TABLE_NAME = os.environ.get('PAYMENTS_TABLE_NAME', f'Airline-Payments-{STAGE}')
+    
+    # Outbox worker (loyalty accrual and notifications after booking)
+    OUTBOX_IN_PROCESS = os.environ.get('OUTBOX_IN_PROCESS', 'True').lower() == 'true'
+    OUTBOX_WORKERS = int(os.environ.get('OUTBOX_WORKERS', '4'))
+    
+    # Listing endpoints (bookings, users)
+    DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', '50'))
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '100'))
+    
+    # Flight catalog cache (see services/catalog.py)
+    FLIGHT_CACHE_SIZE = int(os.environ.get('FLIGHT_CACHE_SIZE', '10000'))
+    FLIGHT_CACHE_TTL_SECONDS = float(os.environ.get('FLIGHT_CACHE_TTL_SECONDS', '300'))
+    FLIGHT_SEAT_MAX_STALENESS_SECONDS = float(os.environ.get('FLIGHT_SEAT_MAX_STALENESS_SECONDS', '2'))
+    # Connection search (see services/route_graph.py)
+    ROUTE_GRAPH_REFRESH_SECONDS = float(os.environ.get('ROUTE_GRAPH_REFRESH_SECONDS', '900'))
+    CONNECTION_MIN_LAYOVER_MINUTES = int(os.environ.get('CONNECTION_MIN_LAYOVER_MINUTES', '45'))
+    CONNECTION_MAX_LAYOVER_MINUTES = int(os.environ.get('CONNECTION_MAX_LAYOVER_MINUTES', '1440'))
+    # Default bucket count for `python run.py shard-seats <flight id>...`
+    SEAT_SHARDS = int(os.environ.get('SEAT_SHARDS', '8'))
+    # `python run.py import-schedule <file>` (see services/schedule_import.py)
+    IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', '4'))
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '500'))
     
     # JWT Configuration
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY')
     
+    # Token user lookup cache (see services/auth.py)
+    AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', '10000'))
+    AUTH_USER_CACHE_TTL_SECONDS = float(os.environ.get('AUTH_USER_CACHE_TTL_SECONDS', '60'))
+    AUTH_TRUST_TOKEN_GROUPS = os.environ.get('AUTH_TRUST_TOKEN_GROUPS', 'False').lower() == 'true'
+    
+    # Password hashing (see services/passwords.py)
+    AUTH_PASSWORD_SCHEME = os.environ.get('AUTH_PASSWORD_SCHEME', 'scrypt')
+    AUTH_HASH_WORKERS = int(os.environ.get('AUTH_HASH_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+    AUTH_HASH_MAX_PENDING = int(os.environ.get('AUTH_HASH_MAX_PENDING', '64'))
+    
     # Stripe Payment Configuration
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
+    STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE')
+    
+    # Payment gateway calls (see services/payment_gateway.py)
+    PAYMENT_READ_TIMEOUT_SECONDS = float(os.environ.get('PAYMENT_READ_TIMEOUT_SECONDS', '10'))
+    PAYMENT_DEADLINE_SECONDS = float(os.environ.get('PAYMENT_DEADLINE_SECONDS', '20'))
+    PAYMENT_MAX_RETRIES = int(os.environ.get('PAYMENT_MAX_RETRIES', '2'))
+    PAYMENT_CACHE_SIZE = int(os.environ.get('PAYMENT_CACHE_SIZE', '10000'))
     
     # Flask Configuration
     FLASK_ENV = os.environ.get('FLASK_ENV', 'development')
@@ -75,6 +120,7 @@ class Config:
         print("="*60)
         print(f"AWS Region: {Config.AWS_REGION}")
         print(f"Stage: {Config.STAGE}")
+        print(f"Storage Backend: {Config.STORAGE_BACKEND}")
         print(f"AWS Access Key: {'***' if Config.AWS_ACCESS_KEY_ID else 'Not Set'}")
         print(f"AWS Secret Key: {'***' if Config.AWS_SECRET_ACCESS_KEY else 'Not Set'}")
         print("\nDynamoDB Tables:")
@@ -82,8 +128,28 @@ class Config:
         print(f"  Booking Table: {Config.BOOKING_TABLE_NAME}")
         print(f"  Loyalty Table: {Config.LOYALTY_TABLE_NAME}")
         print(f"  Users Table: {Config.USERS_TABLE_NAME}")
-        print(f"\nJWT Secret Key: {'***' if Config.JWT_SECRET_KEY else 'Not Set (will auto-generate)'}")
+        print(f"  Outbox Table: {Config.OUTBOX_TABLE_NAME}")
+        print(f"  Payments Table: {Config.PAYMENTS_TABLE_NAME}")
+        print(f"\nOutbox Worker: {'in-process' if Config.OUTBOX_IN_PROCESS else 'separate process'}, "
+              f"{Config.OUTBOX_WORKERS} thread(s)")
+        print(f"\nPage Size: {Config.DEFAULT_PAGE_SIZE} default, {Config.MAX_PAGE_SIZE} max")
+        print(f"Flight Cache: {Config.FLIGHT_CACHE_SIZE} entries, {Config.FLIGHT_CACHE_TTL_SECONDS}s TTL, "
+              f"seat counts at most {Config.FLIGHT_SEAT_MAX_STALENESS_SECONDS}s stale")
+        print(f"Seat Shards: {Config.SEAT_SHARDS} per sharded flight")
+        print(f"Schedule Import: {Config.IMPORT_WORKERS} worker(s), {Config.IMPORT_BATCH_SIZE} rows per batch")
+        print(f"Route Graph: rebuilt every {Config.ROUTE_GRAPH_REFRESH_SECONDS}s, layovers "
+              f"{Config.CONNECTION_MIN_LAYOVER_MINUTES}-{Config.CONNECTION_MAX_LAYOVER_MINUTES} min")
+        print(f"JWT Secret Key: {'***' if Config.JWT_SECRET_KEY else 'Not Set (will auto-generate)'}")
+        print(f"Auth User Cache: {Config.AUTH_USER_CACHE_SIZE} entries, {Config.AUTH_USER_CACHE_TTL_SECONDS}s TTL")
+        print(f"Trust Token Groups: {Config.AUTH_TRUST_TOKEN_GROUPS}")
+        print(f"Password Hashing: {Config.AUTH_PASSWORD_SCHEME}, {Config.AUTH_HASH_WORKERS} worker(s), "
+              f"{Config.AUTH_HASH_MAX_PENDING} max pending")
         print(f"Stripe Secret Key: {'***' if Config.STRIPE_SECRET_KEY else 'Not Set (SIMULATION MODE)'}")
+        if Config.STRIPE_API_BASE:
+            print(f"Stripe API Base: {Config.STRIPE_API_BASE}")
+        print(f"Payment Calls: {Config.PAYMENT_READ_TIMEOUT_SECONDS}s read timeout, "
+              f"{Config.PAYMENT_DEADLINE_SECONDS}s deadline, {Config.PAYMENT_MAX_RETRIES} retries")
+        print(f"Payment Cache: {Config.PAYMENT_CACHE_SIZE} entries")
         print(f"Flask Environment: {Config.FLASK_ENV}")
         print(f"Flask Debug: {Config.FLASK_DEBUG}")
         print("="*60 + "\n")
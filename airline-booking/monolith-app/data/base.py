@@ -0,0 +1,385 @@
+"""
+Storage interface
+Defines the operations every storage engine provides, plus the helpers
+shared between engines
+"""
+import base64
+import json
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+
+# Flights loaded into an empty flight table
+SAMPLE_FLIGHTS = [
+    {
+        'id': 'FL001',
+        'departureDate': '2025-11-10',
+        'departureAirportCode': 'LAX',
+        'departureAirportName': 'Los Angeles International',
+        'departureCity': 'Los Angeles',
+        'departureLocale': 'America/Los_Angeles',
+        'arrivalDate': '2025-11-10',
+        'arrivalAirportCode': 'SFO',
+        'arrivalAirportName': 'San Francisco International',
+        'arrivalCity': 'San Francisco',
+        'arrivalLocale': 'America/Los_Angeles',
+        'ticketPrice': 150,
+        'ticketCurrency': 'USD',
+        'flightNumber': 1001,
+        'seatCapacity': 100,
+        'maximumSeating': 100
+    },
+    {
+        'id': 'FL002',
+        'departureDate': '2025-11-12',
+        'departureAirportCode': 'JFK',
+        'departureAirportName': 'John F Kennedy International',
+        'departureCity': 'New York',
+        'departureLocale': 'America/New_York',
+        'arrivalDate': '2025-11-12',
+        'arrivalAirportCode': 'LAX',
+        'arrivalAirportName': 'Los Angeles International',
+        'arrivalCity': 'Los Angeles',
+        'arrivalLocale': 'America/Los_Angeles',
+        'ticketPrice': 300,
+        'ticketCurrency': 'USD',
+        'flightNumber': 2002,
+        'seatCapacity': 150,
+        'maximumSeating': 150
+    }
+]
+
+
+# Flight attributes returned by list_flight_schedules
+SCHEDULE_FIELDS = ('id', 'departureAirportCode', 'arrivalAirportCode', 'departureDate',
+                   'arrivalDate', 'ticketPrice', 'flightNumber')
+
+
+class StorageBackend(ABC):
+    """
+    Storage for flights, bookings, loyalty points, payments, outbox records
+    and users
+    
+    Every engine raises ValueError for business rule violations (no seats
+    left, booking not found, duplicate user) with the same messages, so the
+    service layer behaves identically on top of any of them.
+    """
+    
+    # Upper bound on seat buckets per flight (see shard_flight_seats)
+    MAX_SEAT_SHARDS = 50
+    
+    # Shared helpers
+    @classmethod
+    def _check_seat_shards(cls, flight: Optional[dict], flight_id: str, shards: int):
+        """Validate a request to shard a flight's seats"""
+        if not isinstance(shards, int) or not 2 <= shards <= cls.MAX_SEAT_SHARDS:
+            raise ValueError(f"Seat shards must be between 2 and {cls.MAX_SEAT_SHARDS}")
+        if flight is None:
+            raise ValueError(f"Flight {flight_id} does not exist")
+        if flight.get('seatShards'):
+            raise ValueError(f"Flight {flight_id} already has {flight['seatShards']} seat shards")
+    
+    @staticmethod
+    def _route_key(departure_code: str, arrival_code: str, departure_date: str) -> str:
+        """Build the composite route#date key used by the flight route index"""
+        # Departure dates may carry a time; the index is by calendar date
+        return f"{departure_code}#{arrival_code}#{departure_date[:10]}"
+    
+    @staticmethod
+    def _new_booking(booking_data: dict) -> dict:
+        """Build a new UNCONFIRMED booking item"""
+        return {
+            'id': str(uuid.uuid4()),
+            'stateExecutionId': booking_data.get('stateExecutionId', ''),
+            '__typename': 'Booking',
+            'bookingOutboundFlightId': booking_data['outboundFlightId'],
+            'checkedIn': False,
+            'customer': booking_data['customerId'],
+            'paymentToken': booking_data['chargeId'],
+            'status': 'UNCONFIRMED',
+            'createdAt': datetime.now().isoformat(),
+            'bookingReference': None
+        }
+    
+    @staticmethod
+    def _outbox_timestamp(delay_seconds: float = 0) -> str:
+        """Sortable UTC timestamp used for outbox scheduling"""
+        moment = datetime.utcnow() + timedelta(seconds=delay_seconds)
+        return moment.isoformat(timespec='microseconds')
+    
+    @staticmethod
+    def _encode_cursor(position: Optional[dict]) -> Optional[str]:
+        """Wrap an engine-specific read position in an opaque, URL-safe cursor"""
+        if not position:
+            return None
+        data = json.dumps(position, sort_keys=True, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+    
+    @staticmethod
+    def _decode_cursor(cursor: Optional[str], fields: Dict[str, type]) -> Optional[dict]:
+        """
+        Unwrap a cursor made by _encode_cursor
+        
+        Cursors come from clients, so the position must have exactly the
+        fields the listing produces, with the expected types, before an
+        engine uses it.
+        
+        Args:
+            cursor: Cursor returned with the previous page
+            fields: Position field names and types; integers must be >= 0
+        
+        Raises:
+            ValueError: If the cursor is malformed or not from this listing
+        """
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except (ValueError, TypeError):
+            raise ValueError("Invalid pagination cursor")
+        if not isinstance(position, dict) or set(position) != set(fields):
+            raise ValueError("Invalid pagination cursor")
+        for name, kind in fields.items():
+            value = position[name]
+            # type() rather than isinstance() so True is not taken for 1
+            if type(value) is not kind or (kind is int and value < 0):
+                raise ValueError("Invalid pagination cursor")
+        return position
+    
+    def seed_sample_data(self) -> int:
+        """
+        Load the sample flights that are not stored yet
+        
+        Returns:
+            Number of flights created
+        """
+        created = 0
+        for flight in SAMPLE_FLIGHTS:
+            if self.get_flight(flight['id']) is None:
+                self.put_flight(flight)
+                created += 1
+        return created
+    
+    # Flight operations
+    @abstractmethod
+    def put_flight(self, flight: dict) -> dict:
+        """
+        Create or replace a flight
+        
+        Raises:
+            ValueError: If the existing flight's seats have been sharded
+        """
+    
+    @abstractmethod
+    def put_flights(self, flights: List[dict]) -> int:
+        """
+        Create or replace many flights, maintaining their route index keys
+        
+        For bulk loads: writes are batched and unconditional, so flights
+        whose seats have been sharded must not be included.
+        
+        Returns:
+            Number of flights written
+        """
+    
+    @abstractmethod
+    def get_flight(self, flight_id: str) -> Optional[dict]:
+        """Get flight by ID"""
+    
+    @abstractmethod
+    def get_flights(self, flight_ids: List[str]) -> Dict[str, dict]:
+        """Get several flights by ID, keyed by ID; unknown IDs are left out"""
+    
+    @abstractmethod
+    def get_flights_by_schedule(self, departure_code: str, arrival_code: str,
+                                departure_date: str) -> List[dict]:
+        """Get flights matching schedule criteria"""
+    
+    @abstractmethod
+    def list_flight_schedules(self, departing_from: str) -> List[dict]:
+        """
+        Get the schedule of every flight departing on or after a date
+        
+        Returns the flights' id, airports, departure and arrival dates,
+        ticketPrice and flightNumber only; seat counts are left out.
+        """
+    
+    @abstractmethod
+    def reserve_flight_seat(self, flight_id: str) -> bool:
+        """Decrease available seat capacity, never below zero"""
+    
+    @abstractmethod
+    def release_flight_seat(self, flight_id: str) -> bool:
+        """Increase available seat capacity, never above maximumSeating"""
+    
+    @abstractmethod
+    def release_flight_seats(self, flight_id: str, count: int) -> bool:
+        """Increase available seat capacity by count, never above maximumSeating"""
+    
+    @abstractmethod
+    def shard_flight_seats(self, flight_id: str, shards: int) -> dict:
+        """
+        Split a flight's seat counter into buckets written independently
+        
+        For flights so popular that concurrent reservations contend on one
+        counter. Reads report the sum of the buckets as seatCapacity and the
+        flight gains a seatShards attribute. A flight cannot be unsharded.
+        """
+    
+    # Booking operations
+    @abstractmethod
+    def create_booking(self, booking_data: dict) -> dict:
+        """Create a new booking"""
+    
+    @abstractmethod
+    def reserve_and_create_booking(self, booking_data: dict) -> dict:
+        """Reserve a flight seat and create an UNCONFIRMED booking atomically"""
+    
+    @abstractmethod
+    def cancel_and_release_booking(self, booking_id: str, flight_id: str) -> bool:
+        """Cancel a booking and release its flight seat atomically"""
+    
+    @abstractmethod
+    def get_booking(self, booking_id: str) -> Optional[dict]:
+        """Get booking by ID"""
+    
+    @abstractmethod
+    def update_booking_status(self, booking_id: str, status: str,
+                              booking_reference: Optional[str] = None) -> dict:
+        """Update booking status"""
+    
+    @abstractmethod
+    def confirm_booking_with_outbox(self, booking_id: str, booking_reference: str,
+                                    events: List[dict]) -> bool:
+        """Confirm a booking and enqueue its follow-up events atomically"""
+    
+    @abstractmethod
+    def get_bookings_by_customer(self, customer_id: str, status: Optional[str] = None) -> List[dict]:
+        """Get bookings for a customer, optionally filtered by status"""
+    
+    @abstractmethod
+    def get_bookings_page(self, customer_id: str, status: Optional[str] = None,
+                          limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        Get one page of a customer's bookings, optionally filtered by status
+        
+        Returns:
+            Tuple of (bookings, cursor for the next page or None at the end)
+        """
+    
+    # Loyalty operations
+    @abstractmethod
+    def add_loyalty_points(self, customer_id: str, points: int,
+                           idempotency_key: Optional[str] = None) -> dict:
+        """Add loyalty points for a customer"""
+    
+    @abstractmethod
+    def get_loyalty_points(self, customer_id: str) -> int:
+        """Get total active loyalty points for a customer"""
+    
+    @abstractmethod
+    def sum_loyalty_ledger(self, customer_id: str) -> int:
+        """Sum active loyalty ledger entries for a customer"""
+    
+    @abstractmethod
+    def reconcile_loyalty_balances(self) -> Dict[str, int]:
+        """Recompute every customer's balance from the loyalty ledger"""
+    
+    def get_loyalty_level(self, points: int) -> str:
+        """Calculate loyalty level based on points"""
+        if points >= 100000:
+            return 'gold'
+        elif points >= 50000:
+            return 'silver'
+        else:
+            return 'bronze'
+    
+    def get_remaining_points_to_next_tier(self, points: int, level: str) -> int:
+        """Calculate points needed for next tier"""
+        if level == 'bronze':
+            return 50000 - points
+        elif level == 'silver':
+            return 100000 - points
+        else:
+            return 0
+    
+    # Payment operations
+    @abstractmethod
+    def put_payment(self, payment: dict) -> dict:
+        """Create or replace a payment record, keyed by its chargeId"""
+    
+    @abstractmethod
+    def get_payment(self, charge_id: str) -> Optional[dict]:
+        """Get payment record by charge ID"""
+    
+    @abstractmethod
+    def mark_payment_refunded(self, charge_id: str) -> bool:
+        """Set a payment's status to refunded, returning False if it is not stored"""
+    
+    @abstractmethod
+    def record_refund(self, refund_key: str, refund: dict) -> dict:
+        """
+        Store a refund under its idempotency key
+        
+        Returns:
+            The stored refund; if one was already recorded under the key,
+            that earlier refund is returned and nothing is written
+        """
+    
+    @abstractmethod
+    def get_refund(self, refund_key: str) -> Optional[dict]:
+        """Get a refund by its idempotency key"""
+    
+    # Outbox operations
+    @abstractmethod
+    def get_due_outbox_records(self, limit: int) -> List[dict]:
+        """Get pending outbox records whose retry time has come, oldest first"""
+    
+    @abstractmethod
+    def claim_outbox_record(self, record: dict, lease_seconds: float) -> Optional[dict]:
+        """Claim an outbox record for processing, or return None if already claimed"""
+    
+    @abstractmethod
+    def complete_outbox_record(self, record_id: str, status: str = 'DONE',
+                               error: Optional[str] = None):
+        """Mark an outbox record finished (DONE or FAILED)"""
+    
+    @abstractmethod
+    def reschedule_outbox_record(self, record_id: str, delay_seconds: float, error: str):
+        """Schedule a failed outbox record for another attempt"""
+    
+    # User operations
+    @abstractmethod
+    def create_user(self, user: dict) -> dict:
+        """Create a user, enforcing unique sub and email"""
+    
+    @abstractmethod
+    def get_user(self, user_id: str) -> Optional[dict]:
+        """Get user by sub"""
+    
+    @abstractmethod
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        """Get user by email"""
+    
+    @abstractmethod
+    def add_user_to_group(self, user_id: str, group: str) -> bool:
+        """Add a user to a group, returning False if the user does not exist"""
+    
+    @abstractmethod
+    def update_user_password(self, user_id: str, password_hash: str) -> bool:
+        """Replace a user's password hash, returning False if the user does not exist"""
+    
+    @abstractmethod
+    def list_users(self, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        Get one page of users
+        
+        Returns:
+            Tuple of (users, cursor for the next page or None at the end)
+        """
+    
+    @abstractmethod
+    def has_users(self) -> bool:
+        """Check whether any user exists"""
@@ -0,0 +1,1406 @@
+"""
+DynamoDB storage engine
+Provides database operations using AWS DynamoDB
+"""
+import uuid
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from decimal import Decimal
+import boto3
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+from data.base import SCHEDULE_FIELDS, StorageBackend
+from services import metrics
+
+
+class DataStorage(StorageBackend):
+    """DynamoDB data storage for flights, bookings, loyalty points, payments and users"""
+    
+    # Global secondary indexes created by init_dynamodb_tables.py
+    FLIGHT_ROUTE_INDEX = 'route-date-index'
+    BOOKING_CUSTOMER_INDEX = 'customer-index'
+    LOYALTY_CUSTOMER_INDEX = 'customer-flag-index'
+    OUTBOX_PENDING_INDEX = 'pending-index'
+    USERS_EMAIL_INDEX = 'email-index'
+    
+    # Users table items keyed EMAIL#<email> make emails unique
+    EMAIL_SENTINEL_PREFIX = 'EMAIL#'
+    
+    # Materialized per-customer loyalty balance items live next to the ledger
+    LOYALTY_BALANCE_PREFIX = 'BALANCE#'
+    LOYALTY_BALANCE_FLAG = 'balance'
+    # Attempts per customer when a reconcile races with accruals, and how
+    # long a fresh accrual may take to reach customer-flag-index
+    RECONCILE_MAX_ATTEMPTS = 5
+    LOYALTY_INDEX_LAG_SECONDS = 2
+    
+    # Refunds share the payments table, keyed REFUND#<idempotency key>
+    REFUND_PREFIX = 'REFUND#'
+    
+    # Upper bound on DynamoDB requests made to fill one filtered page
+    PAGE_MAX_REQUESTS = 5
+    # Attributes of the LastEvaluatedKey each paginated read returns
+    BOOKING_INDEX_CURSOR = {'id': str, 'customer': str}
+    BOOKING_SCAN_CURSOR = {'id': str}
+    USERS_SCAN_CURSOR = {'sub': str}
+    
+    # Sharded seat buckets live in the flights table, keyed SEATS#<flight id>#<n>
+    SEAT_SHARD_PREFIX = 'SEATS#'
+    
+    # BatchGetItem accepts at most 100 keys per request
+    BATCH_GET_SIZE = 100
+    BATCH_GET_MAX_ATTEMPTS = 5
+    
+    def __init__(self):
+        # Get AWS configuration from environment variables
+        aws_region = os.environ.get('AWS_REGION', 'us-east-1')
+        
+        # Initialize DynamoDB client
+        # If AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY are set in environment,
+        # boto3 will automatically use them. Otherwise, it will use IAM role or default credentials.
+        self.dynamodb = boto3.resource('dynamodb', region_name=aws_region)
+        
+        # Get table names from environment or use defaults
+        stage = os.environ.get('STAGE', 'dev')
+        self.flight_table_name = os.environ.get('FLIGHT_TABLE_NAME', f'Airline-Flight-{stage}')
+        self.booking_table_name = os.environ.get('BOOKING_TABLE_NAME', f'Airline-Booking-{stage}')
+        self.loyalty_table_name = os.environ.get('LOYALTY_TABLE_NAME', f'Airline-Loyalty-{stage}')
+        self.outbox_table_name = os.environ.get('OUTBOX_TABLE_NAME', f'Airline-Outbox-{stage}')
+        self.payments_table_name = os.environ.get('PAYMENTS_TABLE_NAME', f'Airline-Payments-{stage}')
+        self.users_table_name = os.environ.get('USERS_TABLE_NAME', f'Airline-Users-{stage}')
+        
+        # Get table references
+        self.flight_table = self.dynamodb.Table(self.flight_table_name)
+        self.booking_table = self.dynamodb.Table(self.booking_table_name)
+        self.loyalty_table = self.dynamodb.Table(self.loyalty_table_name)
+        self.outbox_table = self.dynamodb.Table(self.outbox_table_name)
+        self.payments_table = self.dynamodb.Table(self.payments_table_name)
+        self.users_table = self.dynamodb.Table(self.users_table_name)
+        
+        # Ask every call for its consumed capacity and account it, with the
+        # call itself, to the current request (see services/metrics.py)
+        events = self.dynamodb.meta.client.meta.events
+        events.register('provide-client-params.dynamodb.*', self._request_consumed_capacity)
+        events.register('after-call.dynamodb.*', self._record_call)
+        
+        # Shard counts of flights seen with sharded seats. Sharding is never
+        # undone, so entries cannot go stale.
+        self._seat_shards: Dict[str, int] = {}
+    
+    def _python_obj_to_dynamodb(self, obj):
+        """Convert Python objects to DynamoDB compatible format (float to Decimal)"""
+        if isinstance(obj, float):
+            return Decimal(str(obj))
+        elif isinstance(obj, dict):
+            return {k: self._python_obj_to_dynamodb(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [self._python_obj_to_dynamodb(item) for item in obj]
+        return obj
+    
+    def _dynamodb_to_python_obj(self, obj):
+        """Convert DynamoDB objects to Python format (Decimal to int/float)"""
+        if isinstance(obj, Decimal):
+            # Convert to int if it's a whole number, otherwise float
+            if obj % 1 == 0:
+                return int(obj)
+            return float(obj)
+        elif isinstance(obj, dict):
+            return {k: self._dynamodb_to_python_obj(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [self._dynamodb_to_python_obj(item) for item in obj]
+        return obj
+    
+    def _to_attribute_values(self, item: dict) -> dict:
+        """
+        Prepare a Python dict for TransactWriteItems
+        
+        self.dynamodb.meta.client is the resource's client, which serializes
+        Python values into attribute values itself; serializing them here as
+        well would nest every value in a map.
+        """
+        return self._python_obj_to_dynamodb(item)
+    
+    @staticmethod
+    def _is_missing_index_error(error: ClientError) -> bool:
+        """Check whether a query failed because the table lacks the requested index"""
+        code = error.response.get('Error', {}).get('Code')
+        message = error.response.get('Error', {}).get('Message', '')
+        return code == 'ValidationException' and 'index' in message.lower()
+    
+    def _query_all(self, table, **kwargs) -> List[dict]:
+        """Run a query and follow LastEvaluatedKey until all pages are read"""
+        items = []
+        while True:
+            response = table.query(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    def _scan_all(self, table, **kwargs) -> List[dict]:
+        """Run a scan and follow LastEvaluatedKey until all pages are read"""
+        items = []
+        while True:
+            response = table.scan(**kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    def _read_page(self, read, limit: int, cursor: Optional[str], cursor_fields: Dict[str, type],
+                   cursor_match: Optional[dict] = None, **kwargs) -> Tuple[List[dict], Optional[str]]:
+        """
+        Read up to limit items with table.query or table.scan from a cursor
+        
+        Filters are applied after DynamoDB's Limit, so one request can return
+        fewer items than asked for. Requests continue from LastEvaluatedKey
+        until the page is full, the results are exhausted or PAGE_MAX_REQUESTS
+        is reached; a short page with a cursor is returned in the last case.
+        
+        The cursor must have cursor_fields and, if given, the values in
+        cursor_match, so a client cannot start a read in another partition.
+        
+        Returns:
+            Tuple of (items, opaque cursor wrapping LastEvaluatedKey or None)
+            
+        Raises:
+            ValueError: If the cursor is malformed or not from this read
+        """
+        start_key = self._decode_cursor(cursor, cursor_fields)
+        if start_key and any(start_key[name] != value for name, value in (cursor_match or {}).items()):
+            raise ValueError("Invalid pagination cursor")
+        items = []
+        
+        for _ in range(self.PAGE_MAX_REQUESTS):
+            if start_key:
+                kwargs['ExclusiveStartKey'] = start_key
+            try:
+                response = read(Limit=limit - len(items), **kwargs)
+            except ClientError as e:
+                # A well-formed key can still be rejected, e.g. one that
+                # belongs to another customer's partition
+                if cursor and e.response.get('Error', {}).get('Code') == 'ValidationException' \
+                        and 'ExclusiveStartKey' in kwargs and not self._is_missing_index_error(e):
+                    raise ValueError("Invalid pagination cursor")
+                raise
+            items.extend(response.get('Items', []))
+            start_key = response.get('LastEvaluatedKey')
+            if not start_key or len(items) >= limit:
+                break
+        
+        return [self._dynamodb_to_python_obj(item) for item in items], self._encode_cursor(start_key)
+    
+    # Instrumentation
+    @staticmethod
+    def _request_consumed_capacity(params: dict, model, **kwargs):
+        if model.input_shape is not None and 'ReturnConsumedCapacity' in model.input_shape.members:
+            params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+    
+    @staticmethod
+    def _record_call(parsed: dict, model, **kwargs):
+        metrics.record_dynamodb_call(model.name, parsed.get('ConsumedCapacity'))
+    
+    # Flight operations
+    def put_flight(self, flight: dict) -> dict:
+        """Create or replace a flight, maintaining its route index key"""
+        flight = dict(flight)
+        flight['routeDate'] = self._route_key(
+            flight['departureAirportCode'],
+            flight['arrivalAirportCode'],
+            flight['departureDate']
+        )
+        
+        try:
+            # Replacing a sharded flight would orphan its seat buckets
+            self.flight_table.put_item(
+                Item=self._python_obj_to_dynamodb(flight),
+                ConditionExpression='attribute_not_exists(seatShards)'
+            )
+            return flight
+        except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            raise ValueError(f"Flight {flight['id']} has sharded seats and cannot be replaced")
+        except Exception as e:
+            raise ValueError(f"Failed to save flight: {str(e)}")
+    
+    def put_flights(self, flights: List[dict]) -> int:
+        """
+        Create or replace many flights with BatchWriteItem
+        
+        The batch writer sends 25 items per request and resends unprocessed
+        items. Duplicate IDs within the batch are collapsed, since
+        BatchWriteItem rejects them.
+        """
+        try:
+            with self.flight_table.batch_writer(overwrite_by_pkeys=['id']) as batch:
+                for flight in flights:
+                    flight = dict(flight)
+                    flight['routeDate'] = self._route_key(
+                        flight['departureAirportCode'],
+                        flight['arrivalAirportCode'],
+                        flight['departureDate']
+                    )
+                    batch.put_item(Item=self._python_obj_to_dynamodb(flight))
+            return len(flights)
+        except Exception as e:
+            raise ValueError(f"Failed to save flights: {str(e)}")
+    
+    def get_flight(self, flight_id: str) -> Optional[dict]:
+        """Get flight by ID"""
+        try:
+            response = self.flight_table.get_item(Key={'id': flight_id})
+            if 'Item' in response:
+                return self._with_seat_totals([self._dynamodb_to_python_obj(response['Item'])])[0]
+            return None
+        except Exception as e:
+            print(f"Error getting flight {flight_id}: {str(e)}")
+            return None
+    
+    def _batch_get(self, table_name: str, keys: List[dict]) -> List[dict]:
+        """
+        Fetch items with BatchGetItem, retrying unprocessed keys
+        
+        DynamoDB returns keys it could not serve (throttling, 16 MB response
+        limit) as UnprocessedKeys; these are retried with jittered exponential
+        backoff.
+        
+        Raises:
+            ValueError: If keys are still unprocessed after BATCH_GET_MAX_ATTEMPTS
+        """
+        items = []
+        
+        for start in range(0, len(keys), self.BATCH_GET_SIZE):
+            request = {table_name: {'Keys': keys[start:start + self.BATCH_GET_SIZE]}}
+            
+            for attempt in range(self.BATCH_GET_MAX_ATTEMPTS):
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                items.extend(response.get('Responses', {}).get(table_name, []))
+                request = response.get('UnprocessedKeys') or {}
+                if not request:
+                    break
+                time.sleep(random.uniform(0, 0.05 * (2 ** attempt)))
+            else:
+                raise ValueError(f"Failed to read {len(request[table_name]['Keys'])} item(s) "
+                                 f"from {table_name}: requests throttled")
+        
+        return items
+    
+    def get_flights(self, flight_ids: List[str]) -> Dict[str, dict]:
+        """Get several flights by ID in BatchGetItem round trips, keyed by ID"""
+        keys = [{'id': flight_id} for flight_id in dict.fromkeys(flight_ids)]
+        items = self._batch_get(self.flight_table_name, keys)
+        flights = self._with_seat_totals([self._dynamodb_to_python_obj(item) for item in items])
+        return {flight['id']: flight for flight in flights}
+    
+    def get_flights_by_schedule(self, departure_code: str, arrival_code: str, 
+                                departure_date: str) -> List[dict]:
+        """Get flights matching schedule criteria"""
+        route_key = self._route_key(departure_code, arrival_code, departure_date)
+        
+        try:
+            try:
+                items = self._query_all(
+                    self.flight_table,
+                    IndexName=self.FLIGHT_ROUTE_INDEX,
+                    KeyConditionExpression=Key('routeDate').eq(route_key)
+                )
+            except ClientError as e:
+                if not self._is_missing_index_error(e):
+                    raise
+                # Table was created before the route index existed
+                # (run: python init_dynamodb_tables.py --migrate)
+                items = self._scan_all(
+                    self.flight_table,
+                    FilterExpression=Attr('departureAirportCode').eq(departure_code) &
+                                    Attr('arrivalAirportCode').eq(arrival_code) &
+                                    Attr('departureDate').begins_with(departure_date[:10])
+                )
+            
+            return self._with_seat_totals([self._dynamodb_to_python_obj(item) for item in items])
+        except Exception as e:
+            print(f"Error searching flights: {str(e)}")
+            return []
+    
+    def list_flight_schedules(self, departing_from: str) -> List[dict]:
+        """
+        Get the schedule of every flight departing on or after a date
+        
+        One paginated scan of the flights table. Seat bucket items have no
+        routeDate and are filtered out.
+        """
+        items = self._scan_all(
+            self.flight_table,
+            FilterExpression=Attr('routeDate').exists() & Attr('departureDate').gte(departing_from),
+            ProjectionExpression=', '.join(SCHEDULE_FIELDS)
+        )
+        return [self._dynamodb_to_python_obj(item) for item in items]
+    
+    # Sharded seat inventory
+    def _shard_key(self, flight_id: str, shard: int) -> dict:
+        return {'id': f"{self.SEAT_SHARD_PREFIX}{flight_id}#{shard}"}
+    
+    def _is_sharded(self, flight_id: str) -> bool:
+        """
+        Check whether a flight has sharded seats
+        
+        Unsharded seat writes are conditioned on attribute_not_exists(seatShards),
+        so this read is only needed after such a write was rejected.
+        """
+        if flight_id in self._seat_shards:
+            return True
+        
+        try:
+            response = self.flight_table.get_item(
+                Key={'id': flight_id},
+                ProjectionExpression='seatShards',
+                ConsistentRead=True
+            )
+        except Exception as e:
+            raise ValueError(f"Failed to read flight {flight_id}: {str(e)}")
+        
+        shards = response.get('Item', {}).get('seatShards')
+        if shards:
+            self._seat_shards[flight_id] = int(shards)
+            return True
+        return False
+    
+    def _on_any_shard(self, flight_id: str, write) -> bool:
+        """
+        Apply write(key) to a flight's seat buckets in random order until one
+        accepts it
+        
+        The random order spreads concurrent writers over the buckets' partitions
+        instead of having them all contend for the first one.
+        
+        Args:
+            flight_id: Sharded flight
+            write: Called with a bucket key; returns False if the bucket's
+                condition rejected the write
+        
+        Returns:
+            True once a bucket accepted the write, False if none did
+        """
+        shards = list(range(self._seat_shards[flight_id]))
+        random.shuffle(shards)
+        return any(write(self._shard_key(flight_id, shard)) for shard in shards)
+    
+    def _with_seat_totals(self, flights: List[dict]) -> List[dict]:
+        """Report the summed bucket counts as seatCapacity of sharded flights"""
+        sharded = [flight for flight in flights if flight.get('seatShards')]
+        if not sharded:
+            return flights
+        
+        keys = []
+        for flight in sharded:
+            self._seat_shards[flight['id']] = int(flight['seatShards'])
+            keys.extend(self._shard_key(flight['id'], shard) for shard in range(int(flight['seatShards'])))
+        
+        totals = {}
+        for bucket in self._batch_get(self.flight_table_name, keys):
+            totals[bucket['flightId']] = totals.get(bucket['flightId'], 0) + int(bucket['seatCapacity'])
+        for flight in sharded:
+            flight['seatCapacity'] = totals.get(flight['id'], 0)
+        return flights
+    
+    def _take_shard_seat(self, key: dict) -> bool:
+        try:
+            self.flight_table.update_item(
+                Key=key,
+                UpdateExpression='SET seatCapacity = seatCapacity - :dec',
+                ConditionExpression='seatCapacity > :zero',
+                ExpressionAttributeValues={':dec': 1, ':zero': 0}
+            )
+            return True
+        except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+    
+    def _return_shard_seat(self, key: dict) -> bool:
+        try:
+            self.flight_table.update_item(
+                Key=key,
+                UpdateExpression='SET seatCapacity = seatCapacity + :inc',
+                ConditionExpression='seatCapacity < maximumSeating',
+                ExpressionAttributeValues={':inc': 1}
+            )
+            return True
+        except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+    
+    def shard_flight_seats(self, flight_id: str, shards: int) -> dict:
+        """
+        Split a flight's seat counter into buckets on separate partitions
+        
+        The seats move to bucket items SEATS#<flight id>#<n> in the flights
+        table, each holding a share of seatCapacity and maximumSeating, and
+        the flight item gets seatShards and a zero seatCapacity. It is one
+        transaction conditioned on the seat count just read, so a concurrent
+        reservation either lands before it or makes it fail without changes.
+        """
+        try:
+            response = self.flight_table.get_item(Key={'id': flight_id}, ConsistentRead=True)
+        except Exception as e:
+            raise ValueError(f"Failed to read flight {flight_id}: {str(e)}")
+        flight = self._dynamodb_to_python_obj(response['Item']) if 'Item' in response else None
+        self._check_seat_shards(flight, flight_id, shards)
+        
+        seats, maximum = flight['seatCapacity'], flight['maximumSeating']
+        items = [
+            {
+                'Update': {
+                    'TableName': self.flight_table_name,
+                    'Key': self._to_attribute_values({'id': flight_id}),
+                    'UpdateExpression': 'SET seatShards = :shards, seatCapacity = :zero',
+                    'ConditionExpression': 'seatCapacity = :seats AND attribute_not_exists(seatShards)',
+                    'ExpressionAttributeValues': self._to_attribute_values({
+                        ':shards': shards,
+                        ':zero': 0,
+                        ':seats': seats
+                    })
+                }
+            }
+        ]
+        for shard in range(shards):
+            # Spread the remainders over the first buckets; a bucket's seats
+            # never exceed its maximum because seats <= maximum
+            items.append({
+                'Put': {
+                    'TableName': self.flight_table_name,
+                    'Item': self._to_attribute_values({
+                        **self._shard_key(flight_id, shard),
+                        'flightId': flight_id,
+                        'seatCapacity': seats // shards + int(shard < seats % shards),
+                        'maximumSeating': maximum // shards + int(shard < maximum % shards)
+                    })
+                }
+            })
+        
+        client = self.dynamodb.meta.client
+        try:
+            client.transact_write_items(TransactItems=items)
+        except client.exceptions.TransactionCanceledException:
+            raise ValueError(f"Seats on flight {flight_id} changed while sharding, please retry")
+        except Exception as e:
+            raise ValueError(f"Failed to shard seats: {str(e)}")
+        
+        self._seat_shards[flight_id] = shards
+        flight['seatShards'] = shards
+        return flight
+    
+    def reserve_flight_seat(self, flight_id: str) -> bool:
+        """Decrease available seat capacity"""
+        try:
+            if flight_id not in self._seat_shards:
+                try:
+                    # Use atomic counter decrement with condition
+                    self.flight_table.update_item(
+                        Key={'id': flight_id},
+                        UpdateExpression='SET seatCapacity = seatCapacity - :dec',
+                        ConditionExpression='seatCapacity > :zero AND attribute_exists(id) '
+                                            'AND attribute_not_exists(seatShards)',
+                        ExpressionAttributeValues={
+                            ':dec': 1,
+                            ':zero': 0
+                        }
+                    )
+                    return True
+                except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+                    if not self._is_sharded(flight_id):
+                        raise ValueError(f"Flight {flight_id} is fully booked or does not exist")
+            
+            if self._on_any_shard(flight_id, self._take_shard_seat):
+                return True
+            raise ValueError(f"Flight {flight_id} is fully booked or does not exist")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Failed to reserve seat: {str(e)}")
+    
+    def release_flight_seat(self, flight_id: str) -> bool:
+        """Increase available seat capacity"""
+        full_error = (f"Cannot release seat on flight {flight_id}: "
+                      f"flight does not exist or is already at maximum capacity")
+        try:
+            if flight_id not in self._seat_shards:
+                try:
+                    # Atomic counter increment bounded by the item's own maximumSeating,
+                    # so no read is needed first
+                    self.flight_table.update_item(
+                        Key={'id': flight_id},
+                        UpdateExpression='SET seatCapacity = seatCapacity + :inc',
+                        ConditionExpression='attribute_exists(id) AND seatCapacity < maximumSeating '
+                                            'AND attribute_not_exists(seatShards)',
+                        ExpressionAttributeValues={
+                            ':inc': 1
+                        }
+                    )
+                    return True
+                except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+                    if not self._is_sharded(flight_id):
+                        raise ValueError(full_error)
+            
+            if self._on_any_shard(flight_id, self._return_shard_seat):
+                return True
+            raise ValueError(full_error)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Failed to release seat: {str(e)}")
+    
+    def release_flight_seats(self, flight_id: str, count: int) -> bool:
+        """
+        Release several seats on a flight at once (bulk cancellations)
+        
+        Condition expressions cannot do arithmetic, so the bound
+        maximumSeating - count is computed from a projected read of the
+        immutable maximumSeating attribute. This costs two round trips for
+        any number of seats instead of one per seat.
+        """
+        if count <= 0:
+            raise ValueError("Seat count must be a positive number")
+        if count == 1:
+            return self.release_flight_seat(flight_id)
+        
+        client = self.dynamodb.meta.client
+        try:
+            response = self.flight_table.get_item(
+                Key={'id': flight_id},
+                ProjectionExpression='maximumSeating, seatShards'
+            )
+            if 'Item' not in response:
+                raise ValueError(f"Flight {flight_id} does not exist")
+            
+            if response['Item'].get('seatShards'):
+                self._seat_shards[flight_id] = int(response['Item']['seatShards'])
+                self._release_shard_seats(flight_id, count)
+                return True
+            
+            self.flight_table.update_item(
+                Key={'id': flight_id},
+                UpdateExpression='SET seatCapacity = seatCapacity + :inc',
+                ConditionExpression='seatCapacity <= :bound AND attribute_not_exists(seatShards)',
+                ExpressionAttributeValues={
+                    ':inc': count,
+                    ':bound': response['Item']['maximumSeating'] - count
+                }
+            )
+            return True
+        except (client.exceptions.ConditionalCheckFailedException,
+                client.exceptions.TransactionCanceledException):
+            raise ValueError(f"Cannot release {count} seats on flight {flight_id}, "
+                             f"would exceed maximum capacity")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Failed to release seats: {str(e)}")
+    
+    def _release_shard_seats(self, flight_id: str, count: int):
+        """
+        Spread a bulk release over the buckets with room, in one transaction
+        
+        Each bucket's increment is conditioned on its own bound, so a
+        concurrent change cancels the whole release instead of overfilling
+        a bucket.
+        """
+        keys = [self._shard_key(flight_id, shard) for shard in range(self._seat_shards[flight_id])]
+        buckets = self._batch_get(self.flight_table_name, keys)
+        random.shuffle(buckets)
+        
+        items = []
+        remaining = count
+        for bucket in buckets:
+            room = int(bucket['maximumSeating']) - int(bucket['seatCapacity'])
+            increment = min(room, remaining)
+            if increment <= 0:
+                continue
+            items.append({
+                'Update': {
+                    'TableName': self.flight_table_name,
+                    'Key': self._to_attribute_values({'id': bucket['id']}),
+                    'UpdateExpression': 'SET seatCapacity = seatCapacity + :inc',
+                    'ConditionExpression': 'seatCapacity <= :bound',
+                    'ExpressionAttributeValues': self._to_attribute_values({
+                        ':inc': increment,
+                        ':bound': int(bucket['maximumSeating']) - increment
+                    })
+                }
+            })
+            remaining -= increment
+            if remaining == 0:
+                break
+        
+        if remaining:
+            raise ValueError(f"Cannot release {count} seats on flight {flight_id}, "
+                             f"would exceed maximum capacity")
+        self.dynamodb.meta.client.transact_write_items(TransactItems=items)
+    
+    # Booking operations
+    @staticmethod
+    def _cancellation_codes(error: Exception) -> List[Optional[str]]:
+        """Per-item failure codes of a cancelled transaction"""
+        reasons = getattr(error, 'response', {}).get('CancellationReasons', [])
+        return [reason.get('Code') for reason in reasons]
+    
+    def create_booking(self, booking_data: dict) -> dict:
+        """Create a new booking"""
+        booking = self._new_booking(booking_data)
+        
+        try:
+            booking_item = self._python_obj_to_dynamodb(booking)
+            self.booking_table.put_item(Item=booking_item)
+            return self._dynamodb_to_python_obj(booking)
+        except Exception as e:
+            raise ValueError(f"Failed to create booking: {str(e)}")
+    
+    def reserve_and_create_booking(self, booking_data: dict) -> dict:
+        """
+        Reserve a flight seat and create an UNCONFIRMED booking atomically
+        
+        The seat decrement and the booking put are one transaction, so either
+        both happen or neither does.
+        """
+        flight_id = booking_data['outboundFlightId']
+        booking = self._new_booking(booking_data)
+        client = self.dynamodb.meta.client
+        
+        def reserve_on(key: dict, condition: str) -> bool:
+            # False when the seat counter's condition rejected the transaction
+            try:
+                client.transact_write_items(
+                    TransactItems=[
+                        {
+                            'Update': {
+                                'TableName': self.flight_table_name,
+                                'Key': self._to_attribute_values(key),
+                                'UpdateExpression': 'SET seatCapacity = seatCapacity - :dec',
+                                'ConditionExpression': condition,
+                                'ExpressionAttributeValues': self._to_attribute_values({
+                                    ':dec': 1,
+                                    ':zero': 0
+                                })
+                            }
+                        },
+                        {
+                            'Put': {
+                                'TableName': self.booking_table_name,
+                                'Item': self._to_attribute_values(booking),
+                                'ConditionExpression': 'attribute_not_exists(id)'
+                            }
+                        }
+                    ]
+                )
+                return True
+            except client.exceptions.TransactionCanceledException as e:
+                codes = self._cancellation_codes(e)
+                if codes and codes[0] == 'ConditionalCheckFailed':
+                    return False
+                raise ValueError(f"Failed to reserve seat and create booking: {str(e)}")
+        
+        try:
+            if flight_id not in self._seat_shards:
+                if reserve_on({'id': flight_id}, 'seatCapacity > :zero AND attribute_exists(id) '
+                                                 'AND attribute_not_exists(seatShards)'):
+                    return self._dynamodb_to_python_obj(booking)
+                if not self._is_sharded(flight_id):
+                    raise ValueError(f"Flight {flight_id} is fully booked or does not exist")
+            
+            if self._on_any_shard(flight_id, lambda key: reserve_on(key, 'seatCapacity > :zero')):
+                return self._dynamodb_to_python_obj(booking)
+            raise ValueError(f"Flight {flight_id} is fully booked or does not exist")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Failed to reserve seat and create booking: {str(e)}")
+    
+    def cancel_and_release_booking(self, booking_id: str, flight_id: str) -> bool:
+        """
+        Cancel a booking and release its flight seat atomically
+        
+        Fails without changes if the booking is missing or already cancelled,
+        so a seat is never released twice for the same booking.
+        """
+        client = self.dynamodb.meta.client
+        
+        def release_on(key: dict, condition: str) -> bool:
+            # False when the seat counter's condition rejected the transaction
+            try:
+                client.transact_write_items(
+                    TransactItems=[
+                        {
+                            'Update': {
+                                'TableName': self.booking_table_name,
+                                'Key': self._to_attribute_values({'id': booking_id}),
+                                'UpdateExpression': 'SET #status = :cancelled',
+                                'ConditionExpression': 'attribute_exists(id) AND #status <> :cancelled',
+                                'ExpressionAttributeNames': {'#status': 'status'},
+                                'ExpressionAttributeValues': self._to_attribute_values({
+                                    ':cancelled': 'CANCELLED'
+                                })
+                            }
+                        },
+                        {
+                            'Update': {
+                                'TableName': self.flight_table_name,
+                                'Key': self._to_attribute_values(key),
+                                'UpdateExpression': 'SET seatCapacity = seatCapacity + :inc',
+                                'ConditionExpression': condition,
+                                'ExpressionAttributeValues': self._to_attribute_values({
+                                    ':inc': 1
+                                })
+                            }
+                        }
+                    ]
+                )
+                return True
+            except client.exceptions.TransactionCanceledException as e:
+                codes = self._cancellation_codes(e)
+                if codes and codes[0] == 'ConditionalCheckFailed':
+                    raise ValueError(f"Booking {booking_id} not found or already cancelled")
+                if len(codes) > 1 and codes[1] == 'ConditionalCheckFailed':
+                    return False
+                raise ValueError(f"Failed to cancel booking: {str(e)}")
+        
+        try:
+            if flight_id not in self._seat_shards:
+                if release_on({'id': flight_id}, 'seatCapacity < maximumSeating '
+                                                 'AND attribute_not_exists(seatShards)'):
+                    return True
+                if not self._is_sharded(flight_id):
+                    raise ValueError(f"Cannot release seat, already at maximum capacity")
+            
+            if self._on_any_shard(flight_id, lambda key: release_on(key, 'seatCapacity < maximumSeating')):
+                return True
+            raise ValueError(f"Cannot release seat, already at maximum capacity")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Failed to cancel booking: {str(e)}")
+    
+    def get_booking(self, booking_id: str) -> Optional[dict]:
+        """Get booking by ID"""
+        try:
+            response = self.booking_table.get_item(Key={'id': booking_id})
+            if 'Item' in response:
+                return self._dynamodb_to_python_obj(response['Item'])
+            return None
+        except Exception as e:
+            print(f"Error getting booking {booking_id}: {str(e)}")
+            return None
+    
+    def update_booking_status(self, booking_id: str, status: str, 
+                             booking_reference: Optional[str] = None) -> dict:
+        """Update booking status"""
+        try:
+            update_expr = 'SET #status = :status'
+            expr_attr_names = {'#status': 'status'}
+            expr_attr_values = {':status': status}
+            
+            if booking_reference:
+                update_expr += ', bookingReference = :ref'
+                expr_attr_values[':ref'] = booking_reference
+            
+            response = self.booking_table.update_item(
+                Key={'id': booking_id},
+                UpdateExpression=update_expr,
+                ExpressionAttributeNames=expr_attr_names,
+                ExpressionAttributeValues=expr_attr_values,
+                ConditionExpression='attribute_exists(id)',
+                ReturnValues='ALL_NEW'
+            )
+            
+            return self._dynamodb_to_python_obj(response['Attributes'])
+        except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            raise ValueError(f"Booking {booking_id} not found")
+        except Exception as e:
+            raise ValueError(f"Failed to update booking: {str(e)}")
+    
+    def confirm_booking_with_outbox(self, booking_id: str, booking_reference: str,
+                                    events: List[dict]) -> bool:
+        """
+        Confirm a booking and enqueue its follow-up events atomically
+        
+        Args:
+            booking_id: Booking identifier
+            booking_reference: Generated booking reference
+            events: Outbox records to write, each with id (idempotency key),
+                eventType and payload
+        """
+        client = self.dynamodb.meta.client
+        now = self._outbox_timestamp()
+        
+        transact_items = [
+            {
+                'Update': {
+                    'TableName': self.booking_table_name,
+                    'Key': self._to_attribute_values({'id': booking_id}),
+                    'UpdateExpression': 'SET #status = :status, bookingReference = :ref',
+                    'ConditionExpression': 'attribute_exists(id)',
+                    'ExpressionAttributeNames': {'#status': 'status'},
+                    'ExpressionAttributeValues': self._to_attribute_values({
+                        ':status': 'CONFIRMED',
+                        ':ref': booking_reference
+                    })
+                }
+            }
+        ]
+        for event in events:
+            record = {
+                'id': event['id'],
+                'eventType': event['eventType'],
+                'payload': event['payload'],
+                'status': 'PENDING',
+                'pending': 'PENDING',  # Sparse key of the pending index
+                'attempts': 0,
+                'availableAt': now,
+                'createdAt': now
+            }
+            transact_items.append({
+                'Put': {
+                    'TableName': self.outbox_table_name,
+                    'Item': self._to_attribute_values(record),
+                    'ConditionExpression': 'attribute_not_exists(id)'
+                }
+            })
+        
+        try:
+            client.transact_write_items(TransactItems=transact_items)
+            return True
+        except client.exceptions.TransactionCanceledException as e:
+            codes = self._cancellation_codes(e)
+            if codes and codes[0] == 'ConditionalCheckFailed':
+                raise ValueError(f"Booking {booking_id} not found")
+            raise ValueError(f"Failed to confirm booking: {str(e)}")
+        except Exception as e:
+            raise ValueError(f"Failed to confirm booking: {str(e)}")
+    
+    def get_bookings_by_customer(self, customer_id: str, status: Optional[str] = None) -> List[dict]:
+        """Get bookings for a customer, optionally filtered by status"""
+        status_filter = Attr('status').eq(status) if status else None
+        
+        try:
+            try:
+                query_kwargs = {
+                    'IndexName': self.BOOKING_CUSTOMER_INDEX,
+                    'KeyConditionExpression': Key('customer').eq(customer_id)
+                }
+                if status_filter is not None:
+                    query_kwargs['FilterExpression'] = status_filter
+                items = self._query_all(self.booking_table, **query_kwargs)
+            except ClientError as e:
+                if not self._is_missing_index_error(e):
+                    raise
+                # Table was created without customer-index
+                filter_expr = Attr('customer').eq(customer_id)
+                if status_filter is not None:
+                    filter_expr = filter_expr & status_filter
+                items = self._scan_all(self.booking_table, FilterExpression=filter_expr)
+            
+            return [self._dynamodb_to_python_obj(item) for item in items]
+        except Exception as e:
+            print(f"Error getting bookings for customer {customer_id}: {str(e)}")
+            return []
+    
+    def get_bookings_page(self, customer_id: str, status: Optional[str] = None,
+                          limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Get one page of a customer's bookings, optionally filtered by status"""
+        status_filter = Attr('status').eq(status) if status else None
+        
+        # Only the scan fallback below hands out cursors with just an id
+        try:
+            from_scan = self._decode_cursor(cursor, self.BOOKING_SCAN_CURSOR) is not None
+        except ValueError:
+            from_scan = False
+        
+        if not from_scan:
+            try:
+                query_kwargs = {
+                    'IndexName': self.BOOKING_CUSTOMER_INDEX,
+                    'KeyConditionExpression': Key('customer').eq(customer_id)
+                }
+                if status_filter is not None:
+                    query_kwargs['FilterExpression'] = status_filter
+                return self._read_page(self.booking_table.query, limit, cursor,
+                                       self.BOOKING_INDEX_CURSOR, {'customer': customer_id},
+                                       **query_kwargs)
+            except ClientError as e:
+                if not self._is_missing_index_error(e):
+                    raise
+        
+        # Table was created without customer-index
+        filter_expr = Attr('customer').eq(customer_id)
+        if status_filter is not None:
+            filter_expr = filter_expr & status_filter
+        return self._read_page(self.booking_table.scan, limit, cursor,
+                               self.BOOKING_SCAN_CURSOR, FilterExpression=filter_expr)
+    
+    # Loyalty operations
+    def _loyalty_balance_key(self, customer_id: str) -> dict:
+        """Primary key of a customer's materialized loyalty balance item"""
+        return {'id': f"{self.LOYALTY_BALANCE_PREFIX}{customer_id}"}
+    
+    def add_loyalty_points(self, customer_id: str, points: int,
+                           idempotency_key: Optional[str] = None) -> dict:
+        """
+        Add loyalty points for a customer
+        
+        The ledger entry and the increment of the customer's balance item are
+        written in a single transaction so the two can never drift apart.
+        The increment requires the balance item to exist; a customer's first
+        accrual seeds it from their ledger and retries. When an idempotency
+        key is given it becomes the ledger entry ID, so replaying the same
+        accrual is a no-op.
+        """
+        loyalty_id = f"ACCRUAL#{idempotency_key}" if idempotency_key else str(uuid.uuid4())
+        loyalty_entry = {
+            'id': loyalty_id,
+            'customerId': customer_id,
+            'points': points,
+            'flag': 'active',
+            'date': datetime.now().isoformat()
+        }
+        
+        for attempt in range(2):
+            try:
+                self.dynamodb.meta.client.transact_write_items(
+                    TransactItems=[
+                        {
+                            'Put': {
+                                'TableName': self.loyalty_table_name,
+                                'Item': self._to_attribute_values(loyalty_entry),
+                                'ConditionExpression': 'attribute_not_exists(id)'
+                            }
+                        },
+                        {
+                            'Update': {
+                                'TableName': self.loyalty_table_name,
+                                'Key': self._to_attribute_values(
+                                    self._loyalty_balance_key(customer_id)
+                                ),
+                                'UpdateExpression': 'ADD points :points '
+                                                    'SET updatedAt = :date',
+                                'ConditionExpression': 'attribute_exists(id)',
+                                'ExpressionAttributeValues': self._to_attribute_values({
+                                    ':points': points,
+                                    ':date': loyalty_entry['date']
+                                })
+                            }
+                        }
+                    ]
+                )
+                return self._dynamodb_to_python_obj(loyalty_entry)
+            except self.dynamodb.meta.client.exceptions.TransactionCanceledException as e:
+                codes = self._cancellation_codes(e)
+                if idempotency_key and codes and codes[0] == 'ConditionalCheckFailed':
+                    # Accrual was already applied
+                    return self._dynamodb_to_python_obj(loyalty_entry)
+                if attempt == 0 and codes[1:2] == ['ConditionalCheckFailed']:
+                    # No balance item yet
+                    try:
+                        self._seed_loyalty_balance(customer_id)
+                    except Exception as seed_error:
+                        raise ValueError(f"Failed to add loyalty points: {str(seed_error)}")
+                    continue
+                raise ValueError(f"Failed to add loyalty points: {str(e)}")
+            except Exception as e:
+                raise ValueError(f"Failed to add loyalty points: {str(e)}")
+        raise ValueError("Failed to add loyalty points: balance item could not be created")
+    
+    def _seed_loyalty_balance(self, customer_id: str):
+        """
+        Create a customer's balance item from their ledger, if it is missing
+        
+        Ledger entries written before balance items existed are counted here,
+        once. Accruals by this version cannot slip in between the sum and the
+        write: they require the balance item, so they wait for it and retry.
+        """
+        try:
+            self.loyalty_table.put_item(
+                Item={
+                    **self._loyalty_balance_key(customer_id),
+                    'customerId': customer_id,
+                    'flag': self.LOYALTY_BALANCE_FLAG,
+                    'points': self._sum_loyalty_ledger(customer_id),
+                    'updatedAt': datetime.now().isoformat()
+                },
+                ConditionExpression='attribute_not_exists(id)'
+            )
+        except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            # Another accrual seeded it first
+            pass
+    
+    def get_loyalty_points(self, customer_id: str) -> int:
+        """Get total active loyalty points for a customer from the balance item"""
+        try:
+            response = self.loyalty_table.get_item(
+                Key=self._loyalty_balance_key(customer_id),
+                ProjectionExpression='points'
+            )
+            if 'Item' in response:
+                return int(response['Item'].get('points', 0))
+            # No balance yet: either a new customer or one whose ledger
+            # predates balance items and has not been reconciled
+            return self.sum_loyalty_ledger(customer_id)
+        except Exception as e:
+            print(f"Error getting loyalty points for {customer_id}: {str(e)}")
+            return 0
+    
+    def _sum_loyalty_ledger(self, customer_id: str) -> int:
+        """Sum active loyalty ledger entries for a customer, raising on errors"""
+        try:
+            items = self._query_all(
+                self.loyalty_table,
+                IndexName=self.LOYALTY_CUSTOMER_INDEX,
+                KeyConditionExpression=Key('customerId').eq(customer_id) &
+                                       Key('flag').eq('active'),
+                ProjectionExpression='points'
+            )
+        except ClientError as e:
+            if not self._is_missing_index_error(e):
+                raise
+            # Table was created without customer-flag-index
+            items = self._scan_all(
+                self.loyalty_table,
+                FilterExpression=Attr('customerId').eq(customer_id) &
+                                Attr('flag').eq('active'),
+                ProjectionExpression='points',
+                ConsistentRead=True
+            )
+        
+        return sum(int(item.get('points', 0)) for item in items)
+    
+    def sum_loyalty_ledger(self, customer_id: str) -> int:
+        """Sum active loyalty ledger entries for a customer"""
+        try:
+            return self._sum_loyalty_ledger(customer_id)
+        except Exception as e:
+            print(f"Error summing loyalty ledger for {customer_id}: {str(e)}")
+            return 0
+    
+    def reconcile_loyalty_balances(self) -> Dict[str, int]:
+        """
+        Recompute every customer's balance item from the loyalty ledger
+        
+        Customers are found with one paginated scan of the ledger. Each
+        balance is then read, recomputed from the customer's ledger entries
+        and written back only if no accrual changed it in the meantime;
+        otherwise that customer is retried, so reconciling never loses a
+        concurrent accrual.
+        
+        Returns:
+            Mapping of customer ID to reconciled balance. Customers whose
+            balance kept changing are left as they are and reported.
+        """
+        ledger = self._scan_all(
+            self.loyalty_table,
+            FilterExpression=Attr('flag').eq('active'),
+            ProjectionExpression='customerId'
+        )
+        
+        balances: Dict[str, int] = {}
+        for customer_id in dict.fromkeys(entry['customerId'] for entry in ledger):
+            points = self._reconcile_loyalty_balance(customer_id)
+            if points is None:
+                print(f"Skipped loyalty balance of {customer_id}: it kept changing, run reconcile again")
+            else:
+                balances[customer_id] = points
+        return balances
+    
+    def _reconcile_loyalty_balance(self, customer_id: str) -> Optional[int]:
+        """Rewrite one customer's balance item unless an accrual races with it"""
+        key = self._loyalty_balance_key(customer_id)
+        
+        for _ in range(self.RECONCILE_MAX_ATTEMPTS):
+            current = self.loyalty_table.get_item(Key=key, ConsistentRead=True).get('Item')
+            if current is not None and current.get('updatedAt', '') > \
+                    (datetime.now() - timedelta(seconds=self.LOYALTY_INDEX_LAG_SECONDS)).isoformat():
+                # The latest accrual may not be in customer-flag-index yet
+                time.sleep(self.LOYALTY_INDEX_LAG_SECONDS)
+                continue
+            points = self._sum_loyalty_ledger(customer_id)
+            
+            # Every accrual moves updatedAt, so an unchanged value means the
+            # ledger sum above already covers all of the balance's increments
+            if current is None:
+                condition = Attr('id').not_exists()
+            else:
+                condition = Attr('updatedAt').eq(current.get('updatedAt'))
+            
+            try:
+                self.loyalty_table.put_item(
+                    Item={
+                        **key,
+                        'customerId': customer_id,
+                        'flag': self.LOYALTY_BALANCE_FLAG,
+                        'points': points,
+                        'updatedAt': datetime.now().isoformat()
+                    },
+                    ConditionExpression=condition
+                )
+                return points
+            except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+                continue
+        
+        return None
+    
+    # Payment operations
+    def put_payment(self, payment: dict) -> dict:
+        """Create or replace a payment record, keyed by its chargeId"""
+        item = dict(payment, id=payment['chargeId'])
+        try:
+            self.payments_table.put_item(Item=self._python_obj_to_dynamodb(item))
+            return payment
+        except Exception as e:
+            raise ValueError(f"Failed to store payment: {str(e)}")
+    
+    def get_payment(self, charge_id: str) -> Optional[dict]:
+        """Get payment record by charge ID"""
+        try:
+            # Strongly consistent, so every worker sees the latest status
+            response = self.payments_table.get_item(Key={'id': charge_id}, ConsistentRead=True)
+            if 'Item' not in response:
+                return None
+            payment = self._dynamodb_to_python_obj(response['Item'])
+            payment.pop('id', None)
+            return payment
+        except Exception as e:
+            print(f"Error getting payment {charge_id}: {str(e)}")
+            return None
+    
+    def mark_payment_refunded(self, charge_id: str) -> bool:
+        """Set a payment's status to refunded, returning False if it is not stored"""
+        try:
+            self.payments_table.update_item(
+                Key={'id': charge_id},
+                UpdateExpression='SET #status = :status',
+                ConditionExpression='attribute_exists(id)',
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues={':status': 'refunded'}
+            )
+            return True
+        except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+    
+    def record_refund(self, refund_key: str, refund: dict) -> dict:
+        """
+        Store a refund under its idempotency key, or return the one already stored
+        
+        The conditional put makes the key unique across workers, so only one
+        refund is ever recorded per key.
+        """
+        item = dict(refund, id=f"{self.REFUND_PREFIX}{refund_key}")
+        try:
+            self.payments_table.put_item(
+                Item=self._python_obj_to_dynamodb(item),
+                ConditionExpression='attribute_not_exists(id)'
+            )
+            return refund
+        except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            existing = self.get_refund(refund_key)
+            if existing is None:
+                raise ValueError(f"Failed to record refund {refund_key}")
+            return existing
+    
+    def get_refund(self, refund_key: str) -> Optional[dict]:
+        """Get a refund by its idempotency key"""
+        response = self.payments_table.get_item(
+            Key={'id': f"{self.REFUND_PREFIX}{refund_key}"},
+            ConsistentRead=True
+        )
+        if 'Item' not in response:
+            return None
+        refund = self._dynamodb_to_python_obj(response['Item'])
+        refund.pop('id', None)
+        return refund
+    
+    # Outbox operations
+    def get_due_outbox_records(self, limit: int) -> List[dict]:
+        """Get pending outbox records whose retry time has come, oldest first"""
+        try:
+            response = self.outbox_table.query(
+                IndexName=self.OUTBOX_PENDING_INDEX,
+                KeyConditionExpression=Key('pending').eq('PENDING') &
+                                       Key('availableAt').lte(self._outbox_timestamp()),
+                Limit=limit
+            )
+            return [self._dynamodb_to_python_obj(item) for item in response.get('Items', [])]
+        except Exception as e:
+            print(f"Error reading outbox: {str(e)}")
+            return []
+    
+    def claim_outbox_record(self, record: dict, lease_seconds: float) -> Optional[dict]:
+        """
+        Claim an outbox record for processing
+        
+        Pushes availableAt out by the lease so no other worker picks the
+        record up meanwhile; if the claimer crashes, the record becomes due
+        again when the lease runs out.
+        
+        Returns:
+            The claimed record, or None if another worker got it first
+        """
+        try:
+            response = self.outbox_table.update_item(
+                Key={'id': record['id']},
+                UpdateExpression='SET availableAt = :lease ADD attempts :one',
+                ConditionExpression='availableAt = :seen AND attribute_exists(pending)',
+                ExpressionAttributeValues={
+                    ':lease': self._outbox_timestamp(lease_seconds),
+                    ':seen': record['availableAt'],
+                    ':one': 1
+                },
+                ReturnValues='ALL_NEW'
+            )
+            return self._dynamodb_to_python_obj(response['Attributes'])
+        except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return None
+    
+    def complete_outbox_record(self, record_id: str, status: str = 'DONE',
+                               error: Optional[str] = None):
+        """Mark an outbox record finished (DONE or FAILED) and drop it from the pending index"""
+        update_expr = 'SET #status = :status, processedAt = :now REMOVE pending'
+        expr_attr_values = {':status': status, ':now': self._outbox_timestamp()}
+        if error:
+            update_expr = 'SET #status = :status, processedAt = :now, lastError = :error REMOVE pending'
+            expr_attr_values[':error'] = error
+        
+        self.outbox_table.update_item(
+            Key={'id': record_id},
+            UpdateExpression=update_expr,
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues=expr_attr_values
+        )
+    
+    def reschedule_outbox_record(self, record_id: str, delay_seconds: float, error: str):
+        """Schedule a failed outbox record for another attempt"""
+        self.outbox_table.update_item(
+            Key={'id': record_id},
+            UpdateExpression='SET availableAt = :next, lastError = :error',
+            ExpressionAttributeValues={
+                ':next': self._outbox_timestamp(delay_seconds),
+                ':error': error
+            }
+        )
+    
+    # User operations
+    def create_user(self, user: dict) -> dict:
+        """
+        Create a user, enforcing unique sub and email
+        
+        The user item and an EMAIL#<email> sentinel item are written in one
+        transaction, so a duplicate email is rejected without a lookup.
+        """
+        email_sentinel = {
+            'sub': f"{self.EMAIL_SENTINEL_PREFIX}{user['email']}",
+            'userSub': user['sub']
+        }
+        client = self.dynamodb.meta.client
+        
+        try:
+            client.transact_write_items(
+                TransactItems=[
+                    {
+                        'Put': {
+                            'TableName': self.users_table_name,
+                            'Item': self._to_attribute_values(user),
+                            'ConditionExpression': 'attribute_not_exists(#sub)',
+                            'ExpressionAttributeNames': {'#sub': 'sub'}
+                        }
+                    },
+                    {
+                        'Put': {
+                            'TableName': self.users_table_name,
+                            'Item': self._to_attribute_values(email_sentinel),
+                            'ConditionExpression': 'attribute_not_exists(#sub)',
+                            'ExpressionAttributeNames': {'#sub': 'sub'}
+                        }
+                    }
+                ]
+            )
+            return user
+        except client.exceptions.TransactionCanceledException as e:
+            codes = self._cancellation_codes(e)
+            if len(codes) > 1 and codes[1] == 'ConditionalCheckFailed':
+                raise ValueError(f"User with email {user['email']} already exists")
+            if codes and codes[0] == 'ConditionalCheckFailed':
+                raise ValueError(f"User with ID {user['sub']} already exists")
+            raise ValueError(f"Failed to register user: {str(e)}")
+        except Exception as e:
+            raise ValueError(f"Failed to register user: {str(e)}")
+    
+    def get_user(self, user_id: str) -> Optional[dict]:
+        """Get user by sub"""
+        try:
+            response = self.users_table.get_item(Key={'sub': user_id})
+            if 'Item' in response:
+                return self._dynamodb_to_python_obj(response['Item'])
+            return None
+        except Exception as e:
+            print(f"Error getting user {user_id}: {str(e)}")
+            return None
+    
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        """
+        Get user by email through the email index
+        
+        Falls back to a paginated scan for tables created without the index.
+        """
+        try:
+            try:
+                response = self.users_table.query(
+                    IndexName=self.USERS_EMAIL_INDEX,
+                    KeyConditionExpression=Key('email').eq(email),
+                    Limit=1
+                )
+                items = response.get('Items', [])
+            except ClientError as e:
+                if not self._is_missing_index_error(e):
+                    raise
+                # Table was created without email-index
+                # (run: python init_dynamodb_tables.py --migrate)
+                items = self._scan_all(self.users_table, FilterExpression=Attr('email').eq(email))
+            
+            return self._dynamodb_to_python_obj(items[0]) if items else None
+        except Exception as e:
+            print(f"Error getting user by email: {str(e)}")
+            return None
+    
+    def add_user_to_group(self, user_id: str, group: str) -> bool:
+        """Add a user to a group, returning False if the user does not exist"""
+        user = self.get_user(user_id)
+        if not user:
+            return False
+        
+        groups = user.get('groups', [])
+        if group not in groups:
+            groups.append(group)
+            self.users_table.update_item(
+                Key={'sub': user_id},
+                UpdateExpression='SET groups = :groups',
+                ExpressionAttributeValues={':groups': groups}
+            )
+        return True
+    
+    def update_user_password(self, user_id: str, password_hash: str) -> bool:
+        """Replace a user's password hash, returning False if the user does not exist"""
+        try:
+            self.users_table.update_item(
+                Key={'sub': user_id},
+                UpdateExpression='SET password_hash = :hash',
+                ConditionExpression='attribute_exists(#sub)',
+                ExpressionAttributeNames={'#sub': 'sub'},
+                ExpressionAttributeValues={':hash': password_hash}
+            )
+            return True
+        except self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+    
+    def list_users(self, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Get one page of users, skipping email sentinel items"""
+        return self._read_page(self.users_table.scan, limit, cursor, self.USERS_SCAN_CURSOR,
+                               FilterExpression=Attr('email').exists())
+    
+    def has_users(self) -> bool:
+        """Check whether any user exists"""
+        response = self.users_table.scan(Limit=1)
+        return bool(response.get('Items'))
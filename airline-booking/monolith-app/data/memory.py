@@ -0,0 +1,424 @@
+"""
+In-memory storage engine
+Thread-safe, process-local storage with the same semantics as the DynamoDB
+engine, for load testing the web and service layers and for local runs
+"""
+import copy
+import itertools
+import threading
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from data.base import SCHEDULE_FIELDS, StorageBackend
+
+
+class InMemoryStorage(StorageBackend):
+    """In-memory data storage for flights, bookings, loyalty points, payments and users"""
+    
+    # Listings page by offset into an append-only sequence
+    OFFSET_CURSOR = {'offset': int}
+    
+    def __init__(self, load_sample_data: bool = True):
+        # One lock serializes all writes, which gives conditional updates and
+        # multi-item "transactions" the same atomicity as DynamoDB
+        self._lock = threading.RLock()
+        
+        self._flights: Dict[str, dict] = {}
+        self._flights_by_route: Dict[str, set] = {}
+        self._bookings: Dict[str, dict] = {}
+        self._bookings_by_customer: Dict[str, List[str]] = {}
+        self._loyalty_ledger: Dict[str, dict] = {}
+        self._loyalty_balances: Dict[str, int] = {}
+        self._payments: Dict[str, dict] = {}
+        self._refunds: Dict[str, dict] = {}
+        self._outbox: Dict[str, dict] = {}
+        self._users: Dict[str, dict] = {}
+        self._users_by_email: Dict[str, str] = {}
+        
+        if load_sample_data:
+            self.seed_sample_data()
+    
+    # Flight operations
+    def put_flight(self, flight: dict) -> dict:
+        """Create or replace a flight, maintaining its route index key"""
+        flight = dict(flight)
+        flight['routeDate'] = self._route_key(
+            flight['departureAirportCode'],
+            flight['arrivalAirportCode'],
+            flight['departureDate']
+        )
+        
+        with self._lock:
+            previous = self._flights.get(flight['id'])
+            if previous is not None and previous.get('seatShards'):
+                # Replacing a sharded flight would orphan its seat buckets
+                raise ValueError(f"Flight {flight['id']} has sharded seats and cannot be replaced")
+            if previous is not None:
+                self._flights_by_route.get(previous['routeDate'], set()).discard(flight['id'])
+            self._flights[flight['id']] = flight
+            self._flights_by_route.setdefault(flight['routeDate'], set()).add(flight['id'])
+        
+        return dict(flight)
+    
+    def put_flights(self, flights: List[dict]) -> int:
+        """Create or replace many flights"""
+        for flight in flights:
+            self.put_flight(flight)
+        return len(flights)
+    
+    def get_flight(self, flight_id: str) -> Optional[dict]:
+        """Get flight by ID"""
+        flight = self._flights.get(flight_id)
+        return dict(flight) if flight else None
+    
+    def get_flights(self, flight_ids: List[str]) -> Dict[str, dict]:
+        """Get several flights by ID, keyed by ID; unknown IDs are left out"""
+        with self._lock:
+            return {flight_id: dict(self._flights[flight_id])
+                    for flight_id in set(flight_ids) if flight_id in self._flights}
+    
+    def get_flights_by_schedule(self, departure_code: str, arrival_code: str,
+                                departure_date: str) -> List[dict]:
+        """Get flights matching schedule criteria"""
+        route_key = self._route_key(departure_code, arrival_code, departure_date)
+        with self._lock:
+            flight_ids = list(self._flights_by_route.get(route_key, ()))
+            return [dict(self._flights[flight_id]) for flight_id in flight_ids]
+    
+    def list_flight_schedules(self, departing_from: str) -> List[dict]:
+        """Get the schedule of every flight departing on or after a date"""
+        with self._lock:
+            return [{field: flight.get(field) for field in SCHEDULE_FIELDS}
+                    for flight in self._flights.values() if flight['departureDate'] >= departing_from]
+    
+    def _reserve_seat_locked(self, flight_id: str):
+        flight = self._flights.get(flight_id)
+        if flight is None or flight['seatCapacity'] <= 0:
+            raise ValueError(f"Flight {flight_id} is fully booked or does not exist")
+        flight['seatCapacity'] -= 1
+    
+    def _release_seats_locked(self, flight_id: str, count: int):
+        flight = self._flights.get(flight_id)
+        if flight is None or flight['seatCapacity'] + count > flight['maximumSeating']:
+            if count == 1:
+                raise ValueError(f"Cannot release seat on flight {flight_id}: "
+                                 f"flight does not exist or is already at maximum capacity")
+            raise ValueError(f"Cannot release {count} seats on flight {flight_id}, "
+                             f"would exceed maximum capacity")
+        flight['seatCapacity'] += count
+    
+    def reserve_flight_seat(self, flight_id: str) -> bool:
+        """Decrease available seat capacity"""
+        with self._lock:
+            self._reserve_seat_locked(flight_id)
+        return True
+    
+    def release_flight_seat(self, flight_id: str) -> bool:
+        """Increase available seat capacity"""
+        with self._lock:
+            self._release_seats_locked(flight_id, 1)
+        return True
+    
+    def release_flight_seats(self, flight_id: str, count: int) -> bool:
+        """Release several seats on a flight at once"""
+        if count <= 0:
+            raise ValueError("Seat count must be a positive number")
+        with self._lock:
+            self._release_seats_locked(flight_id, count)
+        return True
+    
+    def shard_flight_seats(self, flight_id: str, shards: int) -> dict:
+        """
+        Record a seat shard count for a flight
+        
+        Every write here is serialized by one lock, so there is no contention
+        to spread: the flight keeps its single counter, which always equals
+        the sum its buckets would hold.
+        """
+        with self._lock:
+            flight = self._flights.get(flight_id)
+            self._check_seat_shards(flight, flight_id, shards)
+            flight['seatShards'] = shards
+            return dict(flight)
+    
+    # Booking operations
+    def _put_booking_locked(self, booking: dict):
+        self._bookings[booking['id']] = booking
+        self._bookings_by_customer.setdefault(booking['customer'], []).append(booking['id'])
+    
+    def create_booking(self, booking_data: dict) -> dict:
+        """Create a new booking"""
+        booking = self._new_booking(booking_data)
+        with self._lock:
+            self._put_booking_locked(booking)
+        return dict(booking)
+    
+    def reserve_and_create_booking(self, booking_data: dict) -> dict:
+        """Reserve a flight seat and create an UNCONFIRMED booking atomically"""
+        booking = self._new_booking(booking_data)
+        with self._lock:
+            self._reserve_seat_locked(booking_data['outboundFlightId'])
+            self._put_booking_locked(booking)
+        return dict(booking)
+    
+    def cancel_and_release_booking(self, booking_id: str, flight_id: str) -> bool:
+        """Cancel a booking and release its flight seat atomically"""
+        with self._lock:
+            booking = self._bookings.get(booking_id)
+            if booking is None or booking['status'] == 'CANCELLED':
+                raise ValueError(f"Booking {booking_id} not found or already cancelled")
+            
+            flight = self._flights.get(flight_id)
+            if flight is None or flight['seatCapacity'] >= flight['maximumSeating']:
+                raise ValueError(f"Cannot release seat, already at maximum capacity")
+            
+            booking['status'] = 'CANCELLED'
+            flight['seatCapacity'] += 1
+        return True
+    
+    def get_booking(self, booking_id: str) -> Optional[dict]:
+        """Get booking by ID"""
+        booking = self._bookings.get(booking_id)
+        return dict(booking) if booking else None
+    
+    def update_booking_status(self, booking_id: str, status: str,
+                              booking_reference: Optional[str] = None) -> dict:
+        """Update booking status"""
+        with self._lock:
+            booking = self._bookings.get(booking_id)
+            if booking is None:
+                raise ValueError(f"Booking {booking_id} not found")
+            
+            booking['status'] = status
+            if booking_reference:
+                booking['bookingReference'] = booking_reference
+            return dict(booking)
+    
+    def confirm_booking_with_outbox(self, booking_id: str, booking_reference: str,
+                                    events: List[dict]) -> bool:
+        """Confirm a booking and enqueue its follow-up events atomically"""
+        now = self._outbox_timestamp()
+        
+        with self._lock:
+            booking = self._bookings.get(booking_id)
+            if booking is None:
+                raise ValueError(f"Booking {booking_id} not found")
+            if any(event['id'] in self._outbox for event in events):
+                raise ValueError(f"Failed to confirm booking: outbox records already exist")
+            
+            booking['status'] = 'CONFIRMED'
+            booking['bookingReference'] = booking_reference
+            for event in events:
+                self._outbox[event['id']] = {
+                    'id': event['id'],
+                    'eventType': event['eventType'],
+                    'payload': copy.deepcopy(event['payload']),
+                    'status': 'PENDING',
+                    'pending': 'PENDING',
+                    'attempts': 0,
+                    'availableAt': now,
+                    'createdAt': now
+                }
+        return True
+    
+    def get_bookings_by_customer(self, customer_id: str, status: Optional[str] = None) -> List[dict]:
+        """Get bookings for a customer, optionally filtered by status"""
+        with self._lock:
+            bookings = [self._bookings[booking_id]
+                        for booking_id in self._bookings_by_customer.get(customer_id, [])]
+            return [dict(booking) for booking in bookings
+                    if not status or booking['status'] == status]
+    
+    def get_bookings_page(self, customer_id: str, status: Optional[str] = None,
+                          limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Get one page of a customer's bookings, optionally filtered by status"""
+        # A customer's booking list is append-only, so an offset is a stable position
+        offset = self._decode_cursor(cursor, self.OFFSET_CURSOR)['offset'] if cursor else 0
+        page = []
+        
+        with self._lock:
+            booking_ids = self._bookings_by_customer.get(customer_id, [])
+            while offset < len(booking_ids) and len(page) < limit:
+                booking = self._bookings[booking_ids[offset]]
+                offset += 1
+                if not status or booking['status'] == status:
+                    page.append(dict(booking))
+            
+            next_cursor = self._encode_cursor({'offset': offset}) if offset < len(booking_ids) else None
+        return page, next_cursor
+    
+    # Loyalty operations
+    def add_loyalty_points(self, customer_id: str, points: int,
+                           idempotency_key: Optional[str] = None) -> dict:
+        """Add loyalty points for a customer"""
+        loyalty_id = f"ACCRUAL#{idempotency_key}" if idempotency_key else str(uuid.uuid4())
+        loyalty_entry = {
+            'id': loyalty_id,
+            'customerId': customer_id,
+            'points': points,
+            'flag': 'active',
+            'date': datetime.now().isoformat()
+        }
+        
+        with self._lock:
+            if loyalty_id in self._loyalty_ledger:
+                if idempotency_key:
+                    # Accrual was already applied
+                    return dict(self._loyalty_ledger[loyalty_id])
+                raise ValueError(f"Failed to add loyalty points: duplicate entry {loyalty_id}")
+            
+            self._loyalty_ledger[loyalty_id] = loyalty_entry
+            self._loyalty_balances[customer_id] = self._loyalty_balances.get(customer_id, 0) + points
+        
+        return dict(loyalty_entry)
+    
+    def get_loyalty_points(self, customer_id: str) -> int:
+        """Get total active loyalty points for a customer"""
+        return self._loyalty_balances.get(customer_id, 0)
+    
+    def sum_loyalty_ledger(self, customer_id: str) -> int:
+        """Sum active loyalty ledger entries for a customer"""
+        with self._lock:
+            return sum(entry['points'] for entry in self._loyalty_ledger.values()
+                       if entry['customerId'] == customer_id and entry['flag'] == 'active')
+    
+    def reconcile_loyalty_balances(self) -> Dict[str, int]:
+        """Recompute every customer's balance from the loyalty ledger"""
+        balances: Dict[str, int] = {}
+        with self._lock:
+            for entry in self._loyalty_ledger.values():
+                if entry['flag'] == 'active':
+                    customer_id = entry['customerId']
+                    balances[customer_id] = balances.get(customer_id, 0) + entry['points']
+            self._loyalty_balances = dict(balances)
+        return balances
+    
+    # Payment operations
+    def put_payment(self, payment: dict) -> dict:
+        """Create or replace a payment record, keyed by its chargeId"""
+        with self._lock:
+            self._payments[payment['chargeId']] = dict(payment)
+        return payment
+    
+    def get_payment(self, charge_id: str) -> Optional[dict]:
+        """Get payment record by charge ID"""
+        payment = self._payments.get(charge_id)
+        return dict(payment) if payment else None
+    
+    def mark_payment_refunded(self, charge_id: str) -> bool:
+        """Set a payment's status to refunded, returning False if it is not stored"""
+        with self._lock:
+            payment = self._payments.get(charge_id)
+            if payment is None:
+                return False
+            payment['status'] = 'refunded'
+        return True
+    
+    def record_refund(self, refund_key: str, refund: dict) -> dict:
+        """Store a refund under its idempotency key, or return the one already stored"""
+        with self._lock:
+            existing = self._refunds.setdefault(refund_key, dict(refund))
+            return dict(existing)
+    
+    def get_refund(self, refund_key: str) -> Optional[dict]:
+        """Get a refund by its idempotency key"""
+        refund = self._refunds.get(refund_key)
+        return dict(refund) if refund else None
+    
+    # Outbox operations
+    def get_due_outbox_records(self, limit: int) -> List[dict]:
+        """Get pending outbox records whose retry time has come, oldest first"""
+        now = self._outbox_timestamp()
+        with self._lock:
+            due = [record for record in self._outbox.values()
+                   if 'pending' in record and record['availableAt'] <= now]
+            due.sort(key=lambda record: record['availableAt'])
+            return [copy.deepcopy(record) for record in due[:limit]]
+    
+    def claim_outbox_record(self, record: dict, lease_seconds: float) -> Optional[dict]:
+        """Claim an outbox record for processing, or return None if already claimed"""
+        with self._lock:
+            current = self._outbox.get(record['id'])
+            if (current is None or 'pending' not in current
+                    or current['availableAt'] != record['availableAt']):
+                return None
+            
+            current['availableAt'] = self._outbox_timestamp(lease_seconds)
+            current['attempts'] += 1
+            return copy.deepcopy(current)
+    
+    def complete_outbox_record(self, record_id: str, status: str = 'DONE',
+                               error: Optional[str] = None):
+        """Mark an outbox record finished (DONE or FAILED)"""
+        with self._lock:
+            record = self._outbox[record_id]
+            record['status'] = status
+            record['processedAt'] = self._outbox_timestamp()
+            record.pop('pending', None)
+            if error:
+                record['lastError'] = error
+    
+    def reschedule_outbox_record(self, record_id: str, delay_seconds: float, error: str):
+        """Schedule a failed outbox record for another attempt"""
+        with self._lock:
+            record = self._outbox[record_id]
+            record['availableAt'] = self._outbox_timestamp(delay_seconds)
+            record['lastError'] = error
+    
+    # User operations
+    def create_user(self, user: dict) -> dict:
+        """Create a user, enforcing unique sub and email"""
+        with self._lock:
+            if user['email'] in self._users_by_email:
+                raise ValueError(f"User with email {user['email']} already exists")
+            if user['sub'] in self._users:
+                raise ValueError(f"User with ID {user['sub']} already exists")
+            
+            self._users[user['sub']] = copy.deepcopy(user)
+            self._users_by_email[user['email']] = user['sub']
+        return user
+    
+    def get_user(self, user_id: str) -> Optional[dict]:
+        """Get user by sub"""
+        user = self._users.get(user_id)
+        return copy.deepcopy(user) if user else None
+    
+    def get_user_by_email(self, email: str) -> Optional[dict]:
+        """Get user by email"""
+        with self._lock:
+            user_id = self._users_by_email.get(email)
+            return copy.deepcopy(self._users[user_id]) if user_id else None
+    
+    def add_user_to_group(self, user_id: str, group: str) -> bool:
+        """Add a user to a group, returning False if the user does not exist"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return False
+            if group not in user['groups']:
+                user['groups'].append(group)
+        return True
+    
+    def update_user_password(self, user_id: str, password_hash: str) -> bool:
+        """Replace a user's password hash, returning False if the user does not exist"""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return False
+            user['password_hash'] = password_hash
+        return True
+    
+    def list_users(self, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Get one page of users"""
+        # Users are never deleted, so insertion order gives stable offsets
+        offset = self._decode_cursor(cursor, self.OFFSET_CURSOR)['offset'] if cursor else 0
+        
+        with self._lock:
+            users = list(itertools.islice(self._users.values(), offset, offset + limit))
+            end = offset + len(users)
+            next_cursor = self._encode_cursor({'offset': end}) if end < len(self._users) else None
+            return [copy.deepcopy(user) for user in users], next_cursor
+    
+    def has_users(self) -> bool:
+        """Check whether any user exists"""
+        return bool(self._users)
@@ -0,0 +1,308 @@
+"""
+Fake payment gateway
+A local stand-in for the parts of the Stripe API used by the payment
+service, with configurable latency and failure injection, for measuring
+tail latency and retry behaviour under load
+
+Usage:
+    python fake_payment_gateway.py [--port 12111] [--latency-ms 80] [--failure-rate 0.05]
+
+Then run the application against it:
+    STRIPE_SECRET_KEY=sk_test_fake STRIPE_API_BASE=http://localhost:12111 python run.py
+"""
+import argparse
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+DEFAULT_AMOUNT = 15000  # $150.00 in cents
+
+
+class FakeGateway:
+    """In-memory Stripe objects plus latency and failure injection"""
+    
+    def __init__(self, latency_ms: float = 80, latency_sigma: float = 0.5,
+                 failure_rate: float = 0.0, timeout_rate: float = 0.0,
+                 timeout_seconds: float = 30):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        
+        self._lock = threading.Lock()
+        self._charges = {}
+        self._payment_intents = {}
+        self._idempotent_responses = {}
+        self.stats = {
+            'requests': 0,
+            'injected_failures': 0,
+            'injected_timeouts': 0,
+            'idempotent_replays': 0,
+            'captures': 0,
+            'refunds': 0
+        }
+    
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+    
+    def simulate_network(self) -> str:
+        """
+        Sleep for a log-normally distributed latency and maybe inject a fault
+        
+        Returns:
+            'ok', 'failure' (respond 500) or 'timeout' (respond after the
+            client has given up)
+        """
+        self._count('requests')
+        time.sleep(random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000)
+        
+        roll = random.random()
+        if roll < self.timeout_rate:
+            self._count('injected_timeouts')
+            time.sleep(self.timeout_seconds)
+            return 'timeout'
+        if roll < self.timeout_rate + self.failure_rate:
+            self._count('injected_failures')
+            return 'failure'
+        return 'ok'
+    
+    def replay(self, key: str):
+        """Return the stored response for an idempotency key, if any"""
+        with self._lock:
+            response = self._idempotent_responses.get(key)
+        if response is not None:
+            self._count('idempotent_replays')
+        return response
+    
+    def remember(self, key: str, response: tuple):
+        """Store the response for an idempotency key"""
+        with self._lock:
+            self._idempotent_responses[key] = response
+    
+    # Stripe objects
+    def _new_charge(self, amount: int, currency: str = 'usd', charge_id: str = None) -> dict:
+        charge_id = charge_id or f"ch_{secrets.token_hex(12)}"
+        charge = {
+            'id': charge_id,
+            'object': 'charge',
+            'amount': amount,
+            'amount_refunded': 0,
+            'currency': currency,
+            'captured': True,
+            'refunded': False,
+            'status': 'succeeded',
+            'receipt_url': f"https://pay.example.com/receipts/{charge_id}"
+        }
+        self._charges[charge_id] = charge
+        return charge
+    
+    def _payment_intent(self, payment_intent_id: str) -> dict:
+        # Any pi_ ID is treated as an existing, authorized PaymentIntent
+        if payment_intent_id not in self._payment_intents:
+            self._payment_intents[payment_intent_id] = {
+                'id': payment_intent_id,
+                'object': 'payment_intent',
+                'amount': DEFAULT_AMOUNT,
+                'currency': 'usd',
+                'status': 'requires_capture',
+                'latest_charge': None
+            }
+        return self._payment_intents[payment_intent_id]
+    
+    def capture_payment_intent(self, payment_intent_id: str) -> tuple:
+        with self._lock:
+            intent = self._payment_intent(payment_intent_id)
+            if intent['status'] != 'requires_capture':
+                return 400, invalid_request(
+                    f"This PaymentIntent could not be captured because it has a status of {intent['status']}."
+                )
+            intent['latest_charge'] = self._new_charge(intent['amount'])['id']
+            intent['status'] = 'succeeded'
+            self.stats['captures'] += 1
+            return 200, dict(intent)
+    
+    def get_payment_intent(self, payment_intent_id: str) -> tuple:
+        with self._lock:
+            return 200, dict(self._payment_intent(payment_intent_id))
+    
+    def capture_charge(self, charge_id: str) -> tuple:
+        with self._lock:
+            charge = self._charges.get(charge_id)
+            if charge is None:
+                # Treat unknown ch_ IDs as authorized charges
+                charge = self._new_charge(DEFAULT_AMOUNT, charge_id=charge_id)
+            self.stats['captures'] += 1
+            return 200, dict(charge)
+    
+    def create_charge(self, params: dict) -> tuple:
+        with self._lock:
+            charge = self._new_charge(int(params.get('amount', DEFAULT_AMOUNT)),
+                                      params.get('currency', 'usd'))
+            self.stats['captures'] += 1
+            return 200, dict(charge)
+    
+    def get_charge(self, charge_id: str) -> tuple:
+        with self._lock:
+            charge = self._charges.get(charge_id)
+            if charge is None:
+                return 404, invalid_request(f"No such charge: '{charge_id}'", code='resource_missing')
+            return 200, dict(charge)
+    
+    def create_refund(self, params: dict) -> tuple:
+        charge_id = params.get('charge', '')
+        with self._lock:
+            charge = self._charges.get(charge_id)
+            if charge is None:
+                return 404, invalid_request(f"No such charge: '{charge_id}'", code='resource_missing')
+            if charge['refunded']:
+                return 400, invalid_request(f"Charge {charge_id} has already been refunded.",
+                                            code='charge_already_refunded')
+            charge['refunded'] = True
+            charge['amount_refunded'] = charge['amount']
+            self.stats['refunds'] += 1
+            return 200, {
+                'id': f"re_{secrets.token_hex(12)}",
+                'object': 'refund',
+                'amount': charge['amount'],
+                'charge': charge_id,
+                'currency': charge['currency'],
+                'status': 'succeeded'
+            }
+
+
+def invalid_request(message: str, code: str = None) -> dict:
+    """Stripe-style invalid request error body"""
+    error = {'type': 'invalid_request_error', 'message': message}
+    if code:
+        error['code'] = code
+    return {'error': error}
+
+
+ROUTES = [
+    ('POST', re.compile(r'^/v1/payment_intents/([^/]+)/capture$'),
+     lambda gateway, match, params: gateway.capture_payment_intent(match.group(1))),
+    ('GET', re.compile(r'^/v1/payment_intents/([^/]+)$'),
+     lambda gateway, match, params: gateway.get_payment_intent(match.group(1))),
+    ('POST', re.compile(r'^/v1/charges/([^/]+)/capture$'),
+     lambda gateway, match, params: gateway.capture_charge(match.group(1))),
+    ('POST', re.compile(r'^/v1/charges$'),
+     lambda gateway, match, params: gateway.create_charge(params)),
+    ('GET', re.compile(r'^/v1/charges/([^/]+)$'),
+     lambda gateway, match, params: gateway.get_charge(match.group(1))),
+    ('POST', re.compile(r'^/v1/refunds$'),
+     lambda gateway, match, params: gateway.create_refund(params)),
+]
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    """Routes Stripe-style requests to the shared FakeGateway"""
+    
+    gateway: FakeGateway = None
+    
+    def do_GET(self):
+        self._handle('GET')
+    
+    def do_POST(self):
+        self._handle('POST')
+    
+    def _handle(self, method: str):
+        path = self.path.split('?')[0]
+        
+        if path == '/__stats':
+            with self.gateway._lock:
+                return self._send(200, dict(self.gateway.stats))
+        
+        outcome = self.gateway.simulate_network()
+        if outcome == 'failure':
+            return self._send(500, {'error': {'type': 'api_error',
+                                              'message': 'Injected gateway failure'}})
+        
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        params = {key: values[0] for key, values in parse_qs(body).items()}
+        
+        key = self.headers.get('Idempotency-Key')
+        if key and method == 'POST':
+            key = f"{path}#{key}"
+            response = self.gateway.replay(key)
+            if response is not None:
+                return self._send(*response, replayed=True)
+        
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                status, payload = handler(self.gateway, match, params)
+                if key and method == 'POST':
+                    self.gateway.remember(key, (status, payload))
+                return self._send(status, payload)
+        
+        self._send(404, invalid_request(f"Unrecognized request URL ({method}: {path})"))
+    
+    def _send(self, status: int, payload: dict, replayed: bool = False):
+        data = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('Request-Id', f"req_{secrets.token_hex(8)}")
+            if replayed:
+                self.send_header('Idempotent-Replayed', 'true')
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client timed out and went away
+            pass
+    
+    def log_message(self, format, *args):
+        # Keep load runs quiet
+        pass
+
+
+def create_server(port: int, gateway: FakeGateway) -> ThreadingHTTPServer:
+    """Create a threaded server for the gateway (call serve_forever to run)"""
+    handler = type('BoundGatewayHandler', (GatewayHandler,), {'gateway': gateway})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake Stripe-compatible payment gateway')
+    parser.add_argument('--port', type=int, default=12111, help='Port to listen on (default: 12111)')
+    parser.add_argument('--latency-ms', type=float, default=80, help='Median response latency (default: 80)')
+    parser.add_argument('--latency-sigma', type=float, default=0.5,
+                        help='Log-normal spread of latency; higher means a longer tail (default: 0.5)')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with HTTP 500 (default: 0)')
+    parser.add_argument('--timeout-rate', type=float, default=0.0,
+                        help='Fraction of requests that hang past the client timeout (default: 0)')
+    parser.add_argument('--timeout-seconds', type=float, default=30,
+                        help='How long a hanging request takes (default: 30)')
+    args = parser.parse_args()
+    
+    gateway = FakeGateway(args.latency_ms, args.latency_sigma, args.failure_rate,
+                          args.timeout_rate, args.timeout_seconds)
+    server = create_server(args.port, gateway)
+    
+    print(f"Fake payment gateway listening on http://127.0.0.1:{args.port}")
+    print(f"  latency {args.latency_ms} ms (sigma {args.latency_sigma}), "
+          f"failures {args.failure_rate:.0%}, timeouts {args.timeout_rate:.0%}")
+    print(f"  stats: http://127.0.0.1:{args.port}/__stats")
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -57,8 +57,10 @@ export const API = {
     getCurrentUser: () => 
       apiClient.get('/auth/me'),
     
-    listUsers: () => 
-      apiClient.get('/auth/users')
+    listUsers: (limit, cursor) => 
+      apiClient.get('/auth/users', {
+        params: { limit, cursor }
+      })
   },
 
   // Flight catalog endpoints
@@ -71,6 +73,9 @@ export const API = {
     getById: (flightId) => 
       apiClient.get(`/flights/${flightId}`),
     
+    getBatch: (ids) => 
+      apiClient.post('/flights/batch', { ids }),
+    
     reserve: (flightId) => 
       apiClient.post(`/flights/${flightId}/reserve`),
     
@@ -92,9 +97,9 @@ export const API = {
     cancel: (bookingId) => 
       apiClient.post(`/bookings/${bookingId}/cancel`),
     
-    getByCustomer: (customerId, status) => 
+    getByCustomer: (customerId, status, cursor) => 
       apiClient.get(`/customers/${customerId}/bookings`, {
-        params: status ? { status } : {}
+        params: { status, cursor, expand: 'flight' }
       })
   },
 
@@ -45,7 +45,11 @@ export async function fetchBooking(
     console.log("Fetching booking data");
     console.log({ customerId, status: "CONFIRMED" });
     
-    const response = await API.bookings.getByCustomer(customerId, "CONFIRMED");
+    const response = await API.bookings.getByCustomer(
+      customerId,
+      "CONFIRMED",
+      paginationToken || undefined
+    );
     const bookingData = response.data.bookings || [];
 
     let bookings = bookingData.map(booking => new Booking(booking));
@@ -53,7 +57,7 @@ export async function fetchBooking(
     console.log(bookings);
 
     commit("SET_BOOKINGS", bookings);
-    commit("SET_BOOKING_PAGINATION", null); // Pagination handled differently in REST
+    commit("SET_BOOKING_PAGINATION", response.data.nextCursor || "");
 
     Loading.hide();
     console.groupEnd();
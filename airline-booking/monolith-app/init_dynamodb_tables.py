@@ -6,6 +6,27 @@ import boto3
 import os
 import sys
 
+from data.base import StorageBackend
+
+
+# Flight search index: routeDate is "<departureCode>#<arrivalCode>#<YYYY-MM-DD>"
+FLIGHT_ROUTE_INDEX = {
+    'IndexName': 'route-date-index',
+    'KeySchema': [
+        {'AttributeName': 'routeDate', 'KeyType': 'HASH'}
+    ],
+    'Projection': {'ProjectionType': 'ALL'}
+}
+
+# User login index; email uniqueness is enforced by EMAIL#<email> sentinel items
+USERS_EMAIL_INDEX = {
+    'IndexName': 'email-index',
+    'KeySchema': [
+        {'AttributeName': 'email', 'KeyType': 'HASH'}
+    ],
+    'Projection': {'ProjectionType': 'ALL'}
+}
+
 
 def create_tables(region='us-east-1', stage='dev'):
     """
@@ -22,6 +43,8 @@ def create_tables(region='us-east-1', stage='dev'):
     booking_table = f'Airline-Booking-{stage}'
     loyalty_table = f'Airline-Loyalty-{stage}'
     users_table = f'Airline-Users-{stage}'
+    outbox_table = f'Airline-Outbox-{stage}'
+    payments_table = f'Airline-Payments-{stage}'
     
     tables_to_create = []
     
@@ -43,8 +66,10 @@ def create_tables(region='us-east-1', stage='dev'):
                     {'AttributeName': 'id', 'KeyType': 'HASH'}
                 ],
                 'AttributeDefinitions': [
-                    {'AttributeName': 'id', 'AttributeType': 'S'}
+                    {'AttributeName': 'id', 'AttributeType': 'S'},
+                    {'AttributeName': 'routeDate', 'AttributeType': 'S'}
                 ],
+                'GlobalSecondaryIndexes': [FLIGHT_ROUTE_INDEX],
                 'BillingMode': 'PAY_PER_REQUEST',
                 'Tags': [
                     {'Key': 'Application', 'Value': 'AirlineBooking'},
@@ -125,7 +150,63 @@ def create_tables(region='us-east-1', stage='dev'):
                     {'AttributeName': 'sub', 'KeyType': 'HASH'}
                 ],
                 'AttributeDefinitions': [
-                    {'AttributeName': 'sub', 'AttributeType': 'S'}
+                    {'AttributeName': 'sub', 'AttributeType': 'S'},
+                    {'AttributeName': 'email', 'AttributeType': 'S'}
+                ],
+                'GlobalSecondaryIndexes': [USERS_EMAIL_INDEX],
+                'BillingMode': 'PAY_PER_REQUEST',
+                'Tags': [
+                    {'Key': 'Application', 'Value': 'AirlineBooking'},
+                    {'Key': 'Stage', 'Value': stage}
+                ]
+            }
+        })
+    
+    # 5. Outbox Table (asynchronous booking follow-ups)
+    # The pending attribute only exists on unprocessed records, so the
+    # pending-index stays as small as the backlog
+    if outbox_table not in existing_tables:
+        tables_to_create.append({
+            'name': outbox_table,
+            'config': {
+                'TableName': outbox_table,
+                'KeySchema': [
+                    {'AttributeName': 'id', 'KeyType': 'HASH'}
+                ],
+                'AttributeDefinitions': [
+                    {'AttributeName': 'id', 'AttributeType': 'S'},
+                    {'AttributeName': 'pending', 'AttributeType': 'S'},
+                    {'AttributeName': 'availableAt', 'AttributeType': 'S'}
+                ],
+                'GlobalSecondaryIndexes': [
+                    {
+                        'IndexName': 'pending-index',
+                        'KeySchema': [
+                            {'AttributeName': 'pending', 'KeyType': 'HASH'},
+                            {'AttributeName': 'availableAt', 'KeyType': 'RANGE'}
+                        ],
+                        'Projection': {'ProjectionType': 'ALL'}
+                    }
+                ],
+                'BillingMode': 'PAY_PER_REQUEST',
+                'Tags': [
+                    {'Key': 'Application', 'Value': 'AirlineBooking'},
+                    {'Key': 'Stage', 'Value': stage}
+                ]
+            }
+        })
+    
+    # 6. Payments Table (payment records, plus refunds keyed REFUND#<idempotency key>)
+    if payments_table not in existing_tables:
+        tables_to_create.append({
+            'name': payments_table,
+            'config': {
+                'TableName': payments_table,
+                'KeySchema': [
+                    {'AttributeName': 'id', 'KeyType': 'HASH'}
+                ],
+                'AttributeDefinitions': [
+                    {'AttributeName': 'id', 'AttributeType': 'S'}
                 ],
                 'BillingMode': 'PAY_PER_REQUEST',
                 'Tags': [
@@ -168,6 +249,123 @@ def create_tables(region='us-east-1', stage='dev'):
     print(f"  export BOOKING_TABLE_NAME={booking_table}")
     print(f"  export LOYALTY_TABLE_NAME={loyalty_table}")
     print(f"  export USERS_TABLE_NAME={users_table}")
+    print(f"  export OUTBOX_TABLE_NAME={outbox_table}")
+    print(f"  export PAYMENTS_TABLE_NAME={payments_table}")
+
+
+def _ensure_index(dynamodb, table_name, index, attribute_definitions):
+    """
+    Create a global secondary index on an existing table if it is missing
+    
+    Returns:
+        True if the index exists or its creation was started
+    """
+    try:
+        description = dynamodb.describe_table(TableName=table_name)['Table']
+    except dynamodb.exceptions.ResourceNotFoundException:
+        print(f"  Table {table_name} does not exist, run without --migrate first")
+        return False
+    
+    index_names = [gsi['IndexName'] for gsi in description.get('GlobalSecondaryIndexes', [])]
+    if index['IndexName'] in index_names:
+        print(f"  ✓ Index {index['IndexName']} already exists")
+        return True
+    
+    try:
+        dynamodb.update_table(
+            TableName=table_name,
+            AttributeDefinitions=attribute_definitions,
+            GlobalSecondaryIndexUpdates=[
+                {'Create': index}
+            ]
+        )
+        print(f"  ✓ Index {index['IndexName']} creation started")
+        return True
+    except Exception as e:
+        print(f"  ✗ Error creating index {index['IndexName']}: {str(e)}")
+        return False
+
+
+def migrate_tables(region='us-east-1', stage='dev'):
+    """
+    Bring existing tables up to the current schema
+    
+    Adds indexes missing from tables created by older versions and backfills
+    the attributes and items those indexes rely on.
+    
+    Args:
+        region: AWS region
+        stage: Environment stage
+    """
+    dynamodb = boto3.client('dynamodb', region_name=region)
+    paginator = dynamodb.get_paginator('scan')
+    flight_table = f'Airline-Flight-{stage}'
+    users_table = f'Airline-Users-{stage}'
+    
+    # 1. Flight route index and routeDate keys
+    print(f"\nMigrating table: {flight_table}")
+    if _ensure_index(dynamodb, flight_table, FLIGHT_ROUTE_INDEX,
+                     [{'AttributeName': 'routeDate', 'AttributeType': 'S'}]):
+        updated = 0
+        pages = paginator.paginate(
+            TableName=flight_table,
+            FilterExpression='attribute_not_exists(routeDate)',
+            ProjectionExpression='id, departureAirportCode, arrivalAirportCode, departureDate'
+        )
+        
+        for page in pages:
+            for item in page.get('Items', []):
+                try:
+                    route_key = StorageBackend._route_key(
+                        item['departureAirportCode']['S'],
+                        item['arrivalAirportCode']['S'],
+                        item['departureDate']['S']
+                    )
+                except KeyError:
+                    print(f"  Skipping flight {item['id']['S']}: missing schedule attributes")
+                    continue
+                
+                dynamodb.update_item(
+                    TableName=flight_table,
+                    Key={'id': item['id']},
+                    UpdateExpression='SET routeDate = :route',
+                    ExpressionAttributeValues={':route': {'S': route_key}}
+                )
+                updated += 1
+        
+        print(f"  ✓ Backfilled routeDate on {updated} flight(s)")
+    
+    # 2. User email index and email uniqueness sentinels
+    print(f"\nMigrating table: {users_table}")
+    if _ensure_index(dynamodb, users_table, USERS_EMAIL_INDEX,
+                     [{'AttributeName': 'email', 'AttributeType': 'S'}]):
+        created = 0
+        pages = paginator.paginate(
+            TableName=users_table,
+            FilterExpression='attribute_exists(email)',
+            ProjectionExpression='#sub, email',
+            ExpressionAttributeNames={'#sub': 'sub'}
+        )
+        
+        for page in pages:
+            for item in page.get('Items', []):
+                try:
+                    dynamodb.put_item(
+                        TableName=users_table,
+                        Item={
+                            'sub': {'S': f"EMAIL#{item['email']['S']}"},
+                            'userSub': item['sub']
+                        },
+                        ConditionExpression='attribute_not_exists(#sub)',
+                        ExpressionAttributeNames={'#sub': 'sub'}
+                    )
+                    created += 1
+                except dynamodb.exceptions.ConditionalCheckFailedException:
+                    pass
+        
+        print(f"  ✓ Created {created} email sentinel item(s)")
+    
+    print("\nMigration complete. New indexes serve queries once they become ACTIVE.")
 
 
 def delete_tables(region='us-east-1', stage='dev'):
@@ -184,7 +382,9 @@ def delete_tables(region='us-east-1', stage='dev'):
         f'Airline-Flight-{stage}',
         f'Airline-Booking-{stage}',
         f'Airline-Loyalty-{stage}',
-        f'Airline-Users-{stage}'
+        f'Airline-Users-{stage}',
+        f'Airline-Outbox-{stage}',
+        f'Airline-Payments-{stage}'
     ]
     
     print("\n" + "="*60)
@@ -219,6 +419,8 @@ if __name__ == '__main__':
     parser.add_argument('--region', default='us-east-1', help='AWS region (default: us-east-1)')
     parser.add_argument('--stage', default='dev', help='Environment stage (default: dev)')
     parser.add_argument('--delete', action='store_true', help='Delete tables instead of creating')
+    parser.add_argument('--migrate', action='store_true',
+                        help='Add missing indexes and backfill index keys on existing tables')
     
     args = parser.parse_args()
     
@@ -230,6 +432,8 @@ if __name__ == '__main__':
     
     if args.delete:
         delete_tables(args.region, args.stage)
+    elif args.migrate:
+        migrate_tables(args.region, args.stage)
     else:
         create_tables(args.region, args.stage)
 
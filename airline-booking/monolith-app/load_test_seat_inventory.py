@@ -0,0 +1,115 @@
+"""
+Seat inventory load test
+Hammers one flight with concurrent reservations, as in a fare sale, with a
+single seat counter and with sharded seat buckets, and checks that no mode
+ever sells more seats than the flight has
+
+Runs against the configured storage engine. Contention only shows on
+DynamoDB; the in-memory engine serializes writes, so there it only checks
+correctness.
+
+Usage:
+    python load_test_seat_inventory.py [--seats 500] [--attempts 1000] [--concurrency 64] [--shards 1,8]
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Add current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from data.base import SAMPLE_FLIGHTS
+from data.storage import storage
+from services.catalog import CatalogService
+
+
+def run(shards: int, seats: int, attempts: int, concurrency: int, cancel_rate: float) -> bool:
+    """Sell one flight out under load and return whether the counts add up"""
+    flight_id = f"LOAD-{uuid.uuid4().hex[:8]}"
+    customer_id = f"load-test-{flight_id}"
+    CatalogService.put_flight({**SAMPLE_FLIGHTS[0], 'id': flight_id,
+                               'seatCapacity': seats, 'maximumSeating': seats})
+    if shards > 1:
+        CatalogService.shard_flight_seats(flight_id, shards)
+    
+    def reserve(_):
+        start = time.perf_counter()
+        try:
+            booking = storage.reserve_and_create_booking({
+                'outboundFlightId': flight_id,
+                'customerId': customer_id,
+                'chargeId': f"ch_{uuid.uuid4().hex}"
+            })
+            return time.perf_counter() - start, booking['id'], None
+        except ValueError as e:
+            return time.perf_counter() - start, None, str(e)
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(reserve, range(attempts)))
+    elapsed = time.perf_counter() - start
+    
+    booked = [booking_id for _, booking_id, _ in results if booking_id]
+    sold_out = sum(1 for _, _, error in results if error and 'fully booked' in error)
+    errors = [error for _, _, error in results if error and 'fully booked' not in error]
+    latencies = sorted(latency * 1000 for latency, booking_id, _ in results if booking_id)
+    
+    # Cancel some bookings concurrently to exercise the release path
+    cancelled = booked[:int(len(booked) * cancel_rate)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda booking_id: storage.cancel_and_release_booking(booking_id, flight_id),
+                          cancelled))
+    
+    remaining = storage.get_flight(flight_id)['seatCapacity']
+    active = [booking for booking in storage.get_bookings_by_customer(customer_id)
+              if booking['status'] != 'CANCELLED']
+    expected_remaining = seats - len(booked) + len(cancelled)
+    ok = (len(booked) <= seats and remaining == expected_remaining
+          and len(active) == len(booked) - len(cancelled))
+    
+    label = 'single counter' if shards <= 1 else f"{shards} shards"
+    print(f"\n{label} ({flight_id})")
+    print(f"  throughput      {attempts / elapsed:8.1f} reservations/sec")
+    if latencies:
+        print(f"  booked p50      {latencies[len(latencies) // 2]:8.1f} ms")
+        print(f"  booked p99      {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:8.1f} ms")
+    print(f"  booked          {len(booked):8d} of {seats} seats")
+    print(f"  sold out        {sold_out:8d}")
+    print(f"  errors          {len(errors):8d}")
+    for error in sorted(set(errors))[:3]:
+        print(f"    {error}")
+    print(f"  cancelled       {len(cancelled):8d}")
+    print(f"  seats left      {remaining:8d} (expected {expected_remaining})")
+    print(f"  active bookings {len(active):8d} (expected {len(booked) - len(cancelled)})")
+    print(f"  {'OK' if ok else 'FAILED'}: {'no overbooking' if ok else 'seat counts do not add up'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test seat reservations on one hot flight')
+    parser.add_argument('--seats', type=int, default=500, help='Seats on the flight (default: 500)')
+    parser.add_argument('--attempts', type=int, default=1000,
+                        help='Reservation attempts, more than seats to sell out (default: 1000)')
+    parser.add_argument('--concurrency', type=int, default=64, help='Concurrent callers (default: 64)')
+    parser.add_argument('--shards', default='1,8',
+                        help='Comma-separated bucket counts to compare, 1 = single counter (default: 1,8)')
+    parser.add_argument('--cancel-rate', type=float, default=0.1,
+                        help='Fraction of bookings cancelled afterwards (default: 0.1)')
+    args = parser.parse_args()
+    
+    print("="*60)
+    print(f"Seat inventory: {args.attempts} attempts on {args.seats} seats, "
+          f"concurrency {args.concurrency}, storage {os.environ.get('STORAGE_BACKEND', 'dynamodb')}")
+    print("="*60)
+    
+    results = [run(int(shards), args.seats, args.attempts, args.concurrency, args.cancel_rate)
+               for shards in args.shards.split(',')]
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -38,20 +38,8 @@ def check_config():
         print("Continuing with default configuration...\n")
         return True
 
-def main():
-    """Main entry point"""
-    print("\n" + "="*60)
-    print("Airline Booking Monolithic Application")
-    print("="*60 + "\n")
-    
-    if not check_dependencies():
-        sys.exit(1)
-    
-    print()
-    if not check_config():
-        print("\n✗ Configuration errors detected. Please fix them before starting.")
-        sys.exit(1)
-    
+def serve():
+    """Start the web application"""
     print("\nStarting application...")
     print("Server will be available at: http://localhost:5000")
     print("API documentation at: http://localhost:5000/api")
@@ -59,7 +47,8 @@ def main():
     
     # Import and run the app
     try:
-        from app import app
+        from app import app, start_background_workers
+        start_background_workers()
         app.run(host='0.0.0.0', port=5000, debug=True)
     except KeyboardInterrupt:
         print("\n\nShutting down application...")
@@ -70,6 +59,112 @@ def main():
         traceback.print_exc()
         sys.exit(1)
 
+def seed():
+    """Load sample flights and default users into storage"""
+    from app import seed_data
+    
+    print("\nSeeding sample data...")
+    flights_created = seed_data()
+    print(f"✓ Created {flights_created} sample flight(s), default users ensured")
+
+def reconcile_loyalty():
+    """Recompute materialized loyalty balances from the ledger"""
+    from data.storage import storage
+    
+    print("\nReconciling loyalty balances from ledger...")
+    balances = storage.reconcile_loyalty_balances()
+    print(f"✓ Reconciled {len(balances)} customer balance(s)")
+
+def shard_seats():
+    """Split the seat counters of hot flights into buckets"""
+    import argparse
+    from services.catalog import CatalogService
+    
+    parser = argparse.ArgumentParser(prog='run.py shard-seats',
+                                     description='Shard the seat counters of hot flights')
+    parser.add_argument('flight_ids', nargs='+', help='Flights to shard')
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('SEAT_SHARDS', '8')),
+                        help='Buckets per flight (default: SEAT_SHARDS or 8)')
+    args = parser.parse_args(sys.argv[2:])
+    
+    print(f"\nSharding seats into {args.shards} bucket(s)...")
+    for flight_id in args.flight_ids:
+        try:
+            flight = CatalogService.shard_flight_seats(flight_id, args.shards)
+            print(f"✓ {flight_id}: {flight['seatCapacity']} seat(s) over {args.shards} bucket(s)")
+        except ValueError as e:
+            print(f"✗ {flight_id}: {e}")
+
+def import_schedule():
+    """Bulk load flight schedules from a CSV or JSON Lines file"""
+    import argparse
+    from services.schedule_import import ScheduleImporter
+    
+    parser = argparse.ArgumentParser(prog='run.py import-schedule',
+                                     description='Import flight schedules from a .csv or .jsonl file')
+    parser.add_argument('path', help='Schedule file, one flight per row')
+    parser.add_argument('--workers', type=int, help='Writer threads (default: IMPORT_WORKERS or 4)')
+    parser.add_argument('--batch-size', type=int, help='Rows per batch (default: IMPORT_BATCH_SIZE or 500)')
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignore the checkpoint of an interrupted import and start over')
+    args = parser.parse_args(sys.argv[2:])
+    
+    try:
+        importer = ScheduleImporter(args.path, args.workers, args.batch_size)
+        print(f"\nImporting {args.path} with {importer.num_workers} worker(s), "
+              f"{importer.batch_size} row(s) per batch...")
+        stats = importer.run(restart=args.restart)
+    except (OSError, ValueError) as e:
+        print(f"\n✗ {e}")
+        print("Run the same command again to resume from the last checkpoint")
+        sys.exit(1)
+    
+    print(f"✓ Imported {stats['written']} flight(s), rejected {stats['rejected']} row(s) "
+          f"in {stats['elapsedSeconds']}s ({stats['rowsPerSecond']} rows/sec)")
+    if stats['rejected']:
+        print(f"  Rejected rows and reasons: {importer.rejects_path}")
+
+def outbox_worker():
+    """Drain the booking outbox in this process"""
+    from services.outbox import OutboxWorker
+    
+    worker = OutboxWorker()
+    print(f"\nDraining outbox with {worker.num_workers} worker thread(s)...")
+    print("Press Ctrl+C to stop\n")
+    worker.run_forever()
+
+COMMANDS = {
+    'serve': serve,
+    'seed': seed,
+    'reconcile-loyalty': reconcile_loyalty,
+    'shard-seats': shard_seats,
+    'import-schedule': import_schedule,
+    'outbox-worker': outbox_worker
+}
+
+def main():
+    """Main entry point"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Airline Booking Monolithic Application')
+    parser.add_argument('command', nargs='?', default='serve', choices=list(COMMANDS),
+                        help='Command to run (default: serve)')
+    # Commands such as shard-seats and import-schedule parse their own options
+    args, _ = parser.parse_known_args()
+    
+    print("\n" + "="*60)
+    print("Airline Booking Monolithic Application")
+    print("="*60 + "\n")
+    
+    if not check_dependencies():
+        sys.exit(1)
+    
+    print()
+    if not check_config():
+        print("\n✗ Configuration errors detected. Please fix them before starting.")
+        sys.exit(1)
+    
+    COMMANDS[args.command]()
+
 if __name__ == "__main__":
     main()
-
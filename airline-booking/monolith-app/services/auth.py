@@ -6,12 +6,12 @@ import jwt
 import datetime
 import secrets
 import os
-import hashlib
 from typing import Optional, Dict
 from functools import wraps
 from flask import request, jsonify
-import boto3
-from boto3.dynamodb.conditions import Attr
+from data.storage import storage
+from services.cache import LRUCache
+from services.passwords import password_hasher
 
 
 class AuthService:
@@ -23,36 +23,28 @@ class AuthService:
     ALGORITHM = 'HS256'
     ACCESS_TOKEN_EXPIRE_MINUTES = 60
     
-    # DynamoDB setup
-    _dynamodb = None
-    _users_table = None
-    _users_table_name = None
+    # Per-process cache of the sub, email and groups of users looked up from
+    # tokens (never the password hash). Entries are invalidated locally on
+    # changes; other workers see them after the TTL.
+    USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', '10000'))
+    USER_CACHE_TTL_SECONDS = float(os.environ.get('AUTH_USER_CACHE_TTL_SECONDS', '60'))
+    _user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
     
-    @staticmethod
-    def _init_dynamodb():
-        """Initialize DynamoDB connection"""
-        if AuthService._dynamodb is None:
-            aws_region = os.environ.get('AWS_REGION', 'us-east-1')
-            AuthService._dynamodb = boto3.resource('dynamodb', region_name=aws_region)
-            
-            stage = os.environ.get('STAGE', 'dev')
-            AuthService._users_table_name = os.environ.get('USERS_TABLE_NAME', f'Airline-Users-{stage}')
-            AuthService._users_table = AuthService._dynamodb.Table(AuthService._users_table_name)
+    # Trust the signed groups claim for the token's lifetime instead of
+    # loading the user record at all
+    TRUST_TOKEN_GROUPS = os.environ.get('AUTH_TRUST_TOKEN_GROUPS', 'False').lower() == 'true'
     
     @staticmethod
     def _hash_password(password: str) -> str:
-        """Hash password using SHA-256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Hash password with a salted KDF on the shared hashing pool"""
+        return password_hasher.hash(password)
     
     @staticmethod
-    def _init_default_users():
+    def init_default_users():
         """Initialize some default users for testing"""
-        AuthService._init_dynamodb()
-        
         try:
             # Check if users already exist
-            response = AuthService._users_table.scan(Limit=1)
-            if response.get('Items'):
+            if storage.has_users():
                 # Users already exist, skip initialization
                 return
             
@@ -80,19 +72,6 @@ class AuthService:
         Raises:
             ValueError: If user already exists
         """
-        AuthService._init_dynamodb()
-        
-        # Check if user already exists
-        try:
-            response = AuthService._users_table.scan(
-                FilterExpression=Attr('email').eq(email)
-            )
-            if response.get('Items'):
-                raise ValueError(f"User with email {email} already exists")
-        except Exception as e:
-            if "already exists" in str(e):
-                raise
-        
         if user_id is None:
             user_id = secrets.token_urlsafe(16)
         
@@ -104,16 +83,10 @@ class AuthService:
             'created_at': datetime.datetime.utcnow().isoformat()
         }
         
-        try:
-            AuthService._users_table.put_item(
-                Item=user,
-                ConditionExpression='attribute_not_exists(#sub)',
-                ExpressionAttributeNames={'#sub': 'sub'}
-            )
-        except AuthService._dynamodb.meta.client.exceptions.ConditionalCheckFailedException:
-            raise ValueError(f"User with ID {user_id} already exists")
-        except Exception as e:
-            raise ValueError(f"Failed to register user: {str(e)}")
+        # Raises ValueError if the ID or email is already taken
+        storage.create_user(user)
+        
+        AuthService.invalidate_user(user_id)
         
         return {
             'sub': user['sub'],
@@ -132,30 +105,43 @@ class AuthService:
             
         Returns:
             User info if valid, None otherwise
+            
+        Raises:
+            HasherBusyError: If the password hashing pool is saturated
         """
-        AuthService._init_dynamodb()
-        
         try:
             # Find user by email
-            response = AuthService._users_table.scan(
-                FilterExpression=Attr('email').eq(email)
-            )
-            
-            items = response.get('Items', [])
-            if not items:
-                return None
-            
-            user = items[0]
-            
-            # Verify password
-            password_hash = AuthService._hash_password(password)
-            if user.get('password_hash') == password_hash:
-                return user
-            
-            return None
+            user = storage.get_user_by_email(email)
         except Exception as e:
             print(f"Error authenticating user: {str(e)}")
             return None
+        
+        if not user:
+            return None
+        
+        # Verify password
+        stored_hash = user.get('password_hash', '')
+        if not password_hasher.verify(password, stored_hash):
+            return None
+        
+        if password_hasher.needs_rehash(stored_hash):
+            AuthService._upgrade_password_hash(user['sub'], password)
+        
+        return user
+    
+    @staticmethod
+    def _upgrade_password_hash(user_id: str, password: str):
+        """
+        Re-hash a password whose stored hash uses an outdated scheme or cost
+        
+        Failures are logged and ignored; the login itself already succeeded
+        and the upgrade is retried on the next one.
+        """
+        try:
+            if storage.update_user_password(user_id, AuthService._hash_password(password)):
+                AuthService.invalidate_user(user_id)
+        except Exception as e:
+            print(f"Warning: Could not upgrade password hash for user {user_id}: {str(e)}")
     
     @staticmethod
     def create_access_token(user: dict) -> str:
@@ -217,24 +203,58 @@ class AuthService:
             token: JWT token string
             
         Returns:
-            User info or None
+            User info (sub, email and groups; a new dict on every call) or None
         """
-        AuthService._init_dynamodb()
-        
         payload = AuthService.decode_token(token)
         if not payload:
             return None
         
+        if AuthService.TRUST_TOKEN_GROUPS:
+            return {
+                'sub': payload['sub'],
+                'email': payload.get('email'),
+                'groups': payload.get('groups', [])
+            }
+        
+        user = AuthService._user_cache.get(payload['sub'])
+        if user is not None:
+            return AuthService._token_user(user)
+        
         # Get user by sub
         try:
-            response = AuthService._users_table.get_item(Key={'sub': payload['sub']})
-            if 'Item' in response:
-                return response['Item']
-            return None
+            user = storage.get_user(payload['sub'])
+            if not user:
+                return None
+            # Cache only what requests need, never the password hash
+            user = AuthService._token_user(user)
+            AuthService._user_cache.set(payload['sub'], user)
+            return AuthService._token_user(user)
         except Exception as e:
             print(f"Error getting user from token: {str(e)}")
             return None
     
+    @staticmethod
+    def _token_user(user: dict) -> dict:
+        """Copy the fields an authenticated request uses out of a user record"""
+        return {
+            'sub': user['sub'],
+            'email': user.get('email'),
+            'groups': list(user.get('groups', []))
+        }
+    
+    @staticmethod
+    def invalidate_user(user_id: str):
+        """
+        Drop a user from the token lookup cache
+        
+        Call this whenever a user record changes so the next request
+        reloads it from DynamoDB.
+        
+        Args:
+            user_id: User sub/ID
+        """
+        AuthService._user_cache.invalidate(user_id)
+    
     @staticmethod
     def add_to_admin_group(user_id: str):
         """
@@ -243,24 +263,9 @@ class AuthService:
         Args:
             user_id: User sub/ID
         """
-        AuthService._init_dynamodb()
-        
         try:
-            # Get current user
-            response = AuthService._users_table.get_item(Key={'sub': user_id})
-            if 'Item' not in response:
-                return
-            
-            user = response['Item']
-            groups = user.get('groups', [])
-            
-            if 'Admin' not in groups:
-                groups.append('Admin')
-                AuthService._users_table.update_item(
-                    Key={'sub': user_id},
-                    UpdateExpression='SET groups = :groups',
-                    ExpressionAttributeValues={':groups': groups}
-                )
+            if storage.add_user_to_group(user_id, 'Admin'):
+                AuthService.invalidate_user(user_id)
         except Exception as e:
             print(f"Error adding user to admin group: {str(e)}")
     
@@ -278,25 +283,33 @@ class AuthService:
         return 'Admin' in user.get('groups', [])
     
     @staticmethod
-    def get_all_users() -> list:
-        """Get all registered users (admin only)"""
-        AuthService._init_dynamodb()
+    def get_users(limit: int, cursor: Optional[str] = None) -> dict:
+        """
+        Get one page of registered users (admin only)
         
-        try:
-            response = AuthService._users_table.scan()
-            items = response.get('Items', [])
+        Args:
+            limit: Maximum number of users to return
+            cursor: Cursor from a previous page, or None for the first page
+            
+        Returns:
+            Dictionary with users and nextCursor (None on the last page)
             
-            return [
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        items, next_cursor = storage.list_users(limit, cursor)
+        
+        return {
+            'users': [
                 {
                     'sub': user['sub'],
                     'email': user['email'],
                     'groups': user.get('groups', [])
                 }
                 for user in items
-            ]
-        except Exception as e:
-            print(f"Error getting all users: {str(e)}")
-            return []
+            ],
+            'nextCursor': next_cursor
+        }
 
 
 # Decorators for protecting routes
@@ -422,8 +435,6 @@ def booking_owner_or_admin_required(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        from data.storage import storage  # Import here to avoid circular dependency
-        
         token = None
         
         # Get token from Authorization header
@@ -466,7 +477,3 @@ def booking_owner_or_admin_required(f):
         return f(*args, **kwargs)
     
     return decorated_function
-
-
-# Initialize default users when module is imported
-AuthService._init_default_users()
@@ -5,6 +5,8 @@ Handles booking reservation, confirmation, and cancellation
 import secrets
 from typing import List, Optional
 from data.storage import storage
+from services.catalog import CatalogService
+from services.outbox import OutboxService
 
 
 class BookingService:
@@ -40,6 +42,27 @@ class BookingService:
         booking = storage.create_booking(booking_data)
         return booking['id']
     
+    @staticmethod
+    def reserve_flight_and_booking(booking_data: dict) -> str:
+        """
+        Reserve a flight seat and create an UNCONFIRMED booking in one step
+        
+        Args:
+            booking_data: Same fields as reserve_booking
+                
+        Returns:
+            booking_id: The newly created booking ID
+            
+        Raises:
+            ValueError: If booking data is invalid or the flight has no seats
+        """
+        if not BookingService.validate_booking_request(booking_data):
+            raise ValueError("Invalid booking request: missing required fields")
+        
+        booking = storage.reserve_and_create_booking(booking_data)
+        CatalogService.record_seat_change(booking_data['outboundFlightId'], -1)
+        return booking['id']
+    
     @staticmethod
     def confirm_booking(booking_id: str) -> str:
         """
@@ -54,18 +77,40 @@ class BookingService:
         Raises:
             ValueError: If booking not found
         """
-        booking = storage.get_booking(booking_id)
-        if not booking:
-            raise ValueError(f"Invalid booking ID: {booking_id}")
-        
         # Generate a booking reference
         reference = secrets.token_urlsafe(4)
         
-        # Update booking status to CONFIRMED
+        # Update booking status to CONFIRMED (fails if the booking does not exist)
         storage.update_booking_status(booking_id, 'CONFIRMED', reference)
         
         return reference
     
+    @staticmethod
+    def confirm_booking_and_enqueue(booking_id: str, customer_id: str, price: float) -> str:
+        """
+        Confirm a booking and enqueue its loyalty accrual and notification
+        
+        The status update and the outbox records are written atomically, so
+        follow-up work is never lost even if the process dies right after.
+        
+        Args:
+            booking_id: Booking identifier
+            customer_id: Customer identifier
+            price: Amount paid
+            
+        Returns:
+            booking_reference: Generated booking reference code
+            
+        Raises:
+            ValueError: If booking not found
+        """
+        reference = secrets.token_urlsafe(4)
+        events = OutboxService.booking_confirmed_events(booking_id, customer_id, price, reference)
+        
+        storage.confirm_booking_with_outbox(booking_id, reference, events)
+        
+        return reference
+    
     @staticmethod
     def cancel_booking(booking_id: str) -> bool:
         """
@@ -80,15 +125,31 @@ class BookingService:
         Raises:
             ValueError: If booking not found
         """
-        booking = storage.get_booking(booking_id)
-        if not booking:
-            raise ValueError(f"Invalid booking ID: {booking_id}")
-        
-        # Update booking status to CANCELLED
+        # Update booking status to CANCELLED (fails if the booking does not exist)
         storage.update_booking_status(booking_id, 'CANCELLED')
         
         return True
     
+    @staticmethod
+    def cancel_and_release(booking_id: str, flight_id: str) -> bool:
+        """
+        Cancel a booking and release its flight seat in one step
+        
+        Args:
+            booking_id: Booking identifier
+            flight_id: Flight the booking holds a seat on
+            
+        Returns:
+            True if successful
+            
+        Raises:
+            ValueError: If booking not found, already cancelled, or the flight
+                is already at maximum capacity
+        """
+        storage.cancel_and_release_booking(booking_id, flight_id)
+        CatalogService.record_seat_change(flight_id, 1)
+        return True
+    
     @staticmethod
     def get_booking(booking_id: str) -> dict:
         """
@@ -122,6 +183,47 @@ class BookingService:
         """
         return storage.get_bookings_by_customer(customer_id, status)
     
+    @staticmethod
+    def get_customer_bookings_page(customer_id: str, status: Optional[str] = None,
+                                   limit: int = 50, cursor: Optional[str] = None,
+                                   expand_flight: bool = False) -> dict:
+        """
+        Get one page of a customer's bookings, optionally filtered by status
+        
+        Args:
+            customer_id: Customer identifier
+            status: Optional status filter (UNCONFIRMED, CONFIRMED, CANCELLED)
+            limit: Maximum number of bookings to return
+            cursor: Cursor from a previous page, or None for the first page
+            expand_flight: Embed each booking's flight as outboundFlight
+            
+        Returns:
+            Dictionary with bookings and nextCursor (None on the last page)
+            
+        Raises:
+            ValueError: If the cursor is invalid
+        """
+        bookings, next_cursor = storage.get_bookings_page(customer_id, status, limit, cursor)
+        if expand_flight:
+            BookingService.embed_flights(bookings)
+        return {
+            'bookings': bookings,
+            'nextCursor': next_cursor
+        }
+    
+    @staticmethod
+    def embed_flights(bookings: List[dict]):
+        """
+        Attach each booking's flight as outboundFlight, in place
+        
+        All flights are fetched with one batch read, so a page of bookings
+        costs one flight lookup instead of one per booking.
+        """
+        flight_ids = [booking['bookingOutboundFlightId'] for booking in bookings]
+        flights = storage.get_flights(flight_ids) if flight_ids else {}
+        for booking in bookings:
+            booking['outboundFlight'] = flights.get(booking['bookingOutboundFlightId'])
+    
     @staticmethod
     def notify_booking(customer_id: str, price: float, booking_reference: Optional[str] = None) -> dict:
         """
@@ -0,0 +1,67 @@
+"""
+Caching
+Small in-process caches shared by the services
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with a TTL"""
+    
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[dict]:
+        """Return a cached value, or None if absent or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: dict):
+        """Cache a value, evicting the least recently used entry when full"""
+        if self.max_size <= 0 or self.ttl_seconds <= 0:
+            return
+        
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def update(self, key: str, fn: Callable[[dict], dict]):
+        """
+        Replace a cached value with fn(value), keeping its expiry
+        
+        Does nothing if the key is absent or expired, so callers cannot
+        extend the lifetime of a value they did not read from the source.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return
+            self._entries[key] = (entry[0], fn(entry[1]))
+    
+    def invalidate(self, key: str):
+        """Drop a single cached value"""
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        """Drop all cached values"""
+        with self._lock:
+            self._entries.clear()
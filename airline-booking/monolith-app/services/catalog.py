@@ -2,13 +2,169 @@
 Catalog Service
 Handles flight search and seat reservation/release operations
 """
-from typing import List
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+from data.base import StorageBackend
 from data.storage import storage
+from services.cache import LRUCache
+from services.route_graph import RouteGraph
 
 
 class CatalogService:
     """Service for managing flight catalog operations"""
     
+    # Largest batch accepted by get_flights
+    MAX_BATCH_FLIGHTS = 100
+    
+    # Flight attributes other than the seat count (airports, times, price)
+    # rarely change, so they are cached for FLIGHT_CACHE_TTL_SECONDS together
+    # with the flight IDs each search returned. Seat counts are cached
+    # separately for at most FLIGHT_SEAT_MAX_STALENESS_SECONDS (0 reads them
+    # fresh every time) and adjusted locally when this worker reserves or
+    # releases seats. Reservations are conditional writes in storage, so a
+    # stale count can misreport availability but never oversell a flight.
+    # Flights written through put_flight(s) and shard_flight_seats are
+    # invalidated in this process at once; other processes see the change
+    # once their entries expire.
+    FLIGHT_CACHE_SIZE = int(os.environ.get('FLIGHT_CACHE_SIZE', '10000'))
+    FLIGHT_CACHE_TTL_SECONDS = float(os.environ.get('FLIGHT_CACHE_TTL_SECONDS', '300'))
+    FLIGHT_SEAT_MAX_STALENESS_SECONDS = float(os.environ.get('FLIGHT_SEAT_MAX_STALENESS_SECONDS', '2'))
+    _flight_cache = LRUCache(FLIGHT_CACHE_SIZE, FLIGHT_CACHE_TTL_SECONDS)
+    _search_cache = LRUCache(FLIGHT_CACHE_SIZE, FLIGHT_CACHE_TTL_SECONDS)
+    _seat_cache = LRUCache(FLIGHT_CACHE_SIZE, FLIGHT_SEAT_MAX_STALENESS_SECONDS)
+    
+    # Connection searches run on an in-memory graph of upcoming flights,
+    # rebuilt from one scan every ROUTE_GRAPH_REFRESH_SECONDS
+    ROUTE_GRAPH_REFRESH_SECONDS = float(os.environ.get('ROUTE_GRAPH_REFRESH_SECONDS', '900'))
+    MIN_LAYOVER_MINUTES = int(os.environ.get('CONNECTION_MIN_LAYOVER_MINUTES', '45'))
+    MAX_LAYOVER_MINUTES = int(os.environ.get('CONNECTION_MAX_LAYOVER_MINUTES', '1440'))
+    MAX_CONNECTION_RESULTS = 50
+    _route_graph = RouteGraph(ROUTE_GRAPH_REFRESH_SECONDS)
+    
+    @staticmethod
+    def _cache_flight(flight: dict):
+        static = {key: value for key, value in flight.items() if key != 'seatCapacity'}
+        CatalogService._flight_cache.set(flight['id'], static)
+        CatalogService._seat_cache.set(flight['id'], {'seatCapacity': flight.get('seatCapacity')})
+    
+    @staticmethod
+    def _cached_flight(flight_id: str) -> Optional[dict]:
+        # Only a hit if both halves are cached and within their bounds
+        static = CatalogService._flight_cache.get(flight_id)
+        if static is None:
+            return None
+        seats = CatalogService._seat_cache.get(flight_id)
+        if seats is None:
+            return None
+        return {**static, **seats}
+    
+    @staticmethod
+    def _current_flights(flight_ids: List[str]) -> Dict[str, dict]:
+        """Flights by ID from the cache, reading the expired ones in a single batch"""
+        flights = {flight_id: CatalogService._cached_flight(flight_id) for flight_id in flight_ids}
+        expired = [flight_id for flight_id, flight in flights.items() if flight is None]
+        if expired:
+            for flight_id, flight in storage.get_flights(expired).items():
+                CatalogService._cache_flight(flight)
+                flights[flight_id] = flight
+        return {flight_id: flight for flight_id, flight in flights.items() if flight}
+    
+    @staticmethod
+    def record_seat_change(flight_id: str, delta: int):
+        """
+        Apply a seat reservation (-n) or release (+n) to the cached seat count
+        
+        Called after the change has been written to storage, so this worker's
+        readers see it immediately rather than after the staleness bound.
+        """
+        CatalogService._seat_cache.update(
+            flight_id, lambda seats: {'seatCapacity': seats['seatCapacity'] + delta}
+        )
+    
+    @staticmethod
+    def invalidate_flight(flight: dict):
+        """
+        Drop a flight and the search results for its route from the cache
+        
+        Called after every flight write made through this service; the
+        flight's leg in the route graph is replaced as well. Other workers
+        pick the change up within FLIGHT_CACHE_TTL_SECONDS and
+        ROUTE_GRAPH_REFRESH_SECONDS.
+        
+        Args:
+            flight: The flight as written (needs id; airports and
+                departureDate to invalidate its new route as well)
+        """
+        cached = CatalogService._flight_cache.get(flight['id']) or {}
+        route_dates = {flight.get('routeDate'), cached.get('routeDate')}
+        if all(flight.get(field) for field in ('departureAirportCode', 'arrivalAirportCode', 'departureDate')):
+            route_dates.add(StorageBackend._route_key(
+                flight['departureAirportCode'], flight['arrivalAirportCode'], flight['departureDate']
+            ))
+        for route_date in route_dates - {None}:
+            CatalogService._search_cache.invalidate(route_date)
+        CatalogService._flight_cache.invalidate(flight['id'])
+        CatalogService._seat_cache.invalidate(flight['id'])
+        
+        if 'departureDate' in flight and 'arrivalDate' in flight:
+            try:
+                CatalogService._route_graph.upsert(flight)
+            except (KeyError, TypeError, ValueError) as e:
+                # Keep no stale leg for a schedule the graph cannot read
+                print(f"Dropping flight {flight['id']} from route graph: {str(e)}")
+                CatalogService._route_graph.remove(flight['id'])
+    
+    @staticmethod
+    def put_flight(flight: dict) -> dict:
+        """
+        Create or replace a flight and invalidate its cached copies
+        
+        Args:
+            flight: Flight with id, airports, dates, price and seats
+            
+        Returns:
+            The flight as stored
+            
+        Raises:
+            ValueError: If the flight cannot be written (e.g. it has sharded seats)
+        """
+        flight = storage.put_flight(flight)
+        CatalogService.invalidate_flight(flight)
+        return flight
+    
+    @staticmethod
+    def put_flights(flights: List[dict]) -> int:
+        """
+        Create or replace many flights and invalidate their cached copies
+        
+        Args:
+            flights: Flights as accepted by put_flight
+            
+        Returns:
+            Number of flights written
+        """
+        written = storage.put_flights(flights)
+        for flight in flights:
+            CatalogService.invalidate_flight(flight)
+        return written
+    
+    @staticmethod
+    def shard_flight_seats(flight_id: str, shards: int) -> dict:
+        """
+        Split a hot flight's seat counter into buckets (see storage)
+        
+        Returns:
+            The flight with its seatShards and total seatCapacity
+            
+        Raises:
+            ValueError: If the flight does not exist, is already sharded or
+                the shard count is invalid
+        """
+        flight = storage.shard_flight_seats(flight_id, shards)
+        CatalogService.invalidate_flight(flight)
+        return flight
+    
     @staticmethod
     def search_flights(departure_code: str, arrival_code: str, departure_date: str) -> List[dict]:
         """
@@ -22,10 +178,105 @@ class CatalogService:
         Returns:
             List of matching flights
         """
-        flights = storage.get_flights_by_schedule(
-            departure_code, arrival_code, departure_date
+        # Route index keys are exact matches, so normalize the inputs first
+        departure_code = departure_code.strip().upper()
+        arrival_code = arrival_code.strip().upper()
+        departure_date = departure_date.strip()
+        # Keyed like the flights' routeDate (by calendar day), so writes can invalidate it
+        route_date = StorageBackend._route_key(departure_code, arrival_code, departure_date)
+        
+        result = CatalogService._search_cache.get(route_date)
+        if result is None:
+            flights = storage.get_flights_by_schedule(departure_code, arrival_code, departure_date)
+            for flight in flights:
+                CatalogService._cache_flight(flight)
+            CatalogService._search_cache.set(route_date, {'ids': [flight['id'] for flight in flights]})
+            return flights
+        
+        # Known route: only flights whose cached halves expired are read
+        flights = CatalogService._current_flights(result['ids'])
+        return [flights[flight_id] for flight_id in result['ids'] if flight_id in flights]
+    
+    @staticmethod
+    def search_connections(departure_code: str, arrival_code: str, departure_date: str,
+                           return_date: Optional[str] = None,
+                           min_layover_minutes: Optional[int] = None,
+                           max_layover_minutes: Optional[int] = None) -> dict:
+        """
+        Search direct flights and one-stop connections, optionally both ways
+        
+        Itineraries come from the route graph; their flights are then read
+        through the flight cache in one batch, so seat counts and prices are
+        current and sold-out itineraries are left out.
+        
+        Args:
+            departure_code: Departure airport code
+            arrival_code: Arrival airport code
+            departure_date: Outbound departure date (YYYY-MM-DD)
+            return_date: Return departure date (YYYY-MM-DD), optional
+            min_layover_minutes: Shortest connection time (default MIN_LAYOVER_MINUTES)
+            max_layover_minutes: Longest connection time (default MAX_LAYOVER_MINUTES)
+            
+        Returns:
+            Dictionary containing:
+                - outbound: Itineraries, fastest first, each with flights,
+                  stops, layoverMinutes and totalPrice
+                - return: Itineraries back, present if return_date was given
+                
+        Raises:
+            ValueError: If the airports, dates or layover bounds are invalid
+        """
+        departure_code = departure_code.strip().upper()
+        arrival_code = arrival_code.strip().upper()
+        if departure_code == arrival_code:
+            raise ValueError("Departure and arrival airports must differ")
+        
+        min_layover = CatalogService.MIN_LAYOVER_MINUTES if min_layover_minutes is None else min_layover_minutes
+        max_layover = CatalogService.MAX_LAYOVER_MINUTES if max_layover_minutes is None else max_layover_minutes
+        if not 0 <= min_layover <= max_layover:
+            raise ValueError("Layover bounds must satisfy 0 <= minLayover <= maxLayover")
+        
+        try:
+            outbound_day = date.fromisoformat(departure_date.strip())
+            return_day = date.fromisoformat(return_date.strip()) if return_date else None
+        except ValueError:
+            raise ValueError("Dates must be in YYYY-MM-DD format")
+        if return_day and return_day < outbound_day:
+            raise ValueError("Return date must not be before the departure date")
+        
+        # Flights that already left are not worth indexing
+        CatalogService._route_graph.refresh(
+            lambda: storage.list_flight_schedules((date.today() - timedelta(days=1)).isoformat())
         )
-        return flights
+        
+        def search(origin: str, destination: str, day: date) -> List[dict]:
+            return CatalogService._route_graph.itineraries(
+                origin, destination, day.isoformat(),
+                timedelta(minutes=min_layover), timedelta(minutes=max_layover),
+                CatalogService.MAX_CONNECTION_RESULTS
+            )
+        
+        outbound = search(departure_code, arrival_code, outbound_day)
+        returning = search(arrival_code, departure_code, return_day) if return_day else []
+        
+        flights = CatalogService._current_flights(
+            list({flight_id for itinerary in outbound + returning for flight_id in itinerary['flightIds']})
+        )
+        
+        def available(itineraries: List[dict]) -> List[dict]:
+            results = []
+            for itinerary in itineraries:
+                legs = [flights.get(flight_id) for flight_id in itinerary.pop('flightIds')]
+                if all(leg and leg.get('seatCapacity', 0) > 0 for leg in legs):
+                    itinerary['flights'] = legs
+                    itinerary['totalPrice'] = sum(leg.get('ticketPrice', 0) for leg in legs)
+                    results.append(itinerary)
+            return results
+        
+        result = {'outbound': available(outbound)}
+        if return_day:
+            result['return'] = available(returning)
+        return result
     
     @staticmethod
     def get_flight(flight_id: str) -> dict:
@@ -41,11 +292,44 @@ class CatalogService:
         Raises:
             ValueError: If flight not found
         """
+        flight = CatalogService._cached_flight(flight_id)
+        if flight:
+            return flight
+        
         flight = storage.get_flight(flight_id)
         if not flight:
             raise ValueError(f"Flight with ID {flight_id} not found")
+        CatalogService._cache_flight(flight)
         return flight
     
+    @staticmethod
+    def get_flights(flight_ids: List[str]) -> dict:
+        """
+        Get several flights by ID in one storage round trip
+        
+        Args:
+            flight_ids: Flight identifiers (at most MAX_BATCH_FLIGHTS)
+            
+        Returns:
+            Dictionary containing:
+                - flights: Found flights, in request order
+                - missing: IDs with no matching flight
+                
+        Raises:
+            ValueError: If the ID list is invalid or too long
+        """
+        if not isinstance(flight_ids, list) or not all(isinstance(i, str) for i in flight_ids):
+            raise ValueError("ids must be a list of flight IDs")
+        if len(flight_ids) > CatalogService.MAX_BATCH_FLIGHTS:
+            raise ValueError(f"At most {CatalogService.MAX_BATCH_FLIGHTS} flights can be requested at once")
+        
+        flight_ids = list(dict.fromkeys(flight_ids))
+        flights = storage.get_flights(flight_ids) if flight_ids else {}
+        return {
+            'flights': [flights[flight_id] for flight_id in flight_ids if flight_id in flights],
+            'missing': [flight_id for flight_id in flight_ids if flight_id not in flights]
+        }
+    
     @staticmethod
     def reserve_flight_seat(flight_id: str) -> dict:
         """
@@ -62,8 +346,11 @@ class CatalogService:
         """
         try:
             storage.reserve_flight_seat(flight_id)
+            CatalogService.record_seat_change(flight_id, -1)
             return {'status': 'SUCCESS'}
         except ValueError as e:
+            # The cached count said seats were left; read it fresh next time
+            CatalogService._seat_cache.invalidate(flight_id)
             raise ValueError(str(e))
     
     @staticmethod
@@ -82,7 +369,31 @@ class CatalogService:
         """
         try:
             storage.release_flight_seat(flight_id)
+            CatalogService.record_seat_change(flight_id, 1)
             return {'status': 'SUCCESS'}
         except ValueError as e:
+            CatalogService._seat_cache.invalidate(flight_id)
             raise ValueError(str(e))
+    
+    @staticmethod
+    def release_flight_seats(flight_id: str, count: int) -> dict:
+        """
+        Release several seats on a flight at once
+        
+        Args:
+            flight_id: Flight identifier
+            count: Number of seats to release
+            
+        Returns:
+            Success status
+            
+        Raises:
+            ValueError: If flight doesn't exist or release would exceed maximum capacity
+        """
+        if not isinstance(count, int) or count <= 0:
+            raise ValueError("Seat count must be a positive integer")
+        
+        storage.release_flight_seats(flight_id, count)
+        CatalogService.record_seat_change(flight_id, count)
+        return {'status': 'SUCCESS', 'released': count}
 
@@ -2,6 +2,7 @@
 Loyalty Service
 Handles customer loyalty points and tier management
 """
+from typing import Optional
 from data.storage import storage
 
 
@@ -38,13 +39,15 @@ class LoyaltyService:
         }
     
     @staticmethod
-    def add_loyalty_points(customer_id: str, points: int) -> dict:
+    def add_loyalty_points(customer_id: str, points: int,
+                           idempotency_key: Optional[str] = None) -> dict:
         """
         Add loyalty points for a customer
         
         Args:
             customer_id: Customer identifier
             points: Number of points to add
+            idempotency_key: Optional key making repeated calls a no-op
             
         Returns:
             Success message
@@ -55,7 +58,7 @@ class LoyaltyService:
         if not isinstance(points, (int, float)) or points <= 0:
             raise ValueError("Points must be a positive number")
         
-        storage.add_loyalty_points(customer_id, int(points))
+        storage.add_loyalty_points(customer_id, int(points), idempotency_key)
         
         return {
             'message': 'Loyalty points added successfully',
@@ -64,7 +67,8 @@ class LoyaltyService:
         }
     
     @staticmethod
-    def process_booking_loyalty(customer_id: str, price: float) -> dict:
+    def process_booking_loyalty(customer_id: str, price: float,
+                                idempotency_key: Optional[str] = None) -> dict:
         """
         Process loyalty points from a booking
         This is called when a booking is confirmed
@@ -72,11 +76,12 @@ class LoyaltyService:
         Args:
             customer_id: Customer identifier
             price: Booking price (converted to points)
+            idempotency_key: Optional key making repeated calls a no-op
             
         Returns:
             Result of adding loyalty points
         """
         # Convert price to points (1:1 ratio in this implementation)
         points = int(price)
-        return LoyaltyService.add_loyalty_points(customer_id, points)
+        return LoyaltyService.add_loyalty_points(customer_id, points, idempotency_key)
 
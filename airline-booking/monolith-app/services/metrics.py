@@ -0,0 +1,229 @@
+"""
+Metrics
+Per-request traces with timed steps, DynamoDB call and consumed capacity
+accounting, and aggregated histograms rendered in the Prometheus text format
+"""
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, from cache hits up to payment gateway deadlines
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Buckets for the number of DynamoDB calls made by one request
+CALL_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# Incoming X-Request-Id values are only reused if they look like IDs
+TRACE_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], **extra: str) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in pairs]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+    
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: float = 1, *label_values: str):
+        """Add amount to the series for the given label values"""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def render(self) -> List[str]:
+        """Prometheus text exposition lines"""
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+    
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # Per series: one count per bucket, then sum and count
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, *label_values: str):
+        """Record one observation for the given label values"""
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+    
+    def render(self) -> List[str]:
+        """Prometheus text exposition lines"""
+        with self._lock:
+            all_series = sorted((labels, list(series)) for labels, series in self._series.items())
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in all_series:
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.label_names, label_values, le=_format_value(bound))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, label_values, le='+Inf')
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = _format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'airline_http_request_duration_seconds', 'HTTP request latency',
+    ('method', 'route', 'status')
+)
+STEP_DURATION = Histogram(
+    'airline_step_duration_seconds', 'Duration of instrumented steps such as booking saga steps',
+    ('step', 'outcome')
+)
+DYNAMODB_CALLS_PER_TRACE = Histogram(
+    'airline_dynamodb_calls_per_request', 'DynamoDB calls made by one request or outbox record',
+    ('route',), CALL_BUCKETS
+)
+DYNAMODB_CALLS = Counter(
+    'airline_dynamodb_calls_total', 'DynamoDB API calls', ('operation',)
+)
+DYNAMODB_CAPACITY = Counter(
+    'airline_dynamodb_consumed_capacity_units_total', 'DynamoDB capacity units consumed',
+    ('table', 'operation')
+)
+
+METRICS = [REQUEST_DURATION, STEP_DURATION, DYNAMODB_CALLS_PER_TRACE, DYNAMODB_CALLS, DYNAMODB_CAPACITY]
+
+
+class Trace:
+    """Steps and DynamoDB usage of one request or outbox record"""
+    
+    def __init__(self, route: str, trace_id: Optional[str] = None):
+        self.route = route
+        self.trace_id = trace_id if trace_id and TRACE_ID_PATTERN.match(trace_id) else uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self.dynamodb_calls = 0
+        self.consumed_capacity = 0.0
+    
+    def elapsed(self) -> float:
+        """Seconds since the trace started"""
+        return time.perf_counter() - self.started
+    
+    def server_timing(self) -> str:
+        """Steps as a Server-Timing header value, visible in browser dev tools"""
+        entries = [f"{name};dur={duration * 1000:.1f}" for name, duration in self.spans]
+        entries.append(f"dynamodb;desc=\"{self.dynamodb_calls} calls, "
+                       f"{self.consumed_capacity:g} capacity units\"")
+        return ', '.join(entries)
+
+
+_local = threading.local()
+
+
+def start_trace(route: str, trace_id: Optional[str] = None) -> Trace:
+    """Start a trace on the current thread, replacing any unfinished one"""
+    _local.trace = Trace(route, trace_id)
+    return _local.trace
+
+
+def current_trace() -> Optional[Trace]:
+    """The trace of the current thread, if one was started"""
+    return getattr(_local, 'trace', None)
+
+
+def finish_trace() -> Optional[Trace]:
+    """End the current thread's trace and record its DynamoDB call count"""
+    trace = current_trace()
+    _local.trace = None
+    if trace is not None:
+        DYNAMODB_CALLS_PER_TRACE.observe(trace.dynamodb_calls, trace.route)
+    return trace
+
+
+@contextmanager
+def span(step: str):
+    """
+    Time a step, recording it in the step histogram and the current trace
+    
+    Exceptions are recorded with outcome="error" and re-raised.
+    """
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STEP_DURATION.observe(duration, step, outcome)
+        trace = current_trace()
+        if trace is not None:
+            trace.spans.append((step, duration))
+
+
+def record_dynamodb_call(operation: str, consumed_capacity=None):
+    """
+    Count a DynamoDB call and the capacity it consumed
+    
+    Args:
+        operation: API operation name, e.g. UpdateItem
+        consumed_capacity: The response's ConsumedCapacity, a dict for
+            single-table calls or a list for batch and transaction calls
+    """
+    DYNAMODB_CALLS.inc(1, operation)
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    
+    units = 0.0
+    for entry in consumed_capacity or []:
+        table_units = float(entry.get('CapacityUnits', 0))
+        DYNAMODB_CAPACITY.inc(table_units, entry.get('TableName', 'unknown'), operation)
+        units += table_units
+    
+    trace = current_trace()
+    if trace is not None:
+        trace.dynamodb_calls += 1
+        trace.consumed_capacity += units
+
+
+def log(message: str):
+    """Print a message tagged with the current trace ID"""
+    trace = current_trace()
+    print(f"[{trace.trace_id}] {message}" if trace is not None else message)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,213 @@
+"""
+Outbox Service
+Durable, asynchronous delivery of booking follow-up work (loyalty accrual
+and notifications) through an outbox table drained by background workers
+"""
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from data.storage import storage
+from services import metrics
+
+
+class OutboxService:
+    """Service for enqueueing and processing outbox records"""
+    
+    # Event types
+    EVENT_LOYALTY_ACCRUAL = 'loyalty.accrual'
+    EVENT_BOOKING_NOTIFICATION = 'booking.notification'
+    
+    # Retry policy
+    MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '5'))
+    BACKOFF_SECONDS = float(os.environ.get('OUTBOX_BACKOFF_SECONDS', '2'))
+    # How long a claimed record stays invisible to other workers
+    LEASE_SECONDS = float(os.environ.get('OUTBOX_LEASE_SECONDS', '30'))
+    
+    @staticmethod
+    def booking_confirmed_events(booking_id: str, customer_id: str, price: float,
+                                 booking_reference: str) -> List[dict]:
+        """
+        Build the outbox records for a confirmed booking
+        
+        Record IDs are derived from the booking ID and double as idempotency
+        keys, so each booking accrues loyalty and notifies exactly once.
+        
+        Args:
+            booking_id: Booking identifier
+            customer_id: Customer identifier
+            price: Amount paid
+            booking_reference: Booking reference code
+        
+        Returns:
+            List of outbox records
+        """
+        return [
+            {
+                'id': f"{booking_id}#loyalty",
+                'eventType': OutboxService.EVENT_LOYALTY_ACCRUAL,
+                'payload': {
+                    'customerId': customer_id,
+                    'price': price
+                }
+            },
+            {
+                'id': f"{booking_id}#notification",
+                'eventType': OutboxService.EVENT_BOOKING_NOTIFICATION,
+                'payload': {
+                    'customerId': customer_id,
+                    'price': price,
+                    'bookingReference': booking_reference
+                }
+            }
+        ]
+    
+    @staticmethod
+    def dispatch(record: dict) -> dict:
+        """
+        Run the handler for an outbox record
+        
+        Raises:
+            ValueError: If the event type is unknown
+        """
+        # Import here to avoid circular dependency (booking enqueues events)
+        from services.booking import BookingService
+        from services.loyalty import LoyaltyService
+        
+        payload = record['payload']
+        
+        if record['eventType'] == OutboxService.EVENT_LOYALTY_ACCRUAL:
+            with metrics.span('loyalty'):
+                return LoyaltyService.process_booking_loyalty(
+                    payload['customerId'],
+                    payload['price'],
+                    idempotency_key=record['id']
+                )
+        
+        if record['eventType'] == OutboxService.EVENT_BOOKING_NOTIFICATION:
+            with metrics.span('notify'):
+                return BookingService.notify_booking(
+                    payload['customerId'],
+                    payload['price'],
+                    payload.get('bookingReference')
+                )
+        
+        raise ValueError(f"Unknown outbox event type: {record['eventType']}")
+    
+    @staticmethod
+    def process_record(record: dict) -> bool:
+        """
+        Claim and process a single outbox record
+        
+        Returns:
+            True if the record was processed successfully by this call
+        """
+        metrics.start_trace(f"outbox:{record.get('eventType')}", record.get('id'))
+        try:
+            return OutboxService._process_claimed(record)
+        finally:
+            metrics.finish_trace()
+    
+    @staticmethod
+    def _process_claimed(record: dict) -> bool:
+        claimed = storage.claim_outbox_record(record, OutboxService.LEASE_SECONDS)
+        if claimed is None:
+            # Another worker claimed it first
+            return False
+        
+        try:
+            OutboxService.dispatch(claimed)
+        except Exception as e:
+            attempts = claimed.get('attempts', 1)
+            if attempts >= OutboxService.MAX_ATTEMPTS:
+                metrics.log(f"Outbox record {claimed['id']} failed permanently: {str(e)}")
+                storage.complete_outbox_record(claimed['id'], 'FAILED', str(e))
+            else:
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, OutboxService.BACKOFF_SECONDS * (2 ** (attempts - 1)))
+                storage.reschedule_outbox_record(claimed['id'], delay, str(e))
+            return False
+        
+        storage.complete_outbox_record(claimed['id'])
+        return True
+
+
+class OutboxWorker:
+    """Background thread pool draining the outbox"""
+    
+    def __init__(self, num_workers: Optional[int] = None,
+                 poll_interval: Optional[float] = None):
+        self.num_workers = num_workers or int(os.environ.get('OUTBOX_WORKERS', '4'))
+        self.poll_interval = poll_interval or float(
+            os.environ.get('OUTBOX_POLL_INTERVAL_SECONDS', '1')
+        )
+        self._stop_event = threading.Event()
+        self._poller = None
+        self._executor = None
+    
+    def start(self):
+        """Start polling in a daemon thread"""
+        if self._poller is not None:
+            return
+        
+        self._stop_event.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.num_workers,
+            thread_name_prefix='outbox-worker'
+        )
+        self._poller = threading.Thread(target=self._poll_loop, name='outbox-poller', daemon=True)
+        self._poller.start()
+    
+    def stop(self, wait: bool = True):
+        """Stop polling and let in-flight records finish"""
+        self._stop_event.set()
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+    
+    def run_forever(self):
+        """Drain the outbox on the calling thread until interrupted"""
+        self.start()
+        try:
+            while not self._stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+    
+    def drain_once(self) -> int:
+        """
+        Process one batch of due records, waiting for the batch to finish
+        
+        Only fetches as many records as there are workers, so a large
+        backlog is worked off in bounded batches.
+        
+        Returns:
+            Number of records processed successfully
+        """
+        records = storage.get_due_outbox_records(self.num_workers)
+        if not records:
+            return 0
+        
+        futures = [self._executor.submit(OutboxService.process_record, record)
+                   for record in records]
+        return sum(1 for future in futures if future.result())
+    
+    def _poll_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                # Keep draining while there is work, then back off
+                if self.drain_once() > 0:
+                    continue
+            except Exception as e:
+                print(f"Error draining outbox: {str(e)}")
+            self._stop_event.wait(self.poll_interval)
+
+
+# Shared in-process worker, started by the web server when enabled
+outbox_worker = OutboxWorker()
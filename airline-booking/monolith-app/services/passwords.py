@@ -0,0 +1,181 @@
+"""
+Password Hashing
+Salted, versioned password hashes computed on a bounded worker pool
+
+Stored hashes carry their scheme and cost parameters:
+    scrypt$<n>$<r>$<p>$<salt>$<hash>
+    pbkdf2_sha256$<iterations>$<salt>$<hash>
+Unsalted SHA-256 hex digests written by earlier versions are still accepted
+and reported by needs_rehash() so they can be upgraded on the next login.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+SCHEME_SCRYPT = 'scrypt'
+SCHEME_PBKDF2 = 'pbkdf2_sha256'
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+class HasherBusyError(RuntimeError):
+    """Raised when the hashing pool is saturated and the caller should retry later"""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords on a bounded thread pool
+    
+    hashlib.scrypt and hashlib.pbkdf2_hmac release the GIL while they run,
+    so a thread pool gives real parallelism without process start-up or
+    pickling costs. The pool size caps how many cores logins can use, and
+    max_pending caps how many requests may wait for it: once full, callers
+    get HasherBusyError after queue_timeout instead of tying up a web
+    worker thread indefinitely.
+    """
+    
+    def __init__(self, scheme: Optional[str] = None,
+                 scrypt_n: Optional[int] = None,
+                 pbkdf2_iterations: Optional[int] = None,
+                 num_workers: Optional[int] = None,
+                 max_pending: Optional[int] = None,
+                 queue_timeout: Optional[float] = None):
+        self.scheme = scheme or os.environ.get('AUTH_PASSWORD_SCHEME', SCHEME_SCRYPT)
+        if self.scheme not in (SCHEME_SCRYPT, SCHEME_PBKDF2):
+            raise ValueError(f"Unsupported password hashing scheme: {self.scheme}")
+        
+        self.scrypt_n = scrypt_n or int(os.environ.get('AUTH_SCRYPT_N', '16384'))
+        self.scrypt_r = 8
+        self.scrypt_p = 1
+        self.pbkdf2_iterations = pbkdf2_iterations or int(
+            os.environ.get('AUTH_PBKDF2_ITERATIONS', '600000')
+        )
+        # Leave at least half of the cores to the rest of the application
+        self.num_workers = num_workers or int(
+            os.environ.get('AUTH_HASH_WORKERS', str(max(1, (os.cpu_count() or 2) // 2)))
+        )
+        self.max_pending = max_pending or int(os.environ.get('AUTH_HASH_MAX_PENDING', '64'))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(
+            os.environ.get('AUTH_HASH_QUEUE_TIMEOUT_SECONDS', '2')
+        )
+        
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+    
+    def hash(self, password: str) -> str:
+        """
+        Hash a password with the configured scheme and a fresh salt
+        
+        Raises:
+            HasherBusyError: If the pool stays saturated for queue_timeout
+        """
+        return self._run(self._hash_sync, password)
+    
+    def verify(self, password: str, stored_hash: str) -> bool:
+        """
+        Check a password against a stored hash of any supported scheme
+        
+        Raises:
+            HasherBusyError: If the pool stays saturated for queue_timeout
+        """
+        if not stored_hash:
+            return False
+        return self._run(self._verify_sync, password, stored_hash)
+    
+    def needs_rehash(self, stored_hash: str) -> bool:
+        """Check whether a stored hash uses an outdated scheme or cost"""
+        parts = stored_hash.split('$')
+        if parts[0] != self.scheme:
+            return True
+        if self.scheme == SCHEME_SCRYPT:
+            return parts[1:4] != [str(self.scrypt_n), str(self.scrypt_r), str(self.scrypt_p)]
+        return parts[1] != str(self.pbkdf2_iterations)
+    
+    def shutdown(self):
+        """Stop the worker pool; it is recreated on next use"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+    
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HasherBusyError("Too many concurrent password checks, please retry")
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created on first use so importing the app starts no threads
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.num_workers,
+                        thread_name_prefix='password-hasher'
+                    )
+        return self._executor
+    
+    def _hash_sync(self, password: str) -> str:
+        salt = secrets.token_bytes(SALT_BYTES)
+        if self.scheme == SCHEME_SCRYPT:
+            key = self._scrypt(password, salt, self.scrypt_n, self.scrypt_r, self.scrypt_p)
+            return (f"{SCHEME_SCRYPT}${self.scrypt_n}${self.scrypt_r}${self.scrypt_p}"
+                    f"${_b64encode(salt)}${_b64encode(key)}")
+        
+        key = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.pbkdf2_iterations, KEY_BYTES)
+        return f"{SCHEME_PBKDF2}${self.pbkdf2_iterations}${_b64encode(salt)}${_b64encode(key)}"
+    
+    def _verify_sync(self, password: str, stored_hash: str) -> bool:
+        parts = stored_hash.split('$')
+        
+        try:
+            if parts[0] == SCHEME_SCRYPT and len(parts) == 6:
+                n, r, p = int(parts[1]), int(parts[2]), int(parts[3])
+                expected = _b64decode(parts[5])
+                actual = self._scrypt(password, _b64decode(parts[4]), n, r, p, len(expected))
+            elif parts[0] == SCHEME_PBKDF2 and len(parts) == 4:
+                expected = _b64decode(parts[3])
+                actual = hashlib.pbkdf2_hmac('sha256', password.encode(), _b64decode(parts[2]),
+                                             int(parts[1]), len(expected))
+            elif len(parts) == 1:
+                # Legacy unsalted SHA-256 hex digest
+                expected = stored_hash.encode()
+                actual = hashlib.sha256(password.encode()).hexdigest().encode()
+            else:
+                return False
+        except (ValueError, TypeError) as e:
+            print(f"Error verifying password hash: {str(e)}")
+            return False
+        
+        return hmac.compare_digest(actual, expected)
+    
+    @staticmethod
+    def _scrypt(password: str, salt: bytes, n: int, r: int, p: int,
+                length: int = KEY_BYTES) -> bytes:
+        # Raise OpenSSL's 32 MB cap to what these parameters need, plus slack
+        maxmem = 128 * n * r * p + 128 * n * r + 1024 * 1024
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=maxmem, dklen=length)
+
+
+# Shared hasher used by the auth service
+password_hasher = PasswordHasher()
@@ -4,7 +4,10 @@ Handles payment collection and refund operations using Stripe
 """
 import os
 import secrets
-from typing import Dict
+from typing import Optional
+from data.storage import storage
+from services.cache import LRUCache
+from services.payment_gateway import stripe_gateway, idempotency_key
 
 try:
     import stripe
@@ -17,9 +20,12 @@ except ImportError:
 class PaymentService:
     """Service for managing payment operations"""
     
-    # Simulated payment storage (used in simulation mode)
-    _payments: Dict[str, dict] = {}
-    _refunds: Dict[str, dict] = {}
+    # Per-process cache in front of the payments table. Only refunded
+    # payments are cached: that status is final, so a cached record can
+    # never disagree with what another worker would read from storage.
+    PAYMENT_CACHE_SIZE = int(os.environ.get('PAYMENT_CACHE_SIZE', '10000'))
+    PAYMENT_CACHE_TTL_SECONDS = float(os.environ.get('PAYMENT_CACHE_TTL_SECONDS', '3600'))
+    _payment_cache = LRUCache(PAYMENT_CACHE_SIZE, PAYMENT_CACHE_TTL_SECONDS)
     
     # Stripe configuration
     _stripe_configured = False
@@ -37,7 +43,7 @@ class PaymentService:
         stripe_secret_key = os.environ.get('STRIPE_SECRET_KEY')
         
         if stripe_secret_key:
-            stripe.api_key = stripe_secret_key
+            stripe_gateway.configure(stripe_secret_key)
             PaymentService._stripe_configured = True
             print("Stripe payment gateway configured successfully")
         else:
@@ -50,7 +56,37 @@ class PaymentService:
         return STRIPE_AVAILABLE and PaymentService._stripe_configured
     
     @staticmethod
-    def collect_payment(charge_id: str) -> dict:
+    def _save_payment(payment_record: dict):
+        """
+        Persist a payment record
+        
+        The money has already moved when this runs, so a storage failure is
+        logged rather than reported as a failed payment.
+        """
+        try:
+            storage.put_payment(payment_record)
+        except Exception as e:
+            print(f"Warning: Could not store payment {payment_record['chargeId']}: {str(e)}")
+    
+    @staticmethod
+    def _save_refund(refund_key: str, charge_id: str, refund_record: dict) -> dict:
+        """
+        Persist a refund and mark its payment refunded
+        
+        Returns:
+            The refund stored under refund_key, which is an earlier one if
+            another worker recorded a refund for the same key first
+        """
+        try:
+            refund_record = storage.record_refund(refund_key, refund_record)
+            # Update payment status if exists
+            storage.mark_payment_refunded(charge_id)
+        except Exception as e:
+            print(f"Warning: Could not store refund for charge {charge_id}: {str(e)}")
+        return refund_record
+    
+    @staticmethod
+    def collect_payment(charge_id: str, booking_id: Optional[str] = None) -> dict:
         """
         Collect payment from a pre-authorized charge
         
@@ -62,6 +98,8 @@ class PaymentService:
         
         Args:
             charge_id: Pre-authorization charge ID or payment intent ID
+            booking_id: Booking being paid for; makes the capture idempotent
+                per booking
             
         Returns:
             Dictionary containing:
@@ -76,11 +114,12 @@ class PaymentService:
         
         # Real Stripe implementation
         if PaymentService._is_using_real_stripe():
+            capture_key = idempotency_key('capture', booking_id, charge_id)
             try:
                 # Check if this is a PaymentIntent or a Charge ID
                 if charge_id.startswith('pi_'):
                     # This is a PaymentIntent - capture it
-                    payment_intent = stripe.PaymentIntent.capture(charge_id)
+                    payment_intent = stripe_gateway.capture_payment_intent(charge_id, capture_key)
                     
                     payment_record = {
                         'chargeId': charge_id,
@@ -90,7 +129,7 @@ class PaymentService:
                         'currency': payment_intent.currency
                     }
                     
-                    PaymentService._payments[charge_id] = payment_record
+                    PaymentService._save_payment(payment_record)
                     
                     return {
                         'receiptUrl': payment_record['receiptUrl'],
@@ -99,7 +138,7 @@ class PaymentService:
                     
                 elif charge_id.startswith('ch_'):
                     # This is a Charge ID - capture it
-                    charge = stripe.Charge.capture(charge_id)
+                    charge = stripe_gateway.capture_charge(charge_id, capture_key)
                     
                     payment_record = {
                         'chargeId': charge_id,
@@ -109,7 +148,7 @@ class PaymentService:
                         'currency': charge.currency
                     }
                     
-                    PaymentService._payments[charge_id] = payment_record
+                    PaymentService._save_payment(payment_record)
                     
                     return {
                         'receiptUrl': payment_record['receiptUrl'],
@@ -118,11 +157,12 @@ class PaymentService:
                 else:
                     # Assume it's a test token or other ID - try to create a charge
                     # This is for backward compatibility with test scenarios
-                    charge = stripe.Charge.create(
+                    charge = stripe_gateway.create_charge(
+                        source=charge_id,
                         amount=15000,  # $150.00 in cents
                         currency='usd',
-                        source=charge_id,
-                        description='Airline booking payment'
+                        description='Airline booking payment',
+                        idempotency_key=capture_key
                     )
                     
                     payment_record = {
@@ -133,7 +173,7 @@ class PaymentService:
                         'currency': charge.currency
                     }
                     
-                    PaymentService._payments[charge.id] = payment_record
+                    PaymentService._save_payment(payment_record)
                     
                     return {
                         'receiptUrl': payment_record['receiptUrl'],
@@ -174,7 +214,7 @@ class PaymentService:
                 'mode': 'simulation'
             }
             
-            PaymentService._payments[charge_id] = payment_record
+            PaymentService._save_payment(payment_record)
             
             return {
                 'receiptUrl': receipt_url,
@@ -182,7 +222,7 @@ class PaymentService:
             }
     
     @staticmethod
-    def refund_payment(charge_id: str) -> dict:
+    def refund_payment(charge_id: str, booking_id: Optional[str] = None) -> dict:
         """
         Refund a payment from a given charge ID
         
@@ -192,8 +232,12 @@ class PaymentService:
         In simulation mode (when STRIPE_SECRET_KEY is not set):
         - Simulates refund for testing
         
+        Refunds are idempotent per booking: a saga rollback followed by a
+        cancellation, or a retried request, refunds only once.
+        
         Args:
             charge_id: Pre-authorization charge ID or payment intent ID
+            booking_id: Booking being refunded
             
         Returns:
             Dictionary containing refund ID
@@ -204,13 +248,15 @@ class PaymentService:
         if not charge_id:
             raise ValueError("Invalid Charge ID")
         
+        refund_key = idempotency_key('refund', booking_id, charge_id)
+        
         # Real Stripe implementation
         if PaymentService._is_using_real_stripe():
             try:
                 # Check if this is a PaymentIntent or a Charge ID
                 if charge_id.startswith('pi_'):
                     # Get the PaymentIntent to find the charge
-                    payment_intent = stripe.PaymentIntent.retrieve(charge_id)
+                    payment_intent = stripe_gateway.retrieve_payment_intent(charge_id)
                     
                     # Get the latest charge from the payment intent
                     if payment_intent.latest_charge:
@@ -221,7 +267,7 @@ class PaymentService:
                     charge_id_to_refund = charge_id
                 
                 # Create the refund
-                refund = stripe.Refund.create(charge=charge_id_to_refund)
+                refund = stripe_gateway.create_refund(charge_id_to_refund, refund_key)
                 
                 refund_record = {
                     'refundId': refund.id,
@@ -231,11 +277,7 @@ class PaymentService:
                     'currency': refund.currency
                 }
                 
-                PaymentService._refunds[refund.id] = refund_record
-                
-                # Update payment status if exists
-                if charge_id in PaymentService._payments:
-                    PaymentService._payments[charge_id]['status'] = 'refunded'
+                PaymentService._save_refund(refund_key, charge_id, refund_record)
                 
                 return {
                     'refundId': refund.id
@@ -258,6 +300,12 @@ class PaymentService:
         
         # Simulation mode
         else:
+            previous = storage.get_refund(refund_key)
+            if previous:
+                return {
+                    'refundId': previous['refundId']
+                }
+            
             print(f"[SIMULATION] Refunding payment for charge: {charge_id}")
             
             # Simulate refund processing
@@ -270,14 +318,11 @@ class PaymentService:
                 'mode': 'simulation'
             }
             
-            PaymentService._refunds[refund_id] = refund_record
-            
-            # Update payment status if exists
-            if charge_id in PaymentService._payments:
-                PaymentService._payments[charge_id]['status'] = 'refunded'
+            # A concurrent refund for the same key may have been recorded first
+            refund_record = PaymentService._save_refund(refund_key, charge_id, refund_record)
             
             return {
-                'refundId': refund_id
+                'refundId': refund_record['refundId']
             }
     
     @staticmethod
@@ -294,16 +339,22 @@ class PaymentService:
         Raises:
             ValueError: If payment not found
         """
-        # Try to get from local cache first
-        payment = PaymentService._payments.get(charge_id)
+        # Try the local cache, then the payments table
+        payment = PaymentService._payment_cache.get(charge_id)
+        if payment:
+            return payment
+        
+        payment = storage.get_payment(charge_id)
         if payment:
+            if payment.get('status') == 'refunded':
+                PaymentService._payment_cache.set(charge_id, payment)
             return payment
         
         # If using real Stripe, try to retrieve from Stripe API
         if PaymentService._is_using_real_stripe():
             try:
                 if charge_id.startswith('pi_'):
-                    payment_intent = stripe.PaymentIntent.retrieve(charge_id)
+                    payment_intent = stripe_gateway.retrieve_payment_intent(charge_id)
                     return {
                         'chargeId': payment_intent.id,
                         'amount': payment_intent.amount,
@@ -311,7 +362,7 @@ class PaymentService:
                         'currency': payment_intent.currency
                     }
                 elif charge_id.startswith('ch_'):
-                    charge = stripe.Charge.retrieve(charge_id)
+                    charge = stripe_gateway.retrieve_charge(charge_id)
                     return {
                         'chargeId': charge.id,
                         'amount': charge.amount,
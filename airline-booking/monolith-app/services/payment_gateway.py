@@ -0,0 +1,153 @@
+"""
+Payment Gateway
+Stripe API calls over a pooled HTTP client with per-call deadlines,
+bounded retries with jitter and idempotency keys
+"""
+import os
+import random
+import time
+from typing import Callable, Optional
+
+try:
+    import requests
+    import stripe
+    STRIPE_AVAILABLE = True
+except ImportError:
+    STRIPE_AVAILABLE = False
+
+
+class StripeGateway:
+    """
+    Thin wrapper around the Stripe library
+    
+    All calls share one requests session whose connection pool is sized for
+    the web server's threads, so TLS connections to Stripe are reused
+    instead of being opened per request. Every mutating call carries an
+    idempotency key, which makes retrying it safe: Stripe replays the
+    original result instead of capturing or refunding twice.
+    """
+    
+    # Per-attempt socket timeouts (connect, read)
+    CONNECT_TIMEOUT_SECONDS = float(os.environ.get('PAYMENT_CONNECT_TIMEOUT_SECONDS', '3'))
+    READ_TIMEOUT_SECONDS = float(os.environ.get('PAYMENT_READ_TIMEOUT_SECONDS', '10'))
+    # Overall budget for a call including retries
+    DEADLINE_SECONDS = float(os.environ.get('PAYMENT_DEADLINE_SECONDS', '20'))
+    MAX_RETRIES = int(os.environ.get('PAYMENT_MAX_RETRIES', '2'))
+    BACKOFF_SECONDS = float(os.environ.get('PAYMENT_BACKOFF_SECONDS', '0.25'))
+    POOL_SIZE = int(os.environ.get('PAYMENT_POOL_SIZE', '32'))
+    
+    def __init__(self):
+        self._configured = False
+    
+    def configure(self, api_key: str):
+        """Point the Stripe library at the pooled client"""
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.POOL_SIZE
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        
+        stripe.api_key = api_key
+        # Lets tests and load runs target fake_payment_gateway.py
+        api_base = os.environ.get('STRIPE_API_BASE')
+        if api_base:
+            stripe.api_base = api_base
+        stripe.default_http_client = stripe.http_client.RequestsClient(
+            timeout=(self.CONNECT_TIMEOUT_SECONDS, self.READ_TIMEOUT_SECONDS),
+            session=session
+        )
+        # Retries are handled here, with a deadline and jitter
+        stripe.max_network_retries = 0
+        self._configured = True
+    
+    @property
+    def configured(self) -> bool:
+        """Check whether configure() has been called"""
+        return self._configured
+    
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        # Network failures, timeouts, rate limiting and Stripe-side 5xx errors
+        return isinstance(error, (stripe.error.APIConnectionError,
+                                  stripe.error.RateLimitError,
+                                  stripe.error.APIError))
+    
+    def call(self, operation: Callable, *args, **kwargs):
+        """
+        Run a Stripe operation, retrying transient failures until the deadline
+        
+        Mutating operations must be passed an idempotency_key so that a
+        retry after a timeout cannot repeat the side effect. A retry is only
+        started if it can run into its full socket timeouts and still end
+        before the deadline, so a call never takes longer than
+        DEADLINE_SECONDS (or one attempt, if the deadline is shorter).
+        
+        Raises:
+            stripe.error.StripeError: The last error once retries or the
+                deadline are exhausted, or any non-retryable error
+        """
+        deadline = time.monotonic() + self.DEADLINE_SECONDS
+        attempt_timeout = self.CONNECT_TIMEOUT_SECONDS + self.READ_TIMEOUT_SECONDS
+        attempt = 0
+        
+        while True:
+            try:
+                return operation(*args, **kwargs)
+            except Exception as e:
+                if not self._is_retryable(e) or attempt >= self.MAX_RETRIES:
+                    raise
+                
+                # Exponential backoff with full jitter, within the deadline
+                delay = random.uniform(0, self.BACKOFF_SECONDS * (2 ** attempt))
+                if time.monotonic() + delay + attempt_timeout > deadline:
+                    raise
+                print(f"Retrying payment call after error: {str(e)}")
+                time.sleep(delay)
+                attempt += 1
+    
+    def capture_payment_intent(self, payment_intent_id: str, idempotency_key: str):
+        """Capture an authorized PaymentIntent"""
+        return self.call(stripe.PaymentIntent.capture, payment_intent_id,
+                         idempotency_key=idempotency_key)
+    
+    def capture_charge(self, charge_id: str, idempotency_key: str):
+        """Capture an authorized Charge"""
+        return self.call(stripe.Charge.capture, charge_id, idempotency_key=idempotency_key)
+    
+    def create_charge(self, source: str, amount: int, currency: str,
+                      description: str, idempotency_key: str):
+        """Create and capture a Charge from a payment source"""
+        return self.call(stripe.Charge.create, amount=amount, currency=currency,
+                         source=source, description=description,
+                         idempotency_key=idempotency_key)
+    
+    def create_refund(self, charge_id: str, idempotency_key: str):
+        """Refund a Charge in full"""
+        return self.call(stripe.Refund.create, charge=charge_id, idempotency_key=idempotency_key)
+    
+    def retrieve_payment_intent(self, payment_intent_id: str):
+        """Get a PaymentIntent"""
+        return self.call(stripe.PaymentIntent.retrieve, payment_intent_id)
+    
+    def retrieve_charge(self, charge_id: str):
+        """Get a Charge"""
+        return self.call(stripe.Charge.retrieve, charge_id)
+
+
+def idempotency_key(action: str, booking_id: Optional[str], charge_id: str) -> str:
+    """
+    Build the idempotency key for a payment action
+    
+    Keys are derived from the booking, so every retry, saga rollback or
+    cancellation of the same booking maps to one capture and one refund.
+    Calls made outside a booking fall back to the charge ID.
+    """
+    if booking_id:
+        return f"booking-{booking_id}-{action}"
+    return f"charge-{charge_id}-{action}"
+
+
+# Shared gateway, configured on first use by the payment service
+stripe_gateway = StripeGateway()
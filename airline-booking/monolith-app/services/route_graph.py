@@ -0,0 +1,159 @@
+"""
+Route Graph
+In-memory index of flight schedules for answering direct and one-stop
+connection queries without a storage scan per query
+"""
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+from data.base import SCHEDULE_FIELDS
+
+
+def _parse_time(value: str) -> datetime:
+    # Dates without a time are taken as midnight; times without an offset as UTC
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class RouteGraph:
+    """
+    Flight schedules indexed by departure airport and date
+    
+    Built from a full read of the flight schedules and rebuilt once it is
+    older than refresh_seconds; writes made through this process are
+    applied in between with upsert(). Seat counts are not kept here:
+    callers read them fresh for the flights a query returns.
+    """
+    
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._legs: Dict[str, dict] = {}
+        # (airport, date) -> flight IDs departing there that day
+        self._by_origin: Dict[Tuple[str, str], set] = {}
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+    
+    @staticmethod
+    def _leg(flight: dict) -> dict:
+        leg = {field: flight.get(field) for field in SCHEDULE_FIELDS}
+        leg['departs'] = _parse_time(flight['departureDate'])
+        leg['arrives'] = _parse_time(flight['arrivalDate'])
+        return leg
+    
+    def _index_locked(self, leg: dict):
+        self._legs[leg['id']] = leg
+        key = (leg['departureAirportCode'], leg['departureDate'][:10])
+        self._by_origin.setdefault(key, set()).add(leg['id'])
+    
+    def _unindex_locked(self, flight_id: str):
+        leg = self._legs.pop(flight_id, None)
+        if leg is not None:
+            key = (leg['departureAirportCode'], leg['departureDate'][:10])
+            self._by_origin.get(key, set()).discard(flight_id)
+    
+    def refresh(self, load: Callable[[], List[dict]], force: bool = False):
+        """
+        Rebuild the graph from load() if it is missing or stale
+        
+        Only one thread rebuilds; the others keep answering from the
+        current graph in the meantime.
+        """
+        if not force and self._built_at is not None and \
+                time.monotonic() - self._built_at < self.refresh_seconds:
+            return
+        if not self._refresh_lock.acquire(blocking=self._built_at is None):
+            return
+        
+        try:
+            try:
+                flights = load()
+            except Exception as e:
+                if self._built_at is None:
+                    raise
+                # Keep answering from the previous graph
+                print(f"Error refreshing route graph: {str(e)}")
+                return
+            
+            legs = []
+            for flight in flights:
+                try:
+                    legs.append(self._leg(flight))
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"Skipping flight {flight.get('id')} in route graph: {str(e)}")
+            
+            with self._lock:
+                self._legs = {}
+                self._by_origin = {}
+                for leg in legs:
+                    self._index_locked(leg)
+                self._built_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+    
+    def upsert(self, flight: dict):
+        """Add or replace one flight's schedule"""
+        leg = self._leg(flight)
+        with self._lock:
+            self._unindex_locked(leg['id'])
+            self._index_locked(leg)
+    
+    def remove(self, flight_id: str):
+        """Drop one flight"""
+        with self._lock:
+            self._unindex_locked(flight_id)
+    
+    def _departing(self, airport: str, day: date) -> List[dict]:
+        return [self._legs[flight_id] for flight_id in self._by_origin.get((airport, day.isoformat()), ())]
+    
+    def itineraries(self, origin: str, destination: str, departure_date: str,
+                    min_layover: timedelta, max_layover: timedelta,
+                    max_results: int) -> List[dict]:
+        """
+        Direct flights and one-stop connections departing on a date
+        
+        A connection's layover is the time between the first leg's arrival
+        and the second leg's departure, within [min_layover, max_layover].
+        
+        Returns:
+            Itineraries, fastest first, each with flightIds, stops,
+            layoverMinutes, departureDate, arrivalDate and totalPrice
+        """
+        day = date.fromisoformat(departure_date)
+        found = []
+        
+        with self._lock:
+            for first in self._departing(origin, day):
+                if first['arrivalAirportCode'] == destination:
+                    found.append((first,))
+                    continue
+                if first['arrivalAirportCode'] == origin:
+                    continue
+                
+                # Second legs can leave on any day the layover window reaches
+                earliest = first['arrives'] + min_layover
+                latest = first['arrives'] + max_layover
+                connection_day = earliest.date()
+                while connection_day <= latest.date():
+                    for second in self._departing(first['arrivalAirportCode'], connection_day):
+                        if second['arrivalAirportCode'] == destination and \
+                                earliest <= second['departs'] <= latest:
+                            found.append((first, second))
+                    connection_day += timedelta(days=1)
+        
+        found.sort(key=lambda legs: (legs[-1]['arrives'] - legs[0]['departs'], len(legs)))
+        return [self._itinerary(legs) for legs in found[:max_results]]
+    
+    @staticmethod
+    def _itinerary(legs: tuple) -> dict:
+        layover = sum(((legs[index + 1]['departs'] - legs[index]['arrives'])
+                       for index in range(len(legs) - 1)), timedelta())
+        return {
+            'flightIds': [leg['id'] for leg in legs],
+            'stops': len(legs) - 1,
+            'layoverMinutes': int(layover.total_seconds() // 60),
+            'departureDate': legs[0]['departureDate'],
+            'arrivalDate': legs[-1]['arrivalDate'],
+            'totalPrice': sum(leg['ticketPrice'] or 0 for leg in legs)
+        }
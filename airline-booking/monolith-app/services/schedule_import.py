@@ -0,0 +1,322 @@
+"""
+Schedule Import
+Bulk loads flight schedules from CSV or JSON Lines files into storage with
+batched writes on a thread pool, resuming from a checkpoint after a failure
+"""
+import csv
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+from data.storage import storage
+from services.catalog import CatalogService
+
+AIRPORT_CODE_PATTERN = re.compile(r'^[A-Z]{3}$')
+
+REQUIRED_FIELDS = ('id', 'departureDate', 'departureAirportCode', 'arrivalDate',
+                   'arrivalAirportCode', 'ticketPrice', 'flightNumber', 'maximumSeating')
+OPTIONAL_FIELDS = ('departureAirportName', 'departureCity', 'departureLocale',
+                   'arrivalAirportName', 'arrivalCity', 'arrivalLocale',
+                   'ticketCurrency', 'seatCapacity')
+
+
+def _parse_int(row: dict, field: str) -> int:
+    value = row[field]
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"{field} must be a whole number")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a whole number")
+
+
+def _parse_date(row: dict, field: str) -> datetime:
+    try:
+        return datetime.fromisoformat(str(row[field]).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"{field} must be an ISO 8601 date or date-time")
+
+
+def validate_row(row: dict) -> dict:
+    """
+    Check one schedule row and convert it to a flight
+    
+    CSV values arrive as strings, so numbers are parsed here; empty optional
+    columns are dropped. seatCapacity defaults to maximumSeating and
+    ticketCurrency to USD.
+    
+    Raises:
+        ValueError: Describing the first problem found
+    """
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    
+    flight = {field: row[field] for field in REQUIRED_FIELDS}
+    flight.update({field: row[field] for field in OPTIONAL_FIELDS if row.get(field) not in (None, '')})
+    flight['id'] = str(flight['id']).strip()
+    
+    for field in ('departureAirportCode', 'arrivalAirportCode'):
+        flight[field] = str(flight[field]).strip().upper()
+        if not AIRPORT_CODE_PATTERN.match(flight[field]):
+            raise ValueError(f"{field} must be a three-letter airport code")
+    
+    departs = _parse_date(flight, 'departureDate')
+    arrives = _parse_date(flight, 'arrivalDate')
+    if (departs.tzinfo is None) != (arrives.tzinfo is None):
+        raise ValueError("departureDate and arrivalDate must both have or both lack a UTC offset")
+    if arrives < departs:
+        raise ValueError("arrivalDate is before departureDate")
+    
+    flight['flightNumber'] = _parse_int(flight, 'flightNumber')
+    flight['maximumSeating'] = _parse_int(flight, 'maximumSeating')
+    flight['seatCapacity'] = _parse_int(flight, 'seatCapacity') if 'seatCapacity' in flight \
+        else flight['maximumSeating']
+    if flight['maximumSeating'] <= 0:
+        raise ValueError("maximumSeating must be positive")
+    if not 0 <= flight['seatCapacity'] <= flight['maximumSeating']:
+        raise ValueError("seatCapacity must be between 0 and maximumSeating")
+    
+    try:
+        price = float(flight['ticketPrice'])
+    except (TypeError, ValueError):
+        raise ValueError("ticketPrice must be a number")
+    if price < 0:
+        raise ValueError("ticketPrice must not be negative")
+    flight['ticketPrice'] = int(price) if price.is_integer() else price
+    flight['ticketCurrency'] = str(flight.get('ticketCurrency', 'USD')).upper()
+    return flight
+
+
+class ScheduleImporter:
+    """
+    Import of one schedule file
+    
+    Rows are read one at a time and grouped into batches, which worker
+    threads write with CatalogService.put_flights. At most two batches per
+    worker are in flight, so reading waits for storage instead of buffering
+    the whole file. The checkpoint records the last line up to which every
+    batch has been written; an interrupted import run again resumes after
+    it. Rejected rows go to <file>.rejects.jsonl with the reason, and the
+    checkpoint is removed once the whole file is in.
+    
+    Existing flights keep the seats already sold: their seat count is
+    carried over, adjusted by any change to maximumSeating. Flights with
+    sharded seats are rejected, since replacing them would orphan their
+    seat buckets. Imports should not run alongside heavy booking traffic
+    on the same flights, as the seat count is read before the write.
+    """
+    
+    NUM_WORKERS = int(os.environ.get('IMPORT_WORKERS', '4'))
+    BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '500'))
+    # Seconds between progress lines
+    PROGRESS_INTERVAL = 2.0
+    
+    def __init__(self, path: str, num_workers: Optional[int] = None,
+                 batch_size: Optional[int] = None):
+        if not path.endswith(('.csv', '.jsonl')):
+            raise ValueError("Schedule file must be .csv or .jsonl")
+        self.path = path
+        self.num_workers = max(1, num_workers or self.NUM_WORKERS)
+        self.batch_size = max(1, batch_size or self.BATCH_SIZE)
+        self.checkpoint_path = f"{path}.checkpoint"
+        self.rejects_path = f"{path}.rejects.jsonl"
+        
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.num_workers * 2)
+        # Batch sequence number -> last line it covers, until written
+        self._pending = {}
+        self._done = set()
+        self._next_to_commit = 0
+        self._committed_line = 0
+        self._error = None
+        self.written = 0
+        self.rejected = 0
+    
+    def _rows(self, skip_to: int) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+        """Yield (line number, row, parse error) for lines after skip_to"""
+        with open(self.path, newline='', encoding='utf-8') as f:
+            if self.path.endswith('.csv'):
+                reader = csv.DictReader(f)
+                for row in reader:
+                    if reader.line_num > skip_to:
+                        yield reader.line_num, row, None
+            else:
+                for line_number, line in enumerate(f, 1):
+                    if line_number <= skip_to or not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError as e:
+                        yield line_number, None, f"Invalid JSON: {str(e)}"
+                        continue
+                    if not isinstance(row, dict):
+                        yield line_number, None, "Line is not a JSON object"
+                        continue
+                    yield line_number, row, None
+    
+    def _signature(self) -> dict:
+        stat = os.stat(self.path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+    
+    def _load_checkpoint(self) -> int:
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('file') != self._signature():
+            raise ValueError(f"{self.path} changed since the checkpoint was written, "
+                             f"run again with --restart")
+        self.written = checkpoint.get('written', 0)
+        self.rejected = checkpoint.get('rejected', 0)
+        return checkpoint['line']
+    
+    def _save_checkpoint_locked(self):
+        temp_path = f"{self.checkpoint_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'file': self._signature(), 'line': self._committed_line,
+                       'written': self.written, 'rejected': self.rejected}, f)
+        os.replace(temp_path, self.checkpoint_path)
+    
+    def _carry_over_seats(self, flights: List[dict]) -> Tuple[List[dict], List[Tuple[dict, str]]]:
+        """Keep sold seats of existing flights; reject sharded ones"""
+        existing = storage.get_flights([flight['id'] for flight in flights])
+        accepted, rejected = [], []
+        for flight in flights:
+            current = existing.get(flight['id'])
+            if current is None:
+                accepted.append(flight)
+                continue
+            if current.get('seatShards'):
+                rejected.append((flight, "Flight has sharded seats and cannot be replaced"))
+                continue
+            seats = current['seatCapacity'] + flight['maximumSeating'] - current['maximumSeating']
+            if seats < 0:
+                rejected.append((flight, f"maximumSeating is below the "
+                                         f"{current['maximumSeating'] - current['seatCapacity']} seats already sold"))
+                continue
+            accepted.append({**flight, 'seatCapacity': seats})
+        return accepted, rejected
+    
+    def _write_batch(self, sequence: int, flights: List[dict], rejected: List[dict], rejects):
+        try:
+            if self._error is None and flights:
+                # Later rows for the same flight replace earlier ones
+                flights = list({flight['id']: flight for flight in flights}.values())
+                flights, conflicts = self._carry_over_seats(flights)
+                for flight, reason in conflicts:
+                    rejected.append({'line': flight.pop('_line'), 'error': reason, 'row': flight})
+                for flight in flights:
+                    flight.pop('_line', None)
+                CatalogService.put_flights(flights)
+            if self._error is None:
+                with self._lock:
+                    # Rejects are only recorded once their batch is written,
+                    # so a resumed import does not repeat them
+                    for reject in rejected:
+                        rejects.write(json.dumps(reject, default=str) + '\n')
+                    rejects.flush()
+                    self.written += len(flights)
+                    self.rejected += len(rejected)
+                    self._done.add(sequence)
+                    # Advance the checkpoint over the contiguous written batches
+                    while self._next_to_commit in self._done:
+                        self._done.discard(self._next_to_commit)
+                        self._committed_line = self._pending.pop(self._next_to_commit)
+                        self._next_to_commit += 1
+                    self._save_checkpoint_locked()
+        except Exception as e:
+            with self._lock:
+                if self._error is None:
+                    self._error = e
+        finally:
+            self._slots.release()
+    
+    def run(self, restart: bool = False) -> dict:
+        """
+        Import the file, printing progress
+        
+        Args:
+            restart: Ignore any checkpoint and start from the first line
+        
+        Returns:
+            Stats with written, rejected, elapsed seconds and rows per second
+        
+        Raises:
+            ValueError: If a batch could not be written; the checkpoint keeps
+                the progress made so far
+        """
+        if restart:
+            for stale_path in (self.checkpoint_path, self.rejects_path):
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+        resume_line = self._load_checkpoint()
+        self._committed_line = resume_line
+        resumed_rows = self.written + self.rejected
+        if resume_line:
+            print(f"Resuming after line {resume_line} ({self.written} written, {self.rejected} rejected)")
+        
+        start = time.perf_counter()
+        last_progress = start
+        sequence = 0
+        batch, rejected = [], []
+        line_number = resume_line
+        
+        def submit(executor, last_line):
+            nonlocal sequence, batch, rejected
+            # Blocks while the workers are behind, which pauses reading
+            self._slots.acquire()
+            with self._lock:
+                self._pending[sequence] = last_line
+            executor.submit(self._write_batch, sequence, batch, rejected, rejects)
+            sequence += 1
+            batch, rejected = [], []
+        
+        with open(self.rejects_path, 'a', encoding='utf-8') as rejects, \
+                ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            for line_number, row, error in self._rows(resume_line):
+                if self._error is not None:
+                    break
+                if error is None:
+                    try:
+                        flight = validate_row(row)
+                        flight['_line'] = line_number
+                        batch.append(flight)
+                    except ValueError as e:
+                        error = str(e)
+                if error is not None:
+                    rejected.append({'line': line_number, 'error': error, 'row': row})
+                
+                if len(batch) >= self.batch_size:
+                    submit(executor, line_number)
+                
+                now = time.perf_counter()
+                if now - last_progress >= self.PROGRESS_INTERVAL:
+                    last_progress = now
+                    rows = self.written + self.rejected - resumed_rows
+                    print(f"  line {line_number}: {self.written} written, {self.rejected} rejected, "
+                          f"{rows / (now - start):.0f} rows/sec")
+            
+            if self._error is None and (batch or line_number > self._committed_line):
+                # The last batch also moves the checkpoint past trailing rejects
+                submit(executor, line_number)
+        
+        elapsed = time.perf_counter() - start
+        rows = self.written + self.rejected - resumed_rows
+        stats = {
+            'written': self.written,
+            'rejected': self.rejected,
+            'lastLine': self._committed_line,
+            'elapsedSeconds': round(elapsed, 3),
+            'rowsPerSecond': round(rows / elapsed, 1) if elapsed else 0.0
+        }
+        if self._error is not None:
+            raise ValueError(f"Import stopped after line {self._committed_line}: {str(self._error)}")
+        
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        return stats
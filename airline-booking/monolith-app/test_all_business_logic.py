@@ -136,6 +136,21 @@ def test_auth_service(result: TestResult):
         result.add_pass("1.7 管理员用户检查 - 管理员权限正确")
     except Exception as e:
         result.add_fail("1.7 管理员用户检查", e)
+    
+    # 1.8 令牌用户缓存不含密码且不被调用方修改
+    try:
+        user = AuthService.authenticate_user("test@example.com", "password123")
+        token = AuthService.create_access_token(user)
+        first = AuthService.get_user_from_token(token)
+        first['groups'].append('Admin')
+        first['email'] = "changed@example.com"
+        second = AuthService.get_user_from_token(token)
+        assert set(second) == {'sub', 'email', 'groups'}
+        assert second['email'] == "test@example.com"
+        assert 'Admin' not in second['groups']
+        result.add_pass("1.8 令牌用户缓存 - 不含密码且返回副本")
+    except Exception as e:
+        result.add_fail("1.8 令牌用户缓存", e)
 
 
 def test_catalog_service(result: TestResult):
@@ -235,6 +250,88 @@ def test_catalog_service(result: TestResult):
             
     except Exception as e:
         result.add_fail("2.7 预订满座航班", e)
+    
+    # 2.8 新写入的航班出现在中转搜索中
+    try:
+        from datetime import date, timedelta
+        from app import app
+        
+        day = (date.today() + timedelta(days=30)).isoformat()
+        client = app.test_client()
+        query = f"/flights/search/connections?departureCode=TSA&arrivalCode=TSC&departureDate={day}"
+        
+        # Build the route graph before the flights exist
+        client.get(query)
+        
+        for flight_id, origin, destination, departs, arrives in [
+            ("TST281", "TSA", "TSB", "08:00", "10:00"),
+            ("TST282", "TSB", "TSC", "11:30", "13:30"),
+        ]:
+            CatalogService.put_flight({
+                'id': flight_id,
+                'departureAirportCode': origin,
+                'arrivalAirportCode': destination,
+                'departureDate': f"{day}T{departs}:00",
+                'arrivalDate': f"{day}T{arrives}:00",
+                'ticketPrice': 100,
+                'seatCapacity': 10,
+                'flightNumber': flight_id
+            })
+        
+        response = client.get(query)
+        itineraries = response.get_json().get('outbound', [])
+        found = [[leg['id'] for leg in itinerary['flights']] for itinerary in itineraries]
+        if response.status_code == 200 and ["TST281", "TST282"] in found:
+            result.add_pass("2.8 新写入的航班出现在中转搜索中")
+        else:
+            result.add_fail("2.8 新写入的航班出现在中转搜索中", f"{response.status_code}: {found}")
+    except Exception as e:
+        result.add_fail("2.8 新写入的航班出现在中转搜索中", e)
+    
+    # 2.9 替换已分片的航班
+    try:
+        flight = CatalogService.put_flight({
+            'id': "TST291",
+            'departureAirportCode': "TSA",
+            'arrivalAirportCode': "TSB",
+            'departureDate': "2025-11-20",
+            'arrivalDate': "2025-11-20",
+            'ticketPrice': 100,
+            'seatCapacity': 10,
+            'flightNumber': "TST291"
+        })
+        CatalogService.shard_flight_seats("TST291", 2)
+        try:
+            CatalogService.put_flight(flight)
+            result.add_fail("2.9 替换已分片的航班", "应该抛出 ValueError")
+        except ValueError as e:
+            if "sharded seats" in str(e) and CatalogService.get_flight("TST291")['seatCapacity'] == 10:
+                result.add_pass("2.9 替换已分片的航班 - 正确拒绝")
+            else:
+                result.add_fail("2.9 替换已分片的航班", f"错误消息或座位数不正确: {e}")
+    except Exception as e:
+        result.add_fail("2.9 替换已分片的航班", e)
+    
+    # 2.10 带时间的搜索在写入航班后刷新
+    try:
+        CatalogService.search_flights("TSD", "TSE", "2025-12-01T08:00:00")
+        CatalogService.put_flight({
+            'id': "TST2A1",
+            'departureAirportCode': "TSD",
+            'arrivalAirportCode': "TSE",
+            'departureDate': "2025-12-01T09:00:00",
+            'arrivalDate': "2025-12-01T11:00:00",
+            'ticketPrice': 100,
+            'seatCapacity': 10,
+            'flightNumber': "TST2A1"
+        })
+        flights = CatalogService.search_flights("TSD", "TSE", "2025-12-01T08:00:00")
+        if [flight['id'] for flight in flights] == ["TST2A1"]:
+            result.add_pass("2.10 带时间的搜索在写入航班后刷新")
+        else:
+            result.add_fail("2.10 带时间的搜索在写入航班后刷新", f"返回了 {flights}")
+    except Exception as e:
+        result.add_fail("2.10 带时间的搜索在写入航班后刷新", e)
 
 
 def test_payment_service(result: TestResult):
@@ -646,6 +743,25 @@ def test_edge_cases(result: TestResult):
             result.add_pass("7.6 释放不存在的航班座位 - 正确抛出异常")
     except Exception as e:
         result.add_fail("7.6 释放不存在的航班座位", e)
+    
+    # 7.7 伪造的分页游标
+    try:
+        import base64
+        forged = [
+            base64.urlsafe_b64encode(data).decode().rstrip('=')
+            for data in (b'{"offset":"x"}', b'{"offset":-1}', b'{"id":1}', b'[]')
+        ] + ['not-a-cursor!']
+        for cursor in forged:
+            for read in (lambda: storage.get_bookings_page("customer", cursor=cursor),
+                         lambda: storage.list_users(cursor=cursor)):
+                try:
+                    read()
+                    raise AssertionError(f"游标 {cursor} 应该被拒绝")
+                except ValueError:
+                    pass
+        result.add_pass("7.7 伪造的分页游标 - 正确拒绝")
+    except Exception as e:
+        result.add_fail("7.7 伪造的分页游标", e)
 
 
 def main():
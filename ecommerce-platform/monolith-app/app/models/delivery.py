@@ -4,12 +4,15 @@
 """
 from datetime import datetime
 from app.db import get_delivery_table
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Key
 
 
 class Delivery:
     """配送模型"""
     
+    # 稀疏GSI：只有 NEW 状态的配送项带 isNew，按 createdDate 排序
+    NEW_DELIVERIES_INDEX = 'new-deliveries-index'
+    
     def __init__(self, order_id=None, status='NEW', address=None,
                  created_date=None, modified_date=None):
         """初始化配送对象"""
@@ -107,17 +110,32 @@ class Delivery:
         return Delivery._from_dynamodb_item(item)
     
     @staticmethod
-    def get_new_deliveries(limit=100):
-        """获取所有新配送请求"""
+    def get_new_deliveries(limit=100, exclusive_start_key=None):
+        """
+        获取新配送请求（按创建时间排序，分页）
+        
+        查询只包含 NEW 配送项的稀疏GSI，开销与待配送数量成正比，与表大小无关。
+        
+        参数:
+            limit: 返回数量限制
+            exclusive_start_key: 上一页返回的 LastEvaluatedKey
+        
+        返回:
+            (配送列表, LastEvaluatedKey 或 None)
+        """
         table = get_delivery_table()
         
-        response = table.scan(
-            FilterExpression=Attr('status').eq('NEW'),
-            Limit=limit
-        )
+        kwargs = {
+            'IndexName': Delivery.NEW_DELIVERIES_INDEX,
+            'KeyConditionExpression': Key('isNew').eq('true'),
+            'Limit': limit
+        }
+        if exclusive_start_key:
+            kwargs['ExclusiveStartKey'] = exclusive_start_key
+        response = table.query(**kwargs)
         
         deliveries = [Delivery._from_dynamodb_item(item) for item in response.get('Items', [])]
-        return deliveries
+        return deliveries, response.get('LastEvaluatedKey')
     
     def update_status(self, new_status):
         """更新配送状态"""
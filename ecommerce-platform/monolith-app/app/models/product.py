@@ -2,14 +2,21 @@
 商品模型
 管理商品信息和库存
 """
+import random
+import time
 from datetime import datetime
-from app.db import get_products_table
+from app.db import get_products_table, get_dynamodb_resource
 from boto3.dynamodb.conditions import Key
 
 
 class Product:
     """商品模型"""
     
+    # BatchGetItem 每次请求最多100个键
+    BATCH_GET_SIZE = 100
+    # 未处理键（限流时返回）的最大重试次数
+    BATCH_GET_MAX_ATTEMPTS = 5
+    
     def __init__(self, product_id=None, name=None, category=None, price=None,
                  package=None, tags=None, pictures=None,
                  created_date=None, modified_date=None):
@@ -77,7 +84,9 @@ class Product:
         return result
     
     def save(self):
-        """保存商品到DynamoDB"""
+        """保存商品到DynamoDB，并移除本进程商品缓存中的旧版本"""
+        from app.services import product_cache
+        
         table = get_products_table()
         self.modified_date = datetime.utcnow().isoformat()
         
@@ -94,6 +103,7 @@ class Product:
         }
         
         table.put_item(Item=item)
+        product_cache.invalidate(self.product_id)
         return self
     
     @staticmethod
@@ -109,6 +119,48 @@ class Product:
         item = response['Item']
         return Product._from_dynamodb_item(item)
     
+    @staticmethod
+    def get_many(product_ids):
+        """
+        批量获取商品（BatchGetItem）
+        
+        每100个键一次请求；DynamoDB 限流时返回的未处理键按指数退避加抖动重试。
+        
+        参数:
+            product_ids: 商品ID列表（可重复）
+        
+        返回:
+            {productId: Product}，不存在的商品不在其中
+        
+        异常:
+            RuntimeError: 重试后仍有未处理的键
+        """
+        table = get_products_table()
+        dynamodb = get_dynamodb_resource()
+        unique_ids = list(dict.fromkeys(product_ids))
+        products = {}
+        
+        for start in range(0, len(unique_ids), Product.BATCH_GET_SIZE):
+            keys = [{'productId': product_id}
+                    for product_id in unique_ids[start:start + Product.BATCH_GET_SIZE]]
+            request_items = {table.name: {'Keys': keys}}
+            
+            for attempt in range(Product.BATCH_GET_MAX_ATTEMPTS):
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response.get('Responses', {}).get(table.name, []):
+                    product = Product._from_dynamodb_item(item)
+                    products[product.product_id] = product
+                
+                request_items = response.get('UnprocessedKeys')
+                if not request_items:
+                    break
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+            else:
+                raise RuntimeError(f"Failed to read {len(request_items[table.name]['Keys'])} products "
+                                   f"after {Product.BATCH_GET_MAX_ATTEMPTS} attempts")
+        
+        return products
+    
     @staticmethod
     def get_all(limit=100):
         """获取所有商品（支持分页）"""
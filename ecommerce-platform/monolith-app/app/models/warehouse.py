@@ -10,6 +10,9 @@ from boto3.dynamodb.conditions import Key, Attr
 class PackagingRequest:
     """包装请求模型"""
     
+    # 稀疏GSI：只有 NEW 状态的元数据项带 isNew，按 newDate 排序
+    NEW_REQUESTS_INDEX = 'new-requests-index'
+    
     def __init__(self, order_id=None, status='NEW', products=None,
                  created_date=None, modified_date=None):
         """初始化包装请求对象"""
@@ -36,16 +39,22 @@ class PackagingRequest:
         
         # 在Warehouse表中，使用复合主键（orderId, productId）
         # 为了保持请求级别的元数据，使用特殊的productId: "__metadata"
+        # 元数据项同时保存商品列表，列出新请求时无需再逐个查询
         metadata_item = {
             'orderId': self.order_id,
             'productId': '__metadata',
             'status': self.status,
+            'products': [{
+                'productId': product['productId'],
+                'quantity': int(product.get('quantity', 1))
+            } for product in self.products],
             'createdDate': self.created_date,
             'modifiedDate': self.modified_date
         }
         
-        # 如果状态是NEW，添加newDate字段用于GSI
+        # 如果状态是NEW，添加isNew和newDate字段用于GSI
         if self.status == 'NEW':
+            metadata_item['isNew'] = 'true'
             metadata_item['newDate'] = self.created_date
         
         table.put_item(Item=metadata_item)
@@ -106,26 +115,51 @@ class PackagingRequest:
         )
     
     @staticmethod
-    def get_new_requests(limit=100):
-        """获取所有新包装请求"""
-        table = get_warehouse_table()
+    def get_new_requests(limit=100, exclusive_start_key=None):
+        """
+        获取新包装请求（按创建时间排序，分页）
         
-        # 扫描带有newDate字段的元数据项
-        response = table.scan(
-            FilterExpression=Attr('productId').eq('__metadata') & Attr('status').eq('NEW'),
-            Limit=limit
-        )
+        查询只包含 NEW 元数据项的稀疏GSI，开销与待处理数量成正比，与表大小无关。
+        商品列表直接取自元数据项；旧版本写入的元数据项没有商品列表时，才按订单查询。
         
-        order_ids = [item['orderId'] for item in response.get('Items', [])]
+        参数:
+            limit: 返回数量限制
+            exclusive_start_key: 上一页返回的 LastEvaluatedKey
         
-        # 对每个订单ID，获取完整的包装请求
-        requests = []
-        for order_id in order_ids:
-            request = PackagingRequest.get_by_order_id(order_id)
-            if request:
-                requests.append(request)
+        返回:
+            (包装请求列表, LastEvaluatedKey 或 None)
+        """
+        table = get_warehouse_table()
+        
+        kwargs = {
+            'IndexName': PackagingRequest.NEW_REQUESTS_INDEX,
+            'KeyConditionExpression': Key('isNew').eq('true'),
+            'Limit': limit
+        }
+        if exclusive_start_key:
+            kwargs['ExclusiveStartKey'] = exclusive_start_key
+        response = table.query(**kwargs)
         
-        return requests
+        requests = []
+        for item in response.get('Items', []):
+            if 'products' not in item:
+                request = PackagingRequest.get_by_order_id(item['orderId'])
+                if request:
+                    requests.append(request)
+                continue
+            
+            requests.append(PackagingRequest(
+                order_id=item['orderId'],
+                status=item.get('status', 'NEW'),
+                products=[{
+                    'productId': product['productId'],
+                    'quantity': int(product.get('quantity', 1))
+                } for product in item['products']],
+                created_date=item.get('createdDate'),
+                modified_date=item.get('modifiedDate')
+            ))
+        
+        return requests, response.get('LastEvaluatedKey')
     
     def update_status(self, new_status):
         """更新包装请求状态"""
@@ -140,9 +174,9 @@ class PackagingRequest:
             ':modified_date': self.modified_date
         }
         
-        # 如果状态变更，移除newDate字段
+        # 如果状态变更，移除isNew和newDate字段（离开新请求索引）
         if new_status != 'NEW':
-            update_expression += " REMOVE newDate"
+            update_expression += " REMOVE isNew, newDate"
         
         # 更新元数据项
         table.update_item(
@@ -16,17 +16,23 @@ def get_new_deliveries():
     获取新的配送请求列表
     
     查询参数:
-        limit: 返回数量限制（默认50）
+        limit: 返回数量限制（默认50，最大100）
+        cursor: 上一页返回的 nextCursor
     
     返回:
         {
-            "deliveries": [...]
+            "deliveries": [...],
+            "nextCursor": "..."  # 没有更多数据时为null
         }
     """
-    limit = request.args.get('limit', 50, type=int)
-    deliveries = delivery_service.get_new_deliveries(limit=limit)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 100)
+    try:
+        deliveries, next_cursor = delivery_service.get_new_deliveries(
+            limit=limit, cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     
-    return jsonify({'deliveries': deliveries}), 200
+    return jsonify({'deliveries': deliveries, 'nextCursor': next_cursor}), 200
 
 
 @bp.route('/deliveries/<order_id>', methods=['GET'])
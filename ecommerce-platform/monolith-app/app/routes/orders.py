@@ -5,7 +5,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.services import order_service
-from app.services.delivery_pricing import calculate_delivery_price
+from app.services.delivery_pricing import quote_delivery_price
 
 bp = Blueprint('orders', __name__, url_prefix='/api/orders')
 
@@ -21,6 +21,7 @@ def create_order():
             "products": [...],
             "address": {...},
             "deliveryPrice": 1000,
+            "quoteToken": "...",  # 可选，配送价格接口签发
             "paymentToken": "uuid"
         }
     
@@ -108,7 +109,8 @@ def update_order(order_id):
     请求体:
         {
             "products": [...],  # 可选
-            "deliveryPrice": 1000  # 可选
+            "deliveryPrice": 1000,  # 可选
+            "quoteToken": "..."  # 可选，配送价格接口签发
         }
     
     返回:
@@ -198,7 +200,9 @@ def get_delivery_pricing():
     
     返回:
         {
-            "pricing": 1000
+            "pricing": 1000,
+            "quoteToken": "...",  # 下单时随 deliveryPrice 提交，免去重新计算
+            "quoteExpiresAt": "2024-01-01T12:15:00"
         }
     """
     data = request.get_json()
@@ -206,7 +210,5 @@ def get_delivery_pricing():
     if not data or 'products' not in data or 'address' not in data:
         return jsonify({'message': 'Missing products or address'}), 400
     
-    pricing = calculate_delivery_price(data['products'], data['address'])
-    
-    return jsonify({'pricing': pricing}), 200
+    return jsonify(quote_delivery_price(data['products'], data['address'])), 200
 
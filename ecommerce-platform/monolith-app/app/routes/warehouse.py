@@ -16,17 +16,23 @@ def get_new_packaging_requests():
     获取新的包装请求ID列表
     
     查询参数:
-        limit: 返回数量限制（默认50）
+        limit: 返回数量限制（默认50，最大100）
+        cursor: 上一页返回的 nextCursor
     
     返回:
         {
-            "packagingRequestIds": [...]
+            "packagingRequestIds": [...],
+            "nextCursor": "..."  # 没有更多数据时为null
         }
     """
-    limit = request.args.get('limit', 50, type=int)
-    request_ids = warehouse_service.get_new_packaging_requests(limit=limit)
-    
-    return jsonify({'packagingRequestIds': request_ids}), 200
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 100)
+    try:
+        request_ids, next_cursor = warehouse_service.get_new_packaging_requests(
+            limit=limit, cursor=request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    return jsonify({'packagingRequestIds': request_ids, 'nextCursor': next_cursor}), 200
 
 
 @bp.route('/packaging-requests/<order_id>', methods=['GET'])
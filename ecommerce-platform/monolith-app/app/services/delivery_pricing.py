@@ -2,13 +2,26 @@
 配送定价服务
 计算配送费用
 """
+import abc
+import functools
+import hashlib
+import hmac
+import itertools
+import json
 import math
+import operator
+import time
+from datetime import datetime
 from decimal import Decimal
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+from flask import current_app, has_app_context
+
+from config import DEFAULT_SECRET_KEY
 
 
 # 50*50*50 cm 立方体
-BOX_VOLUME = 500 * 500 * 500
+BOX_SIZE = 500
+BOX_VOLUME = BOX_SIZE * BOX_SIZE * BOX_SIZE
 # 每箱12kg
 BOX_WEIGHT = 12000
 
@@ -33,6 +46,18 @@ COUNTRY_SHIPPING_FEES = {
 }
 
 
+def _to_int(val):
+    """将 Decimal/str 转换为 int，其他类型原样返回"""
+    if isinstance(val, (Decimal, str)):
+        return int(val)
+    return val
+
+
+def _boxes(volume, weight) -> int:
+    """根据总体积和总重量计算箱数"""
+    return max(math.ceil(volume / BOX_VOLUME), math.ceil(weight / BOX_WEIGHT))
+
+
 def count_boxes(packages: List[Dict]) -> int:
     """
     根据商品包装计算箱数
@@ -43,19 +68,13 @@ def count_boxes(packages: List[Dict]) -> int:
     返回:
         需要的箱数
     """
-    def to_int(val):
-        """将 Decimal/str/int 转换为 int"""
-        if isinstance(val, (Decimal, str)):
-            return int(val)
-        return val
-    
     volume = sum([
-        to_int(p.get('width', 0)) * to_int(p.get('length', 0)) * to_int(p.get('height', 0)) 
+        _to_int(p.get('width', 0)) * _to_int(p.get('length', 0)) * _to_int(p.get('height', 0))
         for p in packages
     ])
-    weight = sum([to_int(p.get('weight', 0)) for p in packages])
+    weight = sum([_to_int(p.get('weight', 0)) for p in packages])
     
-    return max(math.ceil(volume / BOX_VOLUME), math.ceil(weight / BOX_WEIGHT))
+    return _boxes(volume, weight)
 
 
 def get_shipping_cost(address: Dict) -> int:
@@ -72,33 +91,272 @@ def get_shipping_cost(address: Dict) -> int:
     return COUNTRY_SHIPPING_FEES.get(country, COUNTRY_SHIPPING_FEES['*'])
 
 
-def calculate_delivery_price(products: List[Dict], address: Dict) -> int:
+def cart_signature(products: List[Dict]) -> Tuple[Tuple, ...]:
     """
-    计算配送价格
+    将购物车规范化为与顺序无关的签名
     
-    参数:
-        products: 商品列表
-        address: 配送地址
+    相同包装的行合并数量，数量为0或负数的行不计入（与逐件展开时不产生包装一致）。
     
     返回:
-        配送价格（单位：分）
+        ((width, length, height, weight, quantity), ...)，按包装排序
     """
-    # 提取所有商品的包装信息
-    packages = []
+    quantities = {}
     for product in products:
-        quantity = product.get('quantity', 1)
         # 确保 quantity 是整数
-        if isinstance(quantity, (Decimal, str)):
-            quantity = int(quantity)
+        quantity = operator.index(_to_int(product.get('quantity', 1)))
+        if quantity <= 0:
+            continue
         
         package = product.get('package', {})
-        # 根据数量重复添加包装信息
-        for _ in range(quantity):
-            packages.append(package)
+        key = tuple(_to_int(package.get(field, 0)) for field in ('width', 'length', 'height', 'weight'))
+        quantities[key] = quantities.get(key, 0) + quantity
+    
+    return tuple(sorted(key + (quantity,) for key, quantity in quantities.items()))
+
+
+class PricingEngine(abc.ABC):
+    """配送箱数估算引擎接口"""
+    
+    name = None
+    
+    @abc.abstractmethod
+    def count_boxes(self, signature: Tuple[Tuple, ...]) -> int:
+        """
+        估算购物车需要的箱数
+        
+        参数:
+            signature: cart_signature() 返回的购物车签名
+        
+        返回:
+            需要的箱数
+        """
+
+
+class VolumeWeightEngine(PricingEngine):
+    """
+    按总体积和总重量估算（默认引擎）
+    
+    按数量加权汇总，耗时只与包装种类数有关，与数量无关。
+    """
+    
+    name = 'volume'
+    
+    def count_boxes(self, signature: Tuple[Tuple, ...]) -> int:
+        volume = sum(width * length * height * quantity
+                     for width, length, height, _, quantity in signature)
+        weight = sum(weight * quantity for _, _, _, weight, quantity in signature)
+        return _boxes(volume, weight)
+
+
+class BinPackingEngine(PricingEngine):
+    """
+    首次适应递减（first-fit decreasing）三维装箱估算
+    
+    商品按体积从大到小依次放入第一个放得下的箱子（考虑6种摆放方向和箱子剩余载重），
+    箱内剩余空间按断头台（guillotine）切分为长方体。
+    放不进箱子的超大商品和尺寸不完整的商品按体积和重量公式计入。
+    件数超过 MAX_UNITS 时耗时不可控，改用公式估算整个购物车。
+    """
+    
+    name = 'bin_packing'
+    
+    # 装箱的最大件数（请求路径的耗时上限）
+    MAX_UNITS = 200
+    
+    def __init__(self):
+        self._fallback = VolumeWeightEngine()
+    
+    def count_boxes(self, signature: Tuple[Tuple, ...]) -> int:
+        if sum(item[4] for item in signature) > self.MAX_UNITS:
+            return self._fallback.count_boxes(signature)
+        
+        packable = []
+        loose = []
+        for width, length, height, weight, quantity in signature:
+            dimensions = tuple(sorted((width, length, height), reverse=True))
+            if min(dimensions) > 0 and 0 <= weight <= BOX_WEIGHT and \
+                    all(size <= BOX_SIZE for size in dimensions):
+                packable.extend([(dimensions, weight)] * quantity)
+            elif any(dimensions) or weight:
+                loose.append((width, length, height, weight, quantity))
+        
+        packable.sort(key=lambda item: (item[0][0] * item[0][1] * item[0][2], item[1]), reverse=True)
+        boxes = self._pack(packable)
+        if loose:
+            boxes += self._fallback.count_boxes(tuple(loose))
+        return boxes
+    
+    @staticmethod
+    def _pack(items: List[Tuple[Tuple, int]]) -> int:
+        """将按体积递减排序的商品装箱，返回箱数"""
+        # 每个箱子：[剩余载重, 空闲空间列表]
+        boxes = []
+        for dimensions, weight in items:
+            for box in boxes:
+                if box[0] >= weight and BinPackingEngine._place(box[1], dimensions):
+                    box[0] -= weight
+                    break
+            else:
+                spaces = [(BOX_SIZE, BOX_SIZE, BOX_SIZE)]
+                BinPackingEngine._place(spaces, dimensions)
+                boxes.append([BOX_WEIGHT - weight, spaces])
+        return len(boxes)
+    
+    @staticmethod
+    def _place(spaces: List[Tuple[int, int, int]], dimensions: Tuple[int, int, int]) -> bool:
+        """
+        将商品放入能容纳它的最小空闲空间，并切分剩余空间
+        
+        返回:
+            是否放得下
+        """
+        best = None
+        for index, space in enumerate(spaces):
+            for a, b, c in dict.fromkeys(itertools.permutations(dimensions)):
+                if a <= space[0] and b <= space[1] and c <= space[2]:
+                    volume = space[0] * space[1] * space[2]
+                    if best is None or volume < best[0]:
+                        best = (volume, index, (a, b, c))
+                    break
+        if best is None:
+            return False
+        
+        _, index, (a, b, c) = best
+        x, y, z = spaces.pop(index)
+        # 断头台切分：商品右侧、前方和上方的剩余空间
+        for space in ((x - a, y, z), (a, y - b, z), (a, b, z - c)):
+            if min(space) > 0:
+                spaces.append(space)
+        return True
+
+
+ENGINES = {engine.name: engine for engine in (VolumeWeightEngine(), BinPackingEngine())}
+DEFAULT_ENGINE = VolumeWeightEngine.name
+
+# 缓存的 (引擎, 购物车签名) 箱数，重复报价和下单校验直接命中
+BOX_CACHE_SIZE = 4096
+
+
+def get_engine(name: Optional[str] = None) -> PricingEngine:
+    """
+    获取配送定价引擎
     
+    参数:
+        name: 引擎名称，默认使用应用配置 DELIVERY_PRICING_ENGINE
+    
+    返回:
+        定价引擎
+    """
+    if name is None:
+        name = current_app.config.get('DELIVERY_PRICING_ENGINE', DEFAULT_ENGINE) \
+            if has_app_context() else DEFAULT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown delivery pricing engine '{name}'")
+    return ENGINES[name]
+
+
+def calculate_delivery_price(products: List[Dict], address: Dict, engine: Optional[str] = None) -> int:
+    """
+    计算配送价格
+    
+    相同包装按数量加权合并，不按件展开，
+    默认引擎的耗时和内存只与商品行数有关，与数量无关。
+    
+    参数:
+        products: 商品列表
+        address: 配送地址
+        engine: 定价引擎名称，默认使用应用配置
+    
+    返回:
+        配送价格（单位：分）
+    """
     # 计算箱数和配送费用
-    boxes = count_boxes(packages)
+    boxes = _cached_boxes(get_engine(engine).name, cart_signature(products))
     cost_per_box = get_shipping_cost(address)
     
     return boxes * cost_per_box
 
+
+@functools.lru_cache(maxsize=BOX_CACHE_SIZE)
+def _cached_boxes(engine_name: str, signature: Tuple[Tuple, ...]) -> int:
+    """按引擎和购物车签名缓存箱数"""
+    return ENGINES[engine_name].count_boxes(signature)
+
+
+def _quote_key() -> Optional[bytes]:
+    """报价令牌签名密钥；未配置或为公开的默认密钥时返回 None，此时不签发也不接受令牌"""
+    secret = current_app.config.get('DELIVERY_QUOTE_SECRET')
+    if not secret or secret == DEFAULT_SECRET_KEY:
+        return None
+    return secret.encode()
+
+
+def _quote_mac(key: bytes, signature: Tuple[Tuple, ...], country: str, engine_name: str,
+               price: int, expires: int) -> str:
+    """报价签名：对规范化的购物车、国家、引擎、价格和过期时间做 HMAC-SHA256"""
+    message = json.dumps([signature, country, engine_name, price, expires], separators=(',', ':'))
+    return hmac.new(key, b'delivery-quote:' + message.encode(), hashlib.sha256).hexdigest()
+
+
+def quote_delivery_price(products: List[Dict], address: Dict) -> Dict:
+    """
+    计算配送价格并签发报价令牌
+    
+    下单时提交令牌，订单服务只需校验签名，无需重新计算价格。
+    未配置 DELIVERY_QUOTE_SECRET 时只返回价格，令牌和过期时间为 None。
+    
+    参数:
+        products: 商品列表
+        address: 配送地址
+    
+    返回:
+        {"pricing": 价格, "quoteToken": 令牌, "quoteExpiresAt": 过期时间}
+    """
+    engine = get_engine()
+    signature = cart_signature(products)
+    price = _cached_boxes(engine.name, signature) * get_shipping_cost(address)
+    
+    key = _quote_key()
+    if key is None:
+        return {'pricing': price, 'quoteToken': None, 'quoteExpiresAt': None}
+    
+    expires = int(time.time()) + current_app.config['DELIVERY_QUOTE_TTL_SECONDS']
+    mac = _quote_mac(key, signature, address.get('country', ''), engine.name, price, expires)
+    return {
+        'pricing': price,
+        'quoteToken': f"{expires}.{mac}",
+        'quoteExpiresAt': datetime.utcfromtimestamp(expires).isoformat()
+    }
+
+
+def verify_delivery_quote(token: str, products: List[Dict], address: Dict, price: int) -> bool:
+    """
+    校验报价令牌
+    
+    令牌未过期，且由本服务为同一购物车（规范化后）、国家、定价引擎和价格签发时有效。
+    未配置 DELIVERY_QUOTE_SECRET 时所有令牌都无效。
+    
+    参数:
+        token: quote_delivery_price() 签发的令牌
+        products: 商品列表
+        address: 配送地址
+        price: 声称的配送价格
+    
+    返回:
+        是否有效
+    """
+    try:
+        expires_text, mac = token.split('.', 1)
+        expires = int(expires_text)
+    except (AttributeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    
+    key = _quote_key()
+    if key is None:
+        return False
+    
+    expected = _quote_mac(key, cart_signature(products), address.get('country', ''), get_engine().name,
+                          price, expires)
+    return hmac.compare_digest(mac, expected)
@@ -2,22 +2,27 @@
 配送服务
 处理配送相关的业务逻辑
 """
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from app.models import Delivery, Order
+from app.utils.pagination import encode_cursor, decode_cursor
 
 
-def get_new_deliveries(limit: int = 50) -> List[Dict]:
+def get_new_deliveries(limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
     """
-    获取新的配送请求列表
+    获取新的配送请求列表（按创建时间排序）
     
     参数:
         limit: 返回数量限制
+        cursor: 上一页返回的游标
     
     返回:
-        配送列表
+        (配送列表, 下一页游标或None)
+    
+    异常:
+        ValueError: 游标无效
     """
-    deliveries = Delivery.get_new_deliveries(limit=limit)
-    return [delivery.to_dict() for delivery in deliveries]
+    deliveries, last_key = Delivery.get_new_deliveries(limit=limit, exclusive_start_key=decode_cursor(cursor))
+    return [delivery.to_dict() for delivery in deliveries], encode_cursor(last_key)
 
 
 def get_delivery(order_id: str) -> Optional[Dict]:
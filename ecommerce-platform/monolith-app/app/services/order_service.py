@@ -6,8 +6,8 @@ import uuid
 from decimal import Decimal
 from typing import Dict, List, Tuple, Any
 from app.models import Order, Product, PackagingRequest
-from app.services.delivery_pricing import calculate_delivery_price
-from app.services import payment_service
+from app.services.delivery_pricing import calculate_delivery_price, verify_delivery_quote
+from app.services import payment_service, product_cache
 
 
 def _normalize_value(value: Any) -> Any:
@@ -52,76 +52,111 @@ def _values_equal(val1: Any, val2: Any) -> bool:
     return normalized_val1 == normalized_val2
 
 
+def _check_product(user_product: Dict, db_product) -> str:
+    """
+    将用户提供的商品与数据库中的商品比较
+    
+    参数:
+        user_product: 用户提供的商品
+        db_product: 数据库中的商品（不存在时为None）
+    
+    返回:
+        不一致的原因，一致时返回None
+    """
+    product_id = user_product.get('productId')
+    if db_product is None:
+        return f"Product '{product_id}' not found"
+    
+    # 验证必需字段
+    required_fields = ['name', 'package', 'price']
+    for field in required_fields:
+        if field not in user_product:
+            return f"Missing '{field}' in product '{product_id}'"
+        
+        # 获取数据库中的值进行比较
+        if field == 'package':
+            db_value = db_product.get_package()
+        else:
+            db_value = getattr(db_product, field)
+        user_value = user_product[field]
+        
+        # 使用智能比较（容忍 Decimal vs int/str 差异）
+        if not _values_equal(user_value, db_value):
+            return (
+                f"Invalid value for '{field}': want '{db_value}', "
+                f"got '{user_value}' in product '{product_id}'"
+            )
+    
+    return None
+
+
 def validate_products(products: List[Dict]) -> Tuple[bool, str, List[Dict]]:
     """
     验证商品信息
     
+    所有商品通过商品缓存一次批量读取，耗时与购物车行数无关。
+    与缓存不一致的商品会绕过缓存重新读取一次再判断，
+    避免因缓存中的旧版本误拒订单。与缓存一致的商品直接通过，
+    因此其他进程修改的商品最多在 PRODUCT_CACHE_TTL_SECONDS 内按旧版本通过校验。
+    
     参数:
         products: 用户提供的商品列表
     
     返回:
         (is_valid, error_message, invalid_products)
     """
-    invalid_products = []
-    reasons = []
+    product_ids = [p.get('productId') for p in products if p.get('productId')]
+    db_products = product_cache.get_products(product_ids)
     
-    for user_product in products:
-        product_id = user_product.get('productId')
-        if not product_id:
-            invalid_products.append(user_product)
-            reasons.append("Missing productId")
-            continue
-        
-        # 从数据库查询商品
-        db_product = Product.get_by_id(product_id)
-        if db_product is None:
-            invalid_products.append(user_product)
-            reasons.append(f"Product '{product_id}' not found")
+    reasons = {}
+    for index, user_product in enumerate(products):
+        if not user_product.get('productId'):
+            reasons[index] = "Missing productId"
             continue
-        
-        # 验证必需字段
-        required_fields = ['name', 'package', 'price']
-        for field in required_fields:
-            if field not in user_product:
-                invalid_products.append(user_product)
-                reasons.append(f"Missing '{field}' in product '{product_id}'")
-                break
-            
-            # 获取数据库中的值进行比较
-            if field == 'package':
-                db_value = db_product.get_package()
-                user_value = user_product[field]
+        reason = _check_product(user_product, db_products.get(user_product['productId']))
+        if reason:
+            reasons[index] = reason
+    
+    # 缓存可能落后于数据库，重新读取不一致的商品
+    stale_ids = [products[index]['productId'] for index in reasons if products[index].get('productId')]
+    if stale_ids:
+        db_products.update(product_cache.get_products(stale_ids, refresh=True))
+        for index in list(reasons):
+            user_product = products[index]
+            if not user_product.get('productId'):
+                continue
+            reason = _check_product(user_product, db_products.get(user_product['productId']))
+            if reason:
+                reasons[index] = reason
             else:
-                db_value = getattr(db_product, field)
-                user_value = user_product[field]
-            
-            # 使用智能比较（容忍 Decimal vs int/str 差异）
-            if not _values_equal(user_value, db_value):
-                invalid_products.append(user_product)
-                reasons.append(
-                    f"Invalid value for '{field}': want '{db_value}', "
-                    f"got '{user_value}' in product '{product_id}'"
-                )
-                break
-    
-    if invalid_products:
-        return False, ". ".join(reasons), invalid_products
+                del reasons[index]
+    
+    if reasons:
+        invalid_products = [products[index] for index in sorted(reasons)]
+        return False, ". ".join(reasons[index] for index in sorted(reasons)), invalid_products
     
     return True, "All products are valid", []
 
 
-def validate_delivery_price(products: List[Dict], address: Dict, claimed_price: int) -> Tuple[bool, str]:
+def validate_delivery_price(products: List[Dict], address: Dict, claimed_price: int,
+                            quote_token: str = None) -> Tuple[bool, str]:
     """
     验证配送价格
     
+    有有效的报价令牌时直接接受价格；没有令牌或令牌无效（如已过期）时重新计算。
+    
     参数:
         products: 商品列表
         address: 配送地址
         claimed_price: 用户声称的配送价格
+        quote_token: 配送价格接口签发的报价令牌（可选）
     
     返回:
         (is_valid, error_message)
     """
+    if quote_token and verify_delivery_quote(quote_token, products, address, claimed_price):
+        return True, "The delivery price is valid"
+    
     actual_price = calculate_delivery_price(products, address)
     
     if actual_price != claimed_price:
@@ -196,6 +231,7 @@ def create_order(user_id: str, order_data: Dict) -> Tuple[bool, str, Dict]:
     products = order_data.get('products', [])
     address = order_data.get('address', {})
     delivery_price = order_data.get('deliveryPrice', 0)
+    quote_token = order_data.get('quoteToken')
     payment_token = order_data.get('paymentToken', '')
     
     # 确保 delivery_price 是整数
@@ -208,7 +244,7 @@ def create_order(user_id: str, order_data: Dict) -> Tuple[bool, str, Dict]:
         return False, message, {'errors': [message], 'products': invalid_products}
     
     # 验证配送价格
-    valid, message = validate_delivery_price(products, address, delivery_price)
+    valid, message = validate_delivery_price(products, address, delivery_price, quote_token)
     if not valid:
         return False, message, {'errors': [message]}
     
@@ -346,7 +382,8 @@ def update_order(order_id: str, order_data: Dict) -> Tuple[bool, str, Dict]:
             delivery_price = int(delivery_price)
         
         # 验证配送价格
-        valid, message = validate_delivery_price(order.get_products(), order.get_address(), delivery_price)
+        valid, message = validate_delivery_price(order.get_products(), order.get_address(), delivery_price,
+                                                 order_data.get('quoteToken'))
         if not valid:
             return False, message, {'errors': [message]}
         
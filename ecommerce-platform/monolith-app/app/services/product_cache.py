@@ -0,0 +1,126 @@
+"""
+商品缓存
+订单校验使用的进程内商品读穿缓存（LRU + TTL）
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from flask import current_app
+from app.models import Product
+
+
+class ProductCache:
+    """
+    按 productId 缓存商品对象
+    
+    条目按 modifiedDate 版本化：只会被同一或更新版本替换，
+    所以并发的读穿不会用旧数据覆盖新数据。
+    其他进程修改商品后，本进程最多在 TTL 内读到旧版本。
+    """
+    
+    def __init__(self, max_size: int, ttl_seconds: float):
+        """初始化缓存"""
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        # productId -> (过期时间, Product)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, product_id: str) -> Optional[Product]:
+        """获取未过期的商品，不存在或已过期时返回None"""
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[product_id]
+                return None
+            self._entries.move_to_end(product_id)
+            return entry[1]
+    
+    def put(self, product: Product):
+        """缓存商品，已缓存更新版本时忽略"""
+        if self.max_size <= 0 or self.ttl_seconds <= 0:
+            return
+        
+        with self._lock:
+            entry = self._entries.get(product.product_id)
+            if entry is not None and (entry[1].modified_date or '') > (product.modified_date or ''):
+                return
+            self._entries[product.product_id] = (time.monotonic() + self.ttl_seconds, product)
+            self._entries.move_to_end(product.product_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, product_id: str):
+        """移除商品"""
+        with self._lock:
+            self._entries.pop(product_id, None)
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache() -> ProductCache:
+    """按应用配置创建缓存（首次使用时）"""
+    global _cache
+    
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ProductCache(current_app.config['PRODUCT_CACHE_SIZE'],
+                                      current_app.config['PRODUCT_CACHE_TTL_SECONDS'])
+    return _cache
+
+
+def invalidate(product_id: str):
+    """
+    商品写入后移除本进程缓存中的旧版本
+    
+    其他进程的缓存不受影响，最多在 PRODUCT_CACHE_TTL_SECONDS 内仍返回旧版本。
+    """
+    if _cache is not None:
+        _cache.invalidate(product_id)
+
+
+def get_products(product_ids: List[str], refresh: bool = False) -> Dict[str, Product]:
+    """
+    批量获取商品，未命中的一次性从数据库批量读取
+    
+    参数:
+        product_ids: 商品ID列表
+        refresh: 是否跳过缓存，直接读取数据库（并更新缓存）
+    
+    返回:
+        {productId: Product}，不存在的商品不在其中
+    """
+    cache = _get_cache()
+    products = {}
+    missing = []
+    
+    for product_id in dict.fromkeys(product_ids):
+        product = None if refresh else cache.get(product_id)
+        if product is None:
+            missing.append(product_id)
+        else:
+            products[product_id] = product
+    
+    if missing:
+        loaded = Product.get_many(missing)
+        for product_id, product in loaded.items():
+            cache.put(product)
+            products[product_id] = product
+        # 已删除的商品不再命中
+        for product_id in missing:
+            if product_id not in loaded:
+                cache.invalidate(product_id)
+    
+    return products
+
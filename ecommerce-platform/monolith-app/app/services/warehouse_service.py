@@ -2,22 +2,27 @@
 仓库服务
 处理包装请求和库存管理
 """
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from app.models import PackagingRequest, Delivery, Order
+from app.utils.pagination import encode_cursor, decode_cursor
 
 
-def get_new_packaging_requests(limit: int = 50) -> List[str]:
+def get_new_packaging_requests(limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
     """
-    获取新的包装请求ID列表
+    获取新的包装请求ID列表（按创建时间排序）
     
     参数:
         limit: 返回数量限制
+        cursor: 上一页返回的游标
     
     返回:
-        订单ID列表
+        (订单ID列表, 下一页游标或None)
+    
+    异常:
+        ValueError: 游标无效
     """
-    requests = PackagingRequest.get_new_requests(limit=limit)
-    return [req.order_id for req in requests]
+    requests, last_key = PackagingRequest.get_new_requests(limit=limit, exclusive_start_key=decode_cursor(cursor))
+    return [req.order_id for req in requests], encode_cursor(last_key)
 
 
 def get_packaging_request(order_id: str) -> Optional[Dict]:
@@ -0,0 +1,47 @@
+"""
+分页工具
+将 DynamoDB 的 LastEvaluatedKey 编码为客户端可回传的不透明游标
+"""
+import base64
+import json
+
+
+def encode_cursor(last_evaluated_key):
+    """
+    编码分页游标
+    
+    参数:
+        last_evaluated_key: 查询返回的 LastEvaluatedKey（可为None）
+    
+    返回:
+        游标字符串，没有更多数据时为None
+    """
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, separators=(',', ':'), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解码分页游标
+    
+    参数:
+        cursor: encode_cursor() 返回的游标（可为None）
+    
+    返回:
+        可作为 ExclusiveStartKey 的字典，没有游标时为None
+    
+    异常:
+        ValueError: 游标格式无效
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, dict) or not all(isinstance(value, str) for value in key.values()):
+        raise ValueError("Invalid cursor")
+    return key
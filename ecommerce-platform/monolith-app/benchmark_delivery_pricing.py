@@ -0,0 +1,146 @@
+"""
+配送定价基准测试
+对比逐件展开计算与按数量加权计算的耗时，
+以及各定价引擎在常见购物车上每秒可计算的价格数
+
+用法:
+    python benchmark_delivery_pricing.py [--lines 1,40,1000] [--quantity 1,100,100000] [--repeat 5] [--carts 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+# 将当前目录加入 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import delivery_pricing
+from app.services.delivery_pricing import (
+    ENGINES, calculate_delivery_price, cart_signature, count_boxes, get_shipping_cost
+)
+
+# 常见商品包装尺寸范围（毫米、克）：(宽, 长, 高, 重量) 的上下限
+PRODUCT_KINDS = [
+    ((50, 150), (50, 200), (10, 60), (50, 800)),        # 小件电子产品、配件
+    ((130, 240), (180, 300), (15, 60), (200, 1500)),    # 图书
+    ((200, 350), (250, 400), (30, 120), (150, 1200)),   # 服装
+    ((200, 450), (250, 500), (150, 450), (2000, 11000))  # 小家电
+]
+
+
+def expanded_delivery_price(products, address):
+    """原实现：按数量逐件展开包装后计算"""
+    packages = []
+    for product in products:
+        quantity = product.get('quantity', 1)
+        if isinstance(quantity, (Decimal, str)):
+            quantity = int(quantity)
+        for _ in range(quantity):
+            packages.append(product.get('package', {}))
+    return count_boxes(packages) * get_shipping_cost(address)
+
+
+def make_cart(lines, quantity):
+    """生成购物车，尺寸为 DynamoDB 返回的 Decimal"""
+    rng = random.Random(lines)
+    return [{
+        'productId': f"p{index}",
+        'package': {
+            'width': Decimal(rng.randint(10, 600)),
+            'length': Decimal(rng.randint(10, 600)),
+            'height': Decimal(rng.randint(10, 600)),
+            'weight': Decimal(rng.randint(100, 15000))
+        },
+        'quantity': quantity
+    } for index in range(lines)]
+
+
+def make_realistic_carts(count, seed=0):
+    """生成常见购物车：1-8行，多数商品数量为1"""
+    rng = random.Random(seed)
+    catalog = []
+    for _ in range(200):
+        kind = rng.choice(PRODUCT_KINDS)
+        catalog.append({field: Decimal(rng.randint(*bounds))
+                        for field, bounds in zip(('width', 'length', 'height', 'weight'), kind)})
+    return [[{'package': rng.choice(catalog), 'quantity': rng.choice([1, 1, 1, 2, 3])}
+             for _ in range(rng.randint(1, 8))] for _ in range(count)]
+
+
+def measure_engines(carts, address):
+    """各引擎的吞吐量：每个购物车首次计算（未命中缓存）和重复报价（命中缓存）"""
+    print("\n" + "=" * 60)
+    print(f"Pricing engines, {len(carts)} realistic carts")
+    print("=" * 60)
+    print(f"{'engine':>12} {'cold prices/s':>14} {'warm prices/s':>14} {'boxes':>8}")
+    
+    for name in ENGINES:
+        delivery_pricing._cached_boxes.cache_clear()
+        start = time.perf_counter()
+        boxes = sum(calculate_delivery_price(cart, address, engine=name) for cart in carts) \
+            // get_shipping_cost(address)
+        cold = len(carts) / (time.perf_counter() - start)
+        
+        start = time.perf_counter()
+        for cart in carts:
+            calculate_delivery_price(cart, address, engine=name)
+        warm = len(carts) / (time.perf_counter() - start)
+        print(f"{name:>12} {cold:14.0f} {warm:14.0f} {boxes:8d}")
+    
+    # 装箱估算不会少于体积/重量下限
+    for cart in carts:
+        signature = cart_signature(cart)
+        assert ENGINES['bin_packing'].count_boxes(signature) >= ENGINES['volume'].count_boxes(signature)
+
+
+def measure(function, products, address, repeat):
+    """多次运行取最短耗时（毫秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        price = function(products, address)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, price
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark delivery price calculation')
+    parser.add_argument('--lines', default='1,40,1000', help='Comma-separated cart line counts (default: 1,40,1000)')
+    parser.add_argument('--quantity', default='1,100,100000',
+                        help='Comma-separated quantities per line (default: 1,100,100000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (default: 5)')
+    parser.add_argument('--max-units', type=int, default=10 ** 7,
+                        help='Skip the expanded calculation above this many units (default: 10000000)')
+    parser.add_argument('--carts', type=int, default=2000,
+                        help='Realistic carts for the engine comparison (default: 2000)')
+    args = parser.parse_args()
+    
+    address = {'country': 'US'}
+    
+    print("=" * 60)
+    print(f"Delivery pricing, best of {args.repeat} runs")
+    print("=" * 60)
+    print(f"{'lines':>6} {'quantity':>9} {'expanded ms':>12} {'weighted ms':>12} {'price':>14}")
+    
+    for lines in (int(value) for value in args.lines.split(',')):
+        for quantity in (int(value) for value in args.quantity.split(',')):
+            products = make_cart(lines, quantity)
+            weighted, price = measure(calculate_delivery_price, products, address, args.repeat)
+            
+            if lines * quantity <= args.max_units:
+                expanded, expected = measure(expanded_delivery_price, products, address, args.repeat)
+                assert expected == price, f"Weighted price {price} != expanded price {expected}"
+                expanded = f"{expanded:12.3f}"
+            else:
+                expanded = f"{'skipped':>12}"
+            
+            print(f"{lines:>6} {quantity:>9} {expanded} {weighted:12.3f} {price:>14}")
+    
+    measure_engines(make_realistic_carts(args.carts), address)
+
+
+if __name__ == '__main__':
+    main()
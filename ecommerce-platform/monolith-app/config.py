@@ -6,11 +6,15 @@ import os
 from datetime import timedelta
 
 
+# 公开的默认密钥，只能用于本地开发
+DEFAULT_SECRET_KEY = 'dev-secret-key-change-in-production'
+
+
 class Config:
     """应用配置基类"""
     
     # Flask配置
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+    SECRET_KEY = os.environ.get('SECRET_KEY') or DEFAULT_SECRET_KEY
     
     # AWS配置
     AWS_REGION = os.environ.get('AWS_REGION') or 'us-east-1'
@@ -31,6 +35,18 @@ class Config:
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
     
+    # 商品缓存（订单校验使用，见 app/services/product_cache.py）
+    # 本进程写入商品时立即失效；其他进程修改的价格最多在 TTL 内仍按旧价格通过订单校验
+    PRODUCT_CACHE_SIZE = int(os.environ.get('PRODUCT_CACHE_SIZE') or 10000)
+    PRODUCT_CACHE_TTL_SECONDS = float(os.environ.get('PRODUCT_CACHE_TTL_SECONDS') or 60)
+    
+    # 配送定价引擎：volume（按总体积和总重量，默认）或 bin_packing（三维装箱）
+    DELIVERY_PRICING_ENGINE = os.environ.get('DELIVERY_PRICING_ENGINE') or 'volume'
+    # 配送报价令牌有效期（秒）
+    DELIVERY_QUOTE_TTL_SECONDS = int(os.environ.get('DELIVERY_QUOTE_TTL_SECONDS') or 900)
+    # 配送报价令牌签名密钥；未设置（或为默认密钥）时不签发也不接受令牌，下单时重新计算价格
+    DELIVERY_QUOTE_SECRET = os.environ.get('DELIVERY_QUOTE_SECRET')
+    
     # 应用配置
     DEBUG = False
     TESTING = False
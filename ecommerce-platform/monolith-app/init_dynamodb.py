@@ -11,6 +11,36 @@ from werkzeug.security import generate_password_hash
 from config import config
 
 
+# 稀疏GSI：只有 NEW 状态的项带 isNew（值固定为 'true'），
+# 按日期排序列出待处理项，开销与待处理数量成正比
+NEW_DELIVERIES_INDEX = {
+    'IndexName': 'new-deliveries-index',
+    'KeySchema': [
+        {'AttributeName': 'isNew', 'KeyType': 'HASH'},
+        {'AttributeName': 'createdDate', 'KeyType': 'RANGE'}
+    ],
+    'Projection': {'ProjectionType': 'ALL'},
+    'ProvisionedThroughput': {
+        'ReadCapacityUnits': 5,
+        'WriteCapacityUnits': 5
+    }
+}
+
+# 只有 NEW 包装请求的元数据项带 isNew（商品项不带），按 newDate 排序
+NEW_REQUESTS_INDEX = {
+    'IndexName': 'new-requests-index',
+    'KeySchema': [
+        {'AttributeName': 'isNew', 'KeyType': 'HASH'},
+        {'AttributeName': 'newDate', 'KeyType': 'RANGE'}
+    ],
+    'Projection': {'ProjectionType': 'ALL'},
+    'ProvisionedThroughput': {
+        'ReadCapacityUnits': 5,
+        'WriteCapacityUnits': 5
+    }
+}
+
+
 def get_dynamodb_client():
     """获取DynamoDB客户端"""
     conf = config['default']
@@ -203,7 +233,8 @@ def create_delivery_table(client, table_name):
             ],
             AttributeDefinitions=[
                 {'AttributeName': 'orderId', 'AttributeType': 'S'},
-                {'AttributeName': 'isNew', 'AttributeType': 'S'}
+                {'AttributeName': 'isNew', 'AttributeType': 'S'},
+                {'AttributeName': 'createdDate', 'AttributeType': 'S'}
             ],
             GlobalSecondaryIndexes=[
                 {
@@ -217,7 +248,8 @@ def create_delivery_table(client, table_name):
                         'ReadCapacityUnits': 5,
                         'WriteCapacityUnits': 5
                     }
-                }
+                },
+                NEW_DELIVERIES_INDEX
             ],
             BillingMode='PROVISIONED',
             ProvisionedThroughput={
@@ -244,7 +276,8 @@ def create_warehouse_table(client, table_name):
             AttributeDefinitions=[
                 {'AttributeName': 'orderId', 'AttributeType': 'S'},
                 {'AttributeName': 'productId', 'AttributeType': 'S'},
-                {'AttributeName': 'newDate', 'AttributeType': 'S'}
+                {'AttributeName': 'newDate', 'AttributeType': 'S'},
+                {'AttributeName': 'isNew', 'AttributeType': 'S'}
             ],
             GlobalSecondaryIndexes=[
                 {
@@ -270,7 +303,8 @@ def create_warehouse_table(client, table_name):
                         'ReadCapacityUnits': 5,
                         'WriteCapacityUnits': 5
                     }
-                }
+                },
+                NEW_REQUESTS_INDEX
             ],
             BillingMode='PROVISIONED',
             ProvisionedThroughput={
@@ -309,6 +343,80 @@ def create_payment_3p_table(client, table_name):
         return False  # 表已存在，不需要等待
 
 
+def ensure_index(client, table_name, index, attribute_definitions):
+    """
+    为已存在的表添加缺少的GSI
+    
+    返回:
+        是否新建了索引（需要等待回填完成）
+    """
+    table = client.describe_table(TableName=table_name)['Table']
+    existing = [gsi['IndexName'] for gsi in table.get('GlobalSecondaryIndexes', [])]
+    if index['IndexName'] in existing:
+        return False
+    
+    client.update_table(
+        TableName=table_name,
+        AttributeDefinitions=attribute_definitions,
+        GlobalSecondaryIndexUpdates=[{'Create': index}]
+    )
+    print(f"✓ Adding index {index['IndexName']} to table: {table_name}")
+    return True
+
+
+def wait_for_index_active(client, table_name, index_name, max_wait_seconds=600):
+    """等待GSI回填完成，状态变为ACTIVE"""
+    print(f"  Waiting for index {index_name} to become ACTIVE...", end='', flush=True)
+    start_time = time.time()
+    
+    while time.time() - start_time < max_wait_seconds:
+        table = client.describe_table(TableName=table_name)['Table']
+        statuses = [gsi['IndexStatus'] for gsi in table.get('GlobalSecondaryIndexes', [])
+                    if gsi['IndexName'] == index_name]
+        if statuses == ['ACTIVE']:
+            print(" ✓")
+            return True
+        
+        time.sleep(5)
+        print('.', end='', flush=True)
+    
+    print(" ✗ Timeout")
+    return False
+
+
+def backfill_new_packaging_requests(client, table_name):
+    """
+    为旧版本写入的 NEW 包装请求元数据项补上 isNew，使其进入新请求索引
+    
+    之后的写入由 PackagingRequest 维护。只处理缺少 isNew 的项且使用条件更新，
+    可以安全地重复运行。
+    """
+    paginator = client.get_paginator('scan')
+    count = 0
+    for page in paginator.paginate(
+        TableName=table_name,
+        FilterExpression='productId = :metadata AND #status = :new AND attribute_not_exists(isNew)',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={':metadata': {'S': '__metadata'}, ':new': {'S': 'NEW'}},
+        ProjectionExpression='orderId, productId'
+    ):
+        for item in page.get('Items', []):
+            try:
+                client.update_item(
+                    TableName=table_name,
+                    Key={'orderId': item['orderId'], 'productId': item['productId']},
+                    UpdateExpression='SET isNew = :true',
+                    ConditionExpression='#status = :new AND attribute_exists(newDate)',
+                    ExpressionAttributeNames={'#status': 'status'},
+                    ExpressionAttributeValues={':true': {'S': 'true'}, ':new': {'S': 'NEW'}}
+                )
+                count += 1
+            except client.exceptions.ConditionalCheckFailedException:
+                # 扫描后状态已变更，不再是新请求
+                pass
+    print(f"  Backfilled {count} NEW packaging request(s)")
+
+
 def insert_sample_data():
     """插入示例数据"""
     conf = config['default']
@@ -448,6 +556,26 @@ def init_database(with_sample_data=False):
         for table_name in tables_to_wait:
             wait_for_table_active(client, table_name)
     
+    # 为旧版本创建的表添加待处理项索引
+    indexes = [
+        (conf.TABLE_DELIVERY_NAME, NEW_DELIVERIES_INDEX, [
+            {'AttributeName': 'isNew', 'AttributeType': 'S'},
+            {'AttributeName': 'createdDate', 'AttributeType': 'S'}
+        ]),
+        (conf.TABLE_WAREHOUSE_NAME, NEW_REQUESTS_INDEX, [
+            {'AttributeName': 'isNew', 'AttributeType': 'S'},
+            {'AttributeName': 'newDate', 'AttributeType': 'S'}
+        ]),
+    ]
+    for table_name, index, attribute_definitions in indexes:
+        if table_name in tables_to_wait:
+            continue
+        if ensure_index(client, table_name, index, attribute_definitions):
+            wait_for_index_active(client, table_name, index['IndexName'])
+        # 每次都回填：上次运行可能在等待索引或回填途中中断，而回填是幂等的
+        if table_name == conf.TABLE_WAREHOUSE_NAME:
+            backfill_new_packaging_requests(client, table_name)
+    
     print("\n✓ Database tables created successfully")
     
     if with_sample_data:
@@ -0,0 +1,202 @@
+"""
+配送定价测试
+用随机购物车对比加权计算与逐件展开计算的结果
+
+运行:
+    pytest test_delivery_pricing.py
+"""
+import math
+import random
+from decimal import Decimal
+
+import pytest
+from flask import Flask
+
+from config import DEFAULT_SECRET_KEY
+from app.services.delivery_pricing import (
+    BOX_VOLUME, BOX_WEIGHT, ENGINES, BinPackingEngine, calculate_delivery_price, cart_signature,
+    count_boxes, get_shipping_cost, quote_delivery_price, verify_delivery_quote
+)
+
+COUNTRIES = ['DK', 'DE', 'US', 'JP', '']
+
+
+def expanded_delivery_price(products, address):
+    """原实现：按数量逐件展开包装后计算"""
+    packages = []
+    for product in products:
+        quantity = product.get('quantity', 1)
+        if isinstance(quantity, (Decimal, str)):
+            quantity = int(quantity)
+        for _ in range(quantity):
+            packages.append(product.get('package', {}))
+    return count_boxes(packages) * get_shipping_cost(address)
+
+
+def random_value(rng, high):
+    """随机尺寸，混合 DynamoDB 和 JSON 中出现的类型"""
+    value = rng.randint(0, high)
+    return rng.choice([value, Decimal(value), str(value)])
+
+
+def random_cart(rng, lines):
+    """随机购物车，尺寸覆盖小件到整箱"""
+    products = []
+    for _ in range(lines):
+        package = {
+            'width': random_value(rng, 600),
+            'length': random_value(rng, 600),
+            'height': random_value(rng, 600),
+            'weight': random_value(rng, 15000)
+        }
+        # 偶尔缺少字段
+        if rng.random() < 0.1:
+            del package[rng.choice(list(package))]
+        product = {'productId': f"p{rng.randint(0, 10 ** 6)}", 'package': package}
+        if rng.random() < 0.9:
+            product['quantity'] = random_value(rng, 20) if rng.random() < 0.8 else rng.randint(-2, 0)
+        products.append(product)
+    return products
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_matches_expanded_calculation(seed):
+    """随机购物车的价格与逐件展开一致"""
+    rng = random.Random(seed)
+    products = random_cart(rng, rng.randint(0, 12))
+    address = {'country': rng.choice(COUNTRIES)}
+    
+    assert calculate_delivery_price(products, address) == expanded_delivery_price(products, address)
+
+
+def test_box_boundaries():
+    """恰好装满一箱时不多算一箱"""
+    cube = {'width': 500, 'length': 500, 'height': 500, 'weight': 0}
+    heavy = {'width': 0, 'length': 0, 'height': 0, 'weight': BOX_WEIGHT}
+    address = {'country': 'US'}
+    
+    assert calculate_delivery_price([{'package': cube, 'quantity': 3}], address) == 3 * 1500
+    assert calculate_delivery_price([{'package': heavy, 'quantity': 2}], address) == 2 * 1500
+    assert calculate_delivery_price([{'package': {'weight': 1}, 'quantity': 1}], address) == 1500
+    assert calculate_delivery_price([], address) == 0
+
+
+def test_large_quantity_does_not_expand():
+    """B2B 大数量订单按数量加权，不逐件展开"""
+    package = {'width': 100, 'length': 100, 'height': 100, 'weight': 1000}
+    products = [{'package': package, 'quantity': 10 ** 12}]
+    
+    boxes = max(math.ceil(10 ** 18 / BOX_VOLUME), math.ceil(10 ** 15 / BOX_WEIGHT))
+    assert calculate_delivery_price(products, {'country': 'DE'}) == boxes * 1000
+
+
+def test_invalid_quantity_is_rejected():
+    """非整数数量与原实现一样报错"""
+    with pytest.raises(TypeError):
+        calculate_delivery_price([{'package': {}, 'quantity': 1.5}], {'country': 'US'})
+
+
+def test_bin_packing_counts_items_that_cannot_share_a_box():
+    """两个 30cm 立方体总体积不到一箱，但放不进同一个 50cm 箱子"""
+    products = [{'package': {'width': 300, 'length': 300, 'height': 300, 'weight': 1000}, 'quantity': 2}]
+    address = {'country': 'US'}
+    
+    assert calculate_delivery_price(products, address, engine='volume') == 1500
+    assert calculate_delivery_price(products, address, engine='bin_packing') == 2 * 1500
+
+
+def test_bin_packing_fills_boxes():
+    """8个 25cm 立方体正好装满一箱，第9个需要新箱子"""
+    package = {'width': 250, 'length': 250, 'height': 250, 'weight': 100}
+    address = {'country': 'US'}
+    
+    assert calculate_delivery_price([{'package': package, 'quantity': 8}], address, engine='bin_packing') == 1500
+    assert calculate_delivery_price([{'package': package, 'quantity': 9}], address, engine='bin_packing') == 3000
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_bin_packing_is_never_below_volume_and_weight_bound(seed):
+    """装箱结果不少于体积/重量下限"""
+    rng = random.Random(seed)
+    signature = cart_signature(random_cart(rng, rng.randint(0, 8)))
+    
+    assert ENGINES['bin_packing'].count_boxes(signature) >= ENGINES['volume'].count_boxes(signature)
+
+
+def test_bin_packing_falls_back_above_unit_cap():
+    """超过件数上限时按体积/重量公式估算"""
+    signature = ((300, 300, 300, 1000, BinPackingEngine.MAX_UNITS + 1),)
+    
+    assert ENGINES['bin_packing'].count_boxes(signature) == ENGINES['volume'].count_boxes(signature)
+
+
+def test_unknown_engine_is_rejected():
+    """未知引擎名称报错"""
+    with pytest.raises(ValueError):
+        calculate_delivery_price([], {'country': 'US'}, engine='unknown')
+
+
+@pytest.fixture
+def app_context():
+    """报价令牌需要应用配置中的密钥和有效期"""
+    app = Flask(__name__)
+    app.config.update(DELIVERY_QUOTE_SECRET='test-quote-secret', DELIVERY_QUOTE_TTL_SECONDS=900)
+    with app.app_context():
+        yield app
+
+
+def test_quote_token_verifies_for_same_cart(app_context):
+    """同一购物车（顺序和数值类型不同）的报价令牌有效"""
+    products = [
+        {'package': {'width': 400, 'length': 300, 'height': 50, 'weight': 2000}, 'quantity': 1},
+        {'package': {'width': 100, 'length': 100, 'height': 100, 'weight': 500}, 'quantity': 2}
+    ]
+    address = {'country': 'US'}
+    quote = quote_delivery_price(products, address)
+    
+    reordered = [
+        {'package': {'width': '100', 'length': Decimal(100), 'height': 100, 'weight': 500}, 'quantity': '2'},
+        products[0]
+    ]
+    assert quote['pricing'] == calculate_delivery_price(products, address)
+    assert verify_delivery_quote(quote['quoteToken'], reordered, address, quote['pricing'])
+
+
+def test_quote_token_rejects_changes(app_context):
+    """价格、购物车、国家或签名被修改时令牌无效"""
+    products = [{'package': {'width': 400, 'length': 300, 'height': 50, 'weight': 2000}, 'quantity': 1}]
+    address = {'country': 'US'}
+    quote = quote_delivery_price(products, address)
+    token, price = quote['quoteToken'], quote['pricing']
+    
+    assert not verify_delivery_quote(token, products, address, price - 1)
+    assert not verify_delivery_quote(token, [{**products[0], 'quantity': 2}], address, price)
+    assert not verify_delivery_quote(token, products, {'country': 'DK'}, price)
+    tampered = token[:-1] + ('1' if token.endswith('0') else '0')
+    assert not verify_delivery_quote(tampered, products, address, price)
+    assert not verify_delivery_quote('garbage', products, address, price)
+    assert not verify_delivery_quote(None, products, address, price)
+
+
+def test_quote_token_expires(app_context):
+    """过期的令牌无效"""
+    app_context.config['DELIVERY_QUOTE_TTL_SECONDS'] = -1
+    products = [{'package': {'width': 400, 'length': 300, 'height': 50, 'weight': 2000}, 'quantity': 1}]
+    quote = quote_delivery_price(products, {'country': 'US'})
+    
+    assert not verify_delivery_quote(quote['quoteToken'], products, {'country': 'US'}, quote['pricing'])
+
+
+@pytest.mark.parametrize('secret', [None, '', DEFAULT_SECRET_KEY])
+def test_quote_token_requires_dedicated_secret(app_context, secret):
+    """未配置专用密钥或使用默认密钥时不签发也不接受令牌"""
+    products = [{'package': {'width': 400, 'length': 300, 'height': 50, 'weight': 2000}, 'quantity': 1}]
+    address = {'country': 'US'}
+    issued = quote_delivery_price(products, address)
+    
+    app_context.config['DELIVERY_QUOTE_SECRET'] = secret
+    quote = quote_delivery_price(products, address)
+    
+    assert quote['pricing'] == issued['pricing']
+    assert quote['quoteToken'] is None and quote['quoteExpiresAt'] is None
+    assert not verify_delivery_quote(issued['quoteToken'], products, address, issued['pricing'])